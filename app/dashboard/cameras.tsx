@@ -1,13 +1,18 @@
 
 "use client"
 
-import { useState } from "react"
+import { useEffect, useState } from "react"
 import { Expand, Download } from "lucide-react"
 
+// Backend running the live pipeline (TwillioWhatsappBotFinal.py)
+const API_URL = "http://localhost:8000"
+const LIVE_POLL_MS = 10000
+
 type Camera = {
   id: string
   location: string
   info: string
+  live?: boolean
 }
 
 const sampleCameras: Camera[] = [
@@ -19,8 +24,63 @@ const sampleCameras: Camera[] = [
   { id: "CAM006", location: "Back Gate", info: "Rear exit" },
 ]
 
+// Live JPEG frames over a WebSocket; unlike MJPEG <img> streams these don't count
+// against the browser's ~6 connections per host, so a full grid of cameras can play
+function LivePreview({ camera, className }: { camera: string; className: string }) {
+  const [src, setSrc] = useState<string | null>(null)
+
+  useEffect(() => {
+    let url: string | null = null
+    const ws = new WebSocket(`${API_URL.replace(/^http/, "ws")}/cameras/${encodeURIComponent(camera)}/preview`)
+    ws.binaryType = "blob"
+    ws.onmessage = (event) => {
+      const next = URL.createObjectURL(event.data as Blob)
+      setSrc(next)
+      if (url) URL.revokeObjectURL(url)
+      url = next
+    }
+    ws.onclose = () => setSrc(null)
+    return () => {
+      ws.close()
+      if (url) URL.revokeObjectURL(url)
+    }
+  }, [camera])
+
+  return src ? (
+    <img src={src} alt={`Live view of ${camera}`} className={`${className} object-contain bg-black`} />
+  ) : (
+    <div className={`${className} flex items-center justify-center`}>Connecting...</div>
+  )
+}
+
 export default function Cameras() {
   const [expandedCamera, setExpandedCamera] = useState<Camera | null>(null)
+  const [liveCameras, setLiveCameras] = useState<Camera[]>([])
+
+  useEffect(() => {
+    const load = async () => {
+      try {
+        const res = await fetch(`${API_URL}/cameras/live`)
+        if (!res.ok) return
+        const data = await res.json()
+        setLiveCameras(
+          data.cameras.map((cam: { name: string; viewers: number }) => ({
+            id: cam.name,
+            location: "Live feed",
+            info: `${cam.viewers} viewer${cam.viewers === 1 ? "" : "s"}`,
+            live: true,
+          }))
+        )
+      } catch {
+        setLiveCameras([]) // Backend not running; show the placeholders
+      }
+    }
+    load()
+    const timer = setInterval(load, LIVE_POLL_MS)
+    return () => clearInterval(timer)
+  }, [])
+
+  const cameras = liveCameras.length ? liveCameras : sampleCameras
 
   return (
     <div className="space-y-6">
@@ -31,14 +91,14 @@ export default function Cameras() {
 
       {/* Cameras Grid */}
       <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
-        {sampleCameras.map((cam) => (
+        {cameras.map((cam) => (
           <div
             key={cam.id}
             className="bg-white shadow-md border border-blue-100 rounded-lg p-4 flex flex-col"
           >
-            {/* Video Placeholder */}
-            <div className="relative w-full h-48 bg-gray-200 rounded flex items-center justify-center text-gray-500 mb-4">
-              Video Placeholder
+            {/* Live Preview */}
+            <div className="relative w-full h-48 bg-gray-200 rounded flex items-center justify-center text-gray-500 mb-4 overflow-hidden">
+              {cam.live && !expandedCamera ? <LivePreview camera={cam.id} className="w-full h-full" /> : "Video Placeholder"}
               <div className="absolute top-2 right-2 flex gap-2">
                 <button
                   onClick={() => setExpandedCamera(cam)}
@@ -78,9 +138,13 @@ export default function Cameras() {
               Camera ID: {expandedCamera.id} – {expandedCamera.location}
             </h2>
 
-            {/* Big Video Placeholder */}
-            <div className="w-full h-[70%] bg-gray-300 rounded flex items-center justify-center text-gray-600">
-              Expanded Video Placeholder
+            {/* Big Live Preview */}
+            <div className="w-full h-[70%] bg-gray-300 rounded flex items-center justify-center text-gray-600 overflow-hidden">
+              {expandedCamera.live ? (
+                <LivePreview camera={expandedCamera.id} className="w-full h-full" />
+              ) : (
+                "Expanded Video Placeholder"
+              )}
             </div>
 
             <p className="mt-4 text-gray-700">{expandedCamera.info}</p>
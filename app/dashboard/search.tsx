@@ -3,12 +3,72 @@
 import { useState } from "react"
 import { Search } from "lucide-react"
 
+const API_URL = "http://127.0.0.1:8000"
+
+type Sprite = {
+  url: string
+  columns: number
+  rows: number
+  tile_width: number
+  tile_height: number
+  count: number
+  timestamps: string[]
+}
+
 type SearchResult = {
   video: string
   absolute_start_time: string
   absolute_end_time: string
   document: string
   clip_path: string
+  thumbnail_url: string | null
+  sprite: Sprite | null
+}
+
+// Shows the thumbnail; hovering scrubs through the segment's sprite sheet
+function SegmentPreview({ thumbnail, sprite }: { thumbnail: string | null; sprite: Sprite | null }) {
+  const [tile, setTile] = useState<number | null>(null)
+
+  if (!thumbnail && !sprite) return null
+
+  const handleMove = (e: React.MouseEvent<HTMLDivElement>) => {
+    if (!sprite) return
+    const rect = e.currentTarget.getBoundingClientRect()
+    const position = (e.clientX - rect.left) / rect.width
+    setTile(Math.min(sprite.count - 1, Math.max(0, Math.floor(position * sprite.count))))
+  }
+
+  const column = sprite && tile !== null ? tile % sprite.columns : 0
+  const row = sprite && tile !== null ? Math.floor(tile / sprite.columns) : 0
+
+  return (
+    <div
+      className="relative w-full max-w-sm rounded-lg overflow-hidden bg-gray-200"
+      style={{ aspectRatio: sprite ? `${sprite.tile_width} / ${sprite.tile_height}` : "16 / 9" }}
+      onMouseMove={handleMove}
+      onMouseLeave={() => setTile(null)}
+    >
+      {sprite && tile !== null ? (
+        <div
+          className="absolute inset-0"
+          style={{
+            backgroundImage: `url(${API_URL}${sprite.url})`,
+            backgroundSize: `${sprite.columns * 100}% ${sprite.rows * 100}%`,
+            backgroundPosition: `${sprite.columns > 1 ? (column / (sprite.columns - 1)) * 100 : 0}% ${
+              sprite.rows > 1 ? (row / (sprite.rows - 1)) * 100 : 0
+            }%`,
+          }}
+        />
+      ) : (
+        thumbnail && <img src={`${API_URL}${thumbnail}`} alt="" loading="lazy" className="w-full h-full object-cover" />
+      )}
+      {sprite && tile !== null && (
+        <span className="absolute bottom-1 right-1 bg-black/60 text-white text-xs px-1 rounded">
+          {sprite.timestamps[tile]}
+        </span>
+      )}
+    </div>
+  )
 }
 
 export default function SearchPage() {
@@ -27,7 +87,7 @@ export default function SearchPage() {
     setResults([])
 
     try {
-      const res = await fetch(`http://127.0.0.1:8000/search?query=${encodeURIComponent(searchQuery)}`)
+      const res = await fetch(`${API_URL}/search?query=${encodeURIComponent(searchQuery)}`)
       if (!res.ok) throw new Error("Failed to fetch search results")
       const data = await res.json()
       setResults(data.results || [])
@@ -77,8 +137,14 @@ export default function SearchPage() {
                 <p><strong>Start:</strong> {res.absolute_start_time}</p>
                 <p><strong>End:</strong> {res.absolute_end_time}</p>
                 <p className="text-gray-700">{res.document}</p>
+                <div className="mt-2">
+                  <SegmentPreview thumbnail={res.thumbnail_url} sprite={res.sprite} />
+                </div>
+                {/* The clip is only cut when it is played */}
                 <video
-                  src={`http://127.0.0.1:8000${res.clip_path}`}
+                  src={`${API_URL}${res.clip_path}`}
+                  poster={res.thumbnail_url ? `${API_URL}${res.thumbnail_url}` : undefined}
+                  preload="none"
                   controls
                   className="w-full mt-2 rounded-lg"
                 />
@@ -1,24 +1,24 @@
+import os
 import numpy as np
 import joblib
 import tensorflow as tf
 from tensorflow.keras.applications import ResNet50
-from tensorflow.keras.preprocessing import image
 from tensorflow.keras import mixed_precision
-from datetime import datetime
+from metrics import stage_timer
+from scoring_head import SklearnHead, load_head
+from tracing import span
 
 mixed_precision.set_global_policy('mixed_float16')
 
-
-class FrameData:
-    def __init__(self, frame: np.ndarray, timestamp: datetime):
-        self.frame = frame
-        self.timestamp = timestamp
-
 print(" Loading anomaly detection models (ResNet50 + SVM)...")
 try:
     feature_extractor = ResNet50(weights='imagenet', include_top=False, pooling='avg', input_shape=(224, 224, 3))
     svm_path = "./weights/svm_model.pkl"
     svm_model = joblib.load(svm_path)
+    # An exported NumPy head (see scoring_head.py) replaces the pickle's decision_function when present
+    scoring_head_path = os.getenv("SCORING_HEAD_PATH", "./weights/scoring_head.npz")
+    scoring_head = load_head(scoring_head_path) if os.path.exists(scoring_head_path) else SklearnHead(svm_model)
+    print(f" Scoring head: {scoring_head.kind}")
     print("Warming up GPU...")
     dummy_input = np.zeros((1, 224, 224, 3), dtype=np.float16)
     feature_extractor.predict(dummy_input, verbose=0)
@@ -26,36 +26,58 @@ try:
 
 except Exception as e:
     print(f"Critical error loading models: {e}")
-    # Exit if models can't be loaded, as the script is useless without them.
-    exit()
+    # Raised rather than exit(), so importers (e.g. anomaly_scan's worker processes) can report it
+    raise RuntimeError(f"Anomaly detection models could not be loaded: {e}") from e
+
+PREPROCESS_SECONDS = stage_timer("preprocess")
+RESNET_SECONDS = stage_timer("resnet")
+SVM_SECONDS = stage_timer("svm")
 
 
-def process_batch(frame_batch: list[FrameData]) -> bool:
+def extract_features(frames: np.ndarray, trace_id=None) -> np.ndarray:
+    """(batch, 2048) ResNet50 features of (batch, 224, 224, 3) uint8 frames, as the scoring head sees them"""
+    # --- 2. PREPROCESSING ---
+    # One vectorized pass over the whole batch instead of converting frame by frame
+    with PREPROCESS_SECONDS.time(), span("preprocess", trace_id):
+        preprocessed_batch = tf.keras.applications.resnet50.preprocess_input(
+            frames.astype(np.float32)
+        ).astype(np.float16)
+    with RESNET_SECONDS.time(), span("resnet", trace_id):
+        return feature_extractor.predict(preprocessed_batch, verbose=0)
+
+
+def score_frames(frames: np.ndarray, trace_id=None, return_features=False):
     """
-    Processes a batch of frames to detect anomalies.
+    Scores each frame with the scoring head (the SVM's decision function unless an exported head is configured).
 
     Args:
-        frame_batch: A list of FrameData objects.
+        frames: A (batch, 224, 224, 3) uint8 array, typically a FrameWindow view.
+        trace_id: Batch trace from tracing.new_trace_id(), or None.
+        return_features: Also return the ResNet50 features, e.g. for the feature store.
 
     Returns:
-        bool: True if an anomaly is detected in any frame, False otherwise.
+        np.ndarray: One float32 score per frame; above 0 means the frame looks anomalous,
+        and the further above, the more confident the model is (log-odds for a calibrated head).
+        With return_features, a (scores, features) tuple.
     """
-    if not frame_batch:
-        return False
+    if len(frames) == 0:
+        scores, features = np.empty(0, dtype=np.float32), np.empty((0, 2048), dtype=np.float32)
+    else:
+        features = extract_features(frames, trace_id)
+        with SVM_SECONDS.time(), span("svm", trace_id):
+            scores = scoring_head.score(features)
+    return (scores, features) if return_features else scores
 
-    anomaly_found_in_batch = False
-    frames = [fd.frame for fd in frame_batch]
 
-    # --- 2. PREPROCESSING ---
-    preprocessed_batch = np.array(
-        [tf.keras.applications.resnet50.preprocess_input(image.img_to_array(f)) for f in frames],
-        dtype=np.float16
-    )
-    features = feature_extractor.predict(preprocessed_batch, verbose=0)
-
-    predictions = svm_model.predict(features)
-    for pred in predictions:
-        if pred == 1:
-            anomaly_found_in_batch = True
-            break
-    return anomaly_found_in_batch
\ No newline at end of file
+def process_batch(frames: np.ndarray, trace_id=None) -> bool:
+    """
+    Processes a batch of frames to detect anomalies.
+
+    Args:
+        frames: A (batch, 224, 224, 3) uint8 array, typically a FrameWindow view.
+        trace_id: Batch trace from tracing.new_trace_id(), or None.
+
+    Returns:
+        bool: True if an anomaly is detected in any frame, False otherwise.
+    """
+    return bool((score_frames(frames, trace_id) > 0).any())
@@ -7,7 +7,6 @@ import queue
 import base64
 import json
 from datetime import datetime
-from collections import deque
 from concurrent.futures import ThreadPoolExecutor, wait
 import google.generativeai as genai
 from fastapi import FastAPI
@@ -15,8 +14,14 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 from dotenv import load_dotenv
 from twilio.rest import Client
-from Sih_ResNet_Anomaly import process_batch
+from Sih_ResNet_Anomaly import score_frames
 from rtspHandler import RTSPFrameCapture
+from frame_window import FrameWindow, ScoreWindow
+from live_preview import LatestFrame, PreviewHub, add_preview_routes
+from feature_store import FEATURE_STORE_ENABLED, FeatureWriter
+from rate_controller import AdaptiveRateController
+from metrics import CAMERA_FRAMES, QUEUE_DEPTH, add_metrics_route, stage_timer
+from tracing import add_trace_routes, new_trace_id, record, span
 try:
     ffmpeg_bin_path = r"C:\\ffmpeg\\bin"
     os.environ['PATH'] = ffmpeg_bin_path + os.pathsep + os.environ.get('PATH', '')
@@ -27,12 +32,27 @@ except Exception as e:
 
 executor = ThreadPoolExecutor(max_workers=3)
 shutdown_event = threading.Event()
-BATCH_SIZE = 100
+preview_hub = PreviewHub()  # Live preview streams of the cameras run_pipeline is watching
 TARGET_FPS = 5
+# Frames are scored SCORE_STRIDE at a time; each stride decides over the last SCORE_WINDOW scores
+SCORE_WINDOW = int(os.getenv("SCORE_WINDOW", "50"))
+SCORE_STRIDE = int(os.getenv("SCORE_STRIDE", "5"))
+ANOMALY_MIN_FRACTION = float(os.getenv("ANOMALY_MIN_FRACTION", "0.3"))  # Share of the window that must score anomalous
+# Live streams start at TARGET_FPS; the rate controller then keeps sampling within these bounds
+ADAPTIVE_FPS = os.getenv("ADAPTIVE_FPS", "1") == "1"
+MIN_FPS = float(os.getenv("MIN_FPS", "1"))
+MAX_FPS = float(os.getenv("MAX_FPS", "10"))
 VLM_TRIGGER_INTERVAL = 50
 VLM_COOLDOWN_SECONDS = 15
-FRAME_INTERVAL_FOR_GEMINI = 10
+FRAME_INTERVAL_FOR_GEMINI = 5  # 10 frames from a full window
 MODEL_NAME = 'gemini-2.5-flash'
+DECODE_SECONDS = stage_timer("decode")
+RESIZE_SECONDS = stage_timer("resize")
+GEMINI_SECONDS = stage_timer("gemini")
+TWILIO_SECONDS = stage_timer("twilio")
+FEATURE_STORE_SECONDS = stage_timer("feature_store")
+WINDOW_DEPTH = QUEUE_DEPTH.labels(queue="frame_window")
+VLM_TASKS_DEPTH = QUEUE_DEPTH.labels(queue="vlm_tasks")
 def setup_gemini():
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
@@ -42,7 +62,7 @@ def setup_gemini():
     return genai.GenerativeModel(MODEL_NAME)
 
 
-def send_whatsapp_alert(activity_data):
+def send_whatsapp_alert(activity_data, trace_id=None):
     account_sid = os.getenv('TWILIO_ACCOUNT_SID')
     auth_token = os.getenv('TWILIO_AUTH_TOKEN')
     twilio_number = os.getenv('TWILIO_PHONE_NUMBER')
@@ -74,32 +94,36 @@ def send_whatsapp_alert(activity_data):
         for action in desc.get('involved_persons_actions', []):
             message_body += f"- {action}\n"
 
-        message = client.messages.create(
-            from_=f'whatsapp:{twilio_number}',
-            body=message_body,
-            to=f'whatsapp:{recipient_number}'
-        )
+        with TWILIO_SECONDS.time(), span("twilio", trace_id):
+            message = client.messages.create(
+                from_=f'whatsapp:{twilio_number}',
+                body=message_body,
+                to=f'whatsapp:{recipient_number}'
+            )
         print(f"WhatsApp alert sent successfully! SID: {message.sid}")
     except Exception as e:
         print(f"Failed to send WhatsApp alert: {e}")
 
 
-def analyze_and_alert(frames, model, log_file):
-    print("Submitting batch for Gemini analysis...")
-    activity_data = analyze_activity_with_gemini(frames, model, log_file)
-    if activity_data:
-        alerts_store.append(activity_data)
-        send_whatsapp_alert(activity_data)
+def analyze_and_alert(frames, start_time, end_time, model, log_file, trace_id=None, submitted_at=None):
+    if submitted_at is not None:
+        record("executor_queue", trace_id, submitted_at, time.time())
+    with span("analyze_and_alert", trace_id):
+        print("Submitting batch for Gemini analysis...")
+        activity_data = analyze_activity_with_gemini(frames, start_time, end_time, model, log_file, trace_id)
+        if activity_data:
+            alerts_store.append(activity_data)
+            send_whatsapp_alert(activity_data, trace_id)
 
 
-def analyze_activity_with_gemini(frames, model, log_file):
-    if not frames:
+def analyze_activity_with_gemini(frames, start_time, end_time, model, log_file, trace_id=None):
+    """frames are the already-selected frames to send; start/end_time are epoch seconds of the batch"""
+    if len(frames) == 0:
         return None
 
-    selected_frames = frames[::FRAME_INTERVAL_FOR_GEMINI]
     images_base64 = []
-    for f in selected_frames:
-        _, buffer = cv2.imencode('.jpg', f.frame)
+    for f in frames:
+        _, buffer = cv2.imencode('.jpg', f)
         encoded = base64.b64encode(buffer).decode('utf-8')
         images_base64.append({"mime_type": "image/jpeg", "data": encoded})
     prompt = """
@@ -119,11 +143,12 @@ Return a single JSON object ONLY. Do not include ```json or any other text.
     content = [prompt] + images_base64
 
     try:
-        response = model.generate_content(content)
+        with GEMINI_SECONDS.time(), span("gemini", trace_id, frames=len(frames)):
+            response = model.generate_content(content)
         cleaned_text = response.text.strip().replace("```json", "").replace("```", "")
         data = json.loads(cleaned_text)
-        data["batch_start_timestamp"] = frames[0].timestamp.isoformat()
-        data["batch_end_timestamp"] = frames[-1].timestamp.isoformat()
+        data["batch_start_timestamp"] = datetime.fromtimestamp(start_time).isoformat()
+        data["batch_end_timestamp"] = datetime.fromtimestamp(end_time).isoformat()
         with open(log_file, 'a', encoding='utf-8') as f:
             f.write(json.dumps(data) + "\n")
         print("Gemini analysis complete. Logged to file.")
@@ -142,72 +167,133 @@ signal.signal(signal.SIGINT, signal_handler)
 signal.signal(signal.SIGTERM, signal_handler)
 
 
-class FrameData:
-    def __init__(self, frame, timestamp: datetime):
-        self.frame = frame
-        self.timestamp = timestamp
-
-
 def run_pipeline(source, gemini_model, log_file, is_rtsp=False):
     consecutive_anomaly_frames = 0
-    last_vlm_trigger_frame_count = 0
+    # The first anomalous decision triggers the VLM; after that, every VLM_TRIGGER_INTERVAL frames it persists
+    last_vlm_trigger_frame_count = -VLM_TRIGGER_INTERVAL
     vlm_cooldown_until = 0
     futures = []
-    queue_frames = deque()
+    # Holds the frames of the current decision (for Gemini) plus those not scored yet
+    window = FrameWindow(SCORE_WINDOW * 2 + SCORE_STRIDE)
+    scores = ScoreWindow(SCORE_WINDOW, min_fraction=ANOMALY_MIN_FRACTION)
+    unscored = 0
+    last_frame_seq = 0
+    controller = None
 
     if is_rtsp:
         capture = RTSPFrameCapture(source, required_fps=TARGET_FPS, camera_name="RTSP_Camera")
+        camera_name = capture.camera_name
         if not capture.start(): return
+        preview_hub.add_camera(camera_name, capture)
         print("Waiting for RTSP stream to initialize...")
         time.sleep(3)
+        if ADAPTIVE_FPS:
+            controller = AdaptiveRateController()
+            controller.add_camera(camera_name, capture.set_required_fps, TARGET_FPS, MIN_FPS, MAX_FPS)
     else:
         capture = cv2.VideoCapture(source)
+        camera_name = os.path.basename(source)
         if not capture.isOpened():
             print(f"Unable to open video: {source}")
             return
+        latest_frame = LatestFrame()
+        preview_hub.add_camera(camera_name, latest_frame)
         input_fps = capture.get(cv2.CAP_PROP_FPS)
         frame_skip = max(1, int(input_fps / TARGET_FPS))
         print(
             f"Video file detected. Input FPS: {input_fps:.2f}. Processing 1 frame every {frame_skip} frames to achieve ~{TARGET_FPS} FPS.")
         frame_count = 0
 
+    # With FEATURE_STORE_ENABLED=1 the ResNet features of every scored frame are kept for visual
+    # search (see feature_store.py)
+    feature_writer = FeatureWriter(camera_name) if FEATURE_STORE_ENABLED else None
+    frames_captured = CAMERA_FRAMES.labels(camera=camera_name, outcome="captured")
+    frames_duplicated = CAMERA_FRAMES.labels(camera=camera_name, outcome="duplicated")
+    frames_skipped = CAMERA_FRAMES.labels(camera=camera_name, outcome="skipped")
+
     try:
         while not shutdown_event.is_set():
+            lease = None
+            skipped = 0
             if is_rtsp:
-                frame = capture.get_frame()
-                if frame is None:
-                    time.sleep(1 / (TARGET_FPS * 2))
+                if capture.stream_ended:
+                    print("RTSP stream ended and could not be reconnected.")
+                    break
+                lease = capture.acquire_frame()
+                if lease is None or lease.seq == last_frame_seq:
+                    # No new frame yet; don't re-process the one we already have
+                    if lease is not None:
+                        frames_duplicated.inc()
+                        lease.release()
+                    time.sleep(capture.target_frame_time / 2)
                     continue
-                frame_to_process = frame
+                if last_frame_seq and lease.seq > last_frame_seq + 1:
+                    skipped = lease.seq - last_frame_seq - 1  # Published while we were busy
+                    frames_skipped.inc(skipped)
+                last_frame_seq = lease.seq
+                frame_to_process = lease.frame
             else:
-                ret, frame = capture.read()
+                with DECODE_SECONDS.time():
+                    ret, frame = capture.read()
                 if not ret:
                     break
+                frames_captured.inc()
+                latest_frame.offer(frame)
                 frame_to_process = None
                 if frame_count % frame_skip == 0:
                     frame_to_process = frame
+                else:
+                    frames_skipped.inc()
                 frame_count += 1
 
+            work_start = time.perf_counter()
             if frame_to_process is not None:
-                frame_resized = cv2.resize(frame_to_process, (224, 224))
-                queue_frames.append(FrameData(frame_resized, datetime.now()))
-
-            if len(queue_frames) >= BATCH_SIZE:
-                current_batch = [queue_frames.popleft() for _ in range(BATCH_SIZE)]
-                is_anomalous = process_batch(current_batch)
+                # Resize straight into the window's preallocated slot
+                with RESIZE_SECONDS.time():
+                    cv2.resize(frame_to_process, (224, 224), dst=window.next_slot())
+                window.commit(time.time())
+                unscored += 1
+                WINDOW_DEPTH.set(len(window))
+            if lease is not None:
+                lease.release()  # Hand the buffer back to the capture pool
+
+            if unscored >= SCORE_STRIDE:
+                stride_frames, stride_timestamps = window.peek(SCORE_STRIDE, offset=len(window) - unscored)
+                trace_id = new_trace_id()
+                # From the first frame's capture until the stride filled up
+                record("stride_wait", trace_id, stride_timestamps[0], time.time(), camera=camera_name)
+                with span("score_frames", trace_id, frames=SCORE_STRIDE):
+                    stride_scores, stride_features = score_frames(stride_frames, trace_id, return_features=True)
+                scores.add(stride_scores)
+                if feature_writer is not None:
+                    try:
+                        with FEATURE_STORE_SECONDS.time():
+                            feature_writer.append(stride_features, stride_timestamps, stride_scores)
+                    except OSError as e:
+                        print(f"⚠️ Feature store append failed: {e}")
+                unscored -= SCORE_STRIDE
+                # Keep just the frames the decision covers
+                window.consume(max(0, len(window) - unscored - SCORE_WINDOW))
+                is_anomalous = scores.is_anomalous()
 
                 if is_anomalous:
-                    consecutive_anomaly_frames += len(current_batch)
-                    print(f"Suspicious activity flagged! Consecutive frame count: {consecutive_anomaly_frames}")
+                    consecutive_anomaly_frames += SCORE_STRIDE
+                    print(f"Suspicious activity flagged! {scores.anomalous_count()}/{SCORE_WINDOW} recent frames "
+                          f"anomalous, consecutive frame count: {consecutive_anomaly_frames}")
                 else:
                     consecutive_anomaly_frames = 0
-                    last_vlm_trigger_frame_count = 0
+                    last_vlm_trigger_frame_count = -VLM_TRIGGER_INTERVAL
 
                 frames_since_last_trigger = consecutive_anomaly_frames - last_vlm_trigger_frame_count
 
-                if frames_since_last_trigger >= VLM_TRIGGER_INTERVAL and time.time() > vlm_cooldown_until:
-                    print(f"Flagged activity has persisted for {frames_since_last_trigger} more frames.")
-                    future = executor.submit(analyze_and_alert, current_batch, gemini_model, log_file)
+                if is_anomalous and frames_since_last_trigger >= VLM_TRIGGER_INTERVAL \
+                        and time.time() > vlm_cooldown_until:
+                    print(f"Flagged activity has persisted for {consecutive_anomaly_frames} frames.")
+                    decision_frames, decision_timestamps = window.peek(len(window) - unscored)
+                    # The window reuses its buffer, so the background task gets its own copy of the few frames it sends
+                    future = executor.submit(analyze_and_alert, decision_frames[::FRAME_INTERVAL_FOR_GEMINI].copy(),
+                                             decision_timestamps[0], decision_timestamps[-1], gemini_model, log_file,
+                                             trace_id, time.time())
                     futures.append(future)
 
                     last_vlm_trigger_frame_count = consecutive_anomaly_frames
@@ -215,9 +301,21 @@ def run_pipeline(source, gemini_model, log_file, is_rtsp=False):
                     print(
                         f"VLM triggered. Cooldown until {datetime.fromtimestamp(vlm_cooldown_until).strftime('%H:%M:%S')}")
 
+                WINDOW_DEPTH.set(len(window))
+                futures = [f for f in futures if not f.done()]
+                VLM_TASKS_DEPTH.set(len(futures))
+
+            if controller is not None:
+                # Frames the capture published while we were busy; file frames skipped by frame_skip are by design
+                controller.observe(camera_name, frames=1, busy_seconds=time.perf_counter() - work_start,
+                                   skipped=skipped, queue_depth=unscored)
+
     except KeyboardInterrupt:
         print("\nStopped by user.")
     finally:
+        preview_hub.remove_camera(camera_name)
+        if feature_writer is not None:
+            feature_writer.close()
         if is_rtsp:
             capture.stop()
         else:
@@ -266,6 +364,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+add_metrics_route(app)
+add_trace_routes(app)
+add_preview_routes(app, preview_hub)
 
 @app.get("/alerts")
 def get_alerts():
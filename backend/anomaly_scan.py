@@ -0,0 +1,262 @@
+# File: anomaly_scan.py
+"""
+Offline anomaly scan of recorded footage.
+
+Splits every video into SCAN_SEGMENT_SECONDS time segments and scores them in parallel
+worker processes, each seeking straight to its segment and sampling SCAN_FPS frames per
+second, like the live pipeline. The per-frame SVM scores of each video are then joined
+back together and run through the same sliding-window rule as run_pipeline (at least
+ANOMALY_MIN_FRACTION of SCORE_WINDOW frames anomalous), so events that cross a segment
+boundary come out whole. The merged events of all videos are written to one JSON report.
+
+Usage: python anomaly_scan.py PATH [PATH ...] [--workers N] [--segment-seconds 300] [--output report.json]
+PATH may be a video file or a directory of videos.
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+from tqdm import tqdm
+
+from frame_window import FrameWindow
+
+# --- SCAN CONFIGURATION ---
+# Each worker loads its own ResNet50 + SVM (and GPU context), so keep this small
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "2"))
+SCAN_SEGMENT_SECONDS = float(os.getenv("SCAN_SEGMENT_SECONDS", "300"))
+SCAN_FPS = float(os.getenv("SCAN_FPS", "5"))
+SCAN_BATCH_SIZE = int(os.getenv("SCAN_BATCH_SIZE", "64"))  # Frames per score_frames call
+# Same decision rule and env names as run_pipeline
+SCORE_WINDOW = int(os.getenv("SCORE_WINDOW", "50"))
+ANOMALY_MIN_FRACTION = float(os.getenv("ANOMALY_MIN_FRACTION", "0.3"))
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+
+
+def format_seconds(seconds):
+    return f"{int(seconds // 3600):02d}:{int((seconds % 3600) // 60):02d}:{seconds % 60:06.3f}"
+
+
+def find_videos(paths):
+    """Video files named directly or found (recursively) in the given directories"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.extend(os.path.join(root, name) for name in sorted(files)
+                              if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            print(f"⚠️ Skipping '{path}': not a file or directory")
+    return [os.path.abspath(video) for video in videos]
+
+
+def plan_segments(video_path, segment_seconds):
+    """(video_path, fps, frame_skip, start_frame, end_frame) for every segment of one video"""
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"⚠️ Unable to open video: {video_path}")
+        return []
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    frame_skip = max(1, int(fps / SCAN_FPS))
+    # Segments start on a sampled frame, so sharding doesn't change which frames are scored
+    segment_frames = max(frame_skip, int(segment_seconds * fps) // frame_skip * frame_skip)
+    return [(video_path, fps, frame_skip, start, min(start + segment_frames, total_frames))
+            for start in range(0, total_frames, segment_frames)]
+
+
+class ModelLoadError(RuntimeError):
+    """A worker could not load the anomaly models; every other segment would fail the same way"""
+
+
+# --- WORKER PROCESS ---
+def _init_worker(workers):
+    global score_frames, load_error
+    cv2.setNumThreads(1)  # Parallelism comes from the worker processes
+    score_frames, load_error = None, None
+    try:
+        import tensorflow as tf
+
+        # Split the cores between the workers instead of every worker sizing its pools to all of them
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(min(2, threads))
+        # Without memory growth the first worker reserves the whole GPU and the others fail to start
+        for gpu in tf.config.list_physical_devices('GPU'):
+            tf.config.experimental.set_memory_growth(gpu, True)
+        from Sih_ResNet_Anomaly import score_frames
+    except Exception as e:
+        load_error = f"{type(e).__name__}: {e}"
+
+
+def scan_segment(segment):
+    """Scores the sampled frames of one segment; returns (segment, frame numbers, scores)"""
+    if score_frames is None:
+        raise ModelLoadError(f"Worker {os.getpid()} could not load the anomaly models ({load_error})")
+    video_path, fps, frame_skip, start_frame, end_frame = segment
+    cap = cv2.VideoCapture(video_path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    window = FrameWindow(SCAN_BATCH_SIZE)
+    frame_numbers, scores = [], []
+
+    def flush():
+        frames, numbers = window.peek(len(window))
+        scores.append(score_frames(frames))
+        frame_numbers.append(numbers.astype(np.int64))
+        window.consume(len(window))
+
+    try:
+        for frame_num in range(start_frame, end_frame):
+            if frame_num % frame_skip:
+                if not cap.grab():
+                    break
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            cv2.resize(frame, (224, 224), dst=window.next_slot())
+            window.commit(frame_num)  # The timestamp slot holds the frame number here
+            if len(window) == SCAN_BATCH_SIZE:
+                flush()
+        if len(window):
+            flush()
+    finally:
+        cap.release()
+    if not scores:
+        return segment, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    return segment, np.concatenate(frame_numbers), np.concatenate(scores)
+
+
+# --- MERGING ---
+def find_events(seconds, scores, window=SCORE_WINDOW, min_fraction=ANOMALY_MIN_FRACTION):
+    """
+    Applies the live pipeline's rule at every sampled frame: the scene is anomalous while
+    at least min_fraction of the last `window` frames score above 0. Each anomalous run
+    becomes one event spanning its first to last anomalous frame.
+    """
+    flags = scores > 0
+    required = max(1, int(np.ceil(min_fraction * window)))
+    counts = np.convolve(flags, np.ones(window, dtype=np.int32))[:len(flags)]  # Anomalous frames in the trailing window
+    alarm = np.concatenate([[False], counts >= required, [False]])
+    edges = np.flatnonzero(alarm[1:] != alarm[:-1])
+    events = []
+    for onset, release in zip(edges[::2], edges[1::2]):
+        lo = max(0, onset - window + 1)
+        flagged = lo + np.flatnonzero(flags[lo:release])
+        first, last = flagged[0], flagged[-1]
+        events.append({
+            "start_seconds": round(float(seconds[first]), 3),
+            "end_seconds": round(float(seconds[last]), 3),
+            "start": format_seconds(seconds[first]),
+            "end": format_seconds(seconds[last]),
+            "anomalous_frames": int(len(flagged)),
+            "peak_score": round(float(scores[first:last + 1].max()), 4),
+        })
+    return events
+
+
+def merge_video(video_path, results, timeline=False):
+    """Joins one video's segment results in order and finds its events"""
+    results = sorted(results, key=lambda result: result[0][3])
+    fps = results[0][0][1]
+    frame_numbers = np.concatenate([numbers for _, numbers, _ in results])
+    scores = np.concatenate([segment_scores for _, _, segment_scores in results])
+    seconds = frame_numbers / fps
+    report = {
+        "video": video_path,
+        "segments": len(results),
+        "frames_scored": int(len(scores)),
+        "duration_seconds": round(results[-1][0][4] / fps, 3),
+        "anomalous_frames": int(np.count_nonzero(scores > 0)),
+        "events": find_events(seconds, scores) if len(scores) else [],
+    }
+    if timeline and len(scores):
+        # Highest score per second of footage; compact enough for a day of video
+        buckets = seconds.astype(np.int64)
+        peaks = np.full(buckets[-1] + 1, np.nan, dtype=np.float32)
+        np.fmax.at(peaks, buckets, scores)
+        report["timeline"] = [None if np.isnan(peak) else round(float(peak), 4) for peak in peaks]
+    return report
+
+
+def scan(paths, workers=SCAN_WORKERS, segment_seconds=SCAN_SEGMENT_SECONDS, timeline=False):
+    """Scans the given videos/directories and returns the merged report"""
+    started = time.time()
+    videos = find_videos(paths)
+    segments = [segment for video in videos for segment in plan_segments(video, segment_seconds)]
+    print(f"🔎 Scanning {len(videos)} videos as {len(segments)} segments with {workers} workers...")
+
+    results = {video: [] for video in videos}
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(workers,)) as pool:
+        futures = {pool.submit(scan_segment, segment): segment for segment in segments}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Segments"):
+            segment = futures[future]
+            try:
+                result = future.result()
+            except ModelLoadError:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            except Exception as e:
+                print(f"\n❌ Segment {os.path.basename(segment[0])} @ frame {segment[3]} failed: {e}")
+                failed.append({"video": segment[0], "start_frame": segment[3], "end_frame": segment[4], "error": str(e)})
+                continue
+            results[segment[0]].append(result)
+
+    video_reports = [merge_video(video, video_results, timeline)
+                     for video, video_results in results.items() if video_results]
+    elapsed = time.time() - started
+    footage = sum(report["duration_seconds"] for report in video_reports)
+    return {
+        "generated_at": datetime.datetime.now().isoformat(),
+        "config": {"workers": workers, "segment_seconds": segment_seconds, "fps": SCAN_FPS,
+                   "score_window": SCORE_WINDOW, "min_fraction": ANOMALY_MIN_FRACTION},
+        "summary": {
+            "videos": len(video_reports),
+            "segments": len(segments),
+            "failed_segments": len(failed),
+            "footage_seconds": round(footage, 1),
+            "elapsed_seconds": round(elapsed, 1),
+            "speedup": round(footage / elapsed, 1) if elapsed else None,  # Footage seconds per wall second
+            "events": sum(len(report["events"]) for report in video_reports),
+        },
+        "videos": video_reports,
+        "failed_segments": failed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Video files and/or directories of videos")
+    parser.add_argument("--workers", type=int, default=SCAN_WORKERS, help="Worker processes")
+    parser.add_argument("--segment-seconds", type=float, default=SCAN_SEGMENT_SECONDS, help="Length of each segment")
+    parser.add_argument("--timeline", action="store_true", help="Include each video's per-second peak score")
+    parser.add_argument("--output", help="Report path (default: anomaly_scan_<timestamp>.json)")
+    args = parser.parse_args()
+
+    try:
+        report = scan(args.paths, args.workers, args.segment_seconds, args.timeline)
+    except ModelLoadError as e:
+        raise SystemExit(f"❌ {e}")
+    output = args.output or f"anomaly_scan_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    for video in report["videos"]:
+        print(f"\n📼 {os.path.basename(video['video'])}: {len(video['events'])} events")
+        for event in video["events"]:
+            print(f"   {event['start']} - {event['end']}  ({event['anomalous_frames']} frames, peak {event['peak_score']})")
+    print(json.dumps(report["summary"], indent=2))
+    print(f"Report written to {output}")
+
+
+if __name__ == "__main__":
+    main()
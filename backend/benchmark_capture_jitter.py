@@ -0,0 +1,139 @@
+# File: benchmark_capture_jitter.py
+"""
+Measures per-frame timing jitter of the capture loop.
+
+  before: the previous read loop (new array per read, randomized frame interval,
+          1 ms polling, gc.collect() every 100 frames)
+  after:  RTSPFrameCapture decoding into its FramePool
+
+A synthetic video is generated with cv2.VideoWriter unless --video is given, and a
+heap of --heap-objects live objects stands in for the models and state of a real
+process, since that is what makes a full gc.collect() expensive.
+
+Usage: python benchmark_capture_jitter.py [--video PATH] [--fps 25] [--seconds 20]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+# The synthetic clip is MPEG-4, so don't force the H.264 decoder used for cameras
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+
+from rtspHandler import RTSPFrameCapture
+
+
+def make_synthetic_video(path, seconds, fps=30, size=(1920, 1080)):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    frame = np.zeros((size[1], size[0], 3), dtype=np.uint8)
+    for i in range(int(seconds * fps)):
+        frame[:] = 40
+        x = (i * 15) % (size[0] - 200)
+        cv2.rectangle(frame, (x, 400), (x + 200, 600), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def legacy_capture(video_path, fps, max_frames):
+    """The read loop as it was before frame pooling, returning frame publish times"""
+    cap = cv2.VideoCapture(video_path)
+    target_frame_time = 1.0 / fps
+    last_frame_time = 0
+    frame_count = 0
+    times = []
+    while frame_count < max_frames:
+        current_time = time.time()
+        frame_interval = target_frame_time * random.uniform(0.9, 1.1)
+        if current_time - last_frame_time < frame_interval:
+            time.sleep(0.001)
+            continue
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_count += 1
+        last_frame_time = current_time
+        current_frame = frame  # noqa: F841 - published to consumers in the real loop
+        times.append(time.perf_counter())
+        if frame_count % 100 == 0:
+            gc.collect()
+    cap.release()
+    return times
+
+
+def pooled_capture(video_path, fps, max_frames):
+    """RTSPFrameCapture's OpenCV reader with publish times recorded"""
+    capture = RTSPFrameCapture(video_path, camera_name="Benchmark", required_fps=fps)
+    capture.use_vidgear = False
+    times = []
+    publish = capture._publish
+
+    def timed_publish(lease):
+        times.append(time.perf_counter())
+        publish(lease)
+
+    capture._publish = timed_publish
+    if not capture.start():
+        raise RuntimeError(f"Could not open {video_path}")
+    while len(times) < max_frames and not capture.stream_ended:
+        time.sleep(0.05)
+    capture.stop()
+    return times[:max_frames]
+
+
+def summarize(times, fps):
+    intervals_ms = np.diff(times) * 1000.0
+    target_ms = 1000.0 / fps
+    deviation = np.abs(intervals_ms - target_ms)
+    return {
+        "frames": len(times),
+        "mean_interval_ms": round(float(intervals_ms.mean()), 3),
+        "stdev_interval_ms": round(float(intervals_ms.std()), 3),
+        "p50_deviation_ms": round(float(np.percentile(deviation, 50)), 3),
+        "p99_deviation_ms": round(float(np.percentile(deviation, 99)), 3),
+        "max_deviation_ms": round(float(deviation.max()), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video file to read (default: generate a synthetic 1080p clip)")
+    parser.add_argument("--fps", type=int, default=25, help="Target capture rate")
+    parser.add_argument("--seconds", type=float, default=20, help="Capture duration per run")
+    parser.add_argument("--heap-objects", type=int, default=500_000, help="Live objects kept to make GC realistic")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    video_path = args.video
+    if not video_path:
+        video_path = os.path.join(tempfile.gettempdir(), "capture_jitter_synthetic.mp4")
+        if not os.path.exists(video_path):
+            print("Generating synthetic 1080p video...")
+            make_synthetic_video(video_path, args.seconds + 5)
+
+    heap = [{"i": i} for i in range(args.heap_objects)]
+    max_frames = int(args.fps * args.seconds)
+
+    results = {
+        "before": summarize(legacy_capture(video_path, args.fps, max_frames), args.fps),
+        "after": summarize(pooled_capture(video_path, args.fps, max_frames), args.fps),
+    }
+    del heap
+
+    print(f"\nTarget interval {1000.0 / args.fps:.1f} ms")
+    print(f"{'':<8}" + "".join(f"{key:>20}" for key in results["before"]))
+    for name, stats in results.items():
+        print(f"{name:<8}" + "".join(f"{value:>20}" for value in stats.values()))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
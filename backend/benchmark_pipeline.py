@@ -0,0 +1,280 @@
+# File: benchmark_pipeline.py
+"""
+End-to-end benchmark of the alert pipeline on synthetic footage.
+
+Each camera gets a generated clip of moving shapes in which a large bright "intruder"
+appears at --event-second and stays. Every camera runs run_pipeline in its own process,
+as in production, reading the clip either through RTSPFrameCapture (--source rtsp,
+paced like a live camera) or straight from the file (--source file, as fast as it
+decodes). The anomaly model, Gemini and Twilio are replaced by stubs with fixed
+latencies, so results measure the pipeline itself and are reproducible.
+
+Per camera it reports sustained FPS into the frame window, event-to-alert latency
+(first event frame entering the window -> Twilio call), CPU, peak RSS, frame counters
+and per-stage latencies from the metrics registry.
+
+With --trace PREFIX, each camera also writes a Chrome trace of every scored stride to PREFIX.<camera>.json.
+
+Usage: python benchmark_pipeline.py [--cameras 2] [--seconds 60] [--source rtsp|file] [--json results.json]
+"""
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+import cv2
+import numpy as np
+import psutil
+
+# The synthetic clips are MPEG-4, so don't force the H.264 decoder used for cameras
+os.environ.setdefault("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp")
+
+EVENT_BRIGHTNESS = 90      # Mean pixel value above which the stub model calls a frame anomalous
+RESULT_TIMEOUT = 120       # Seconds to wait for a camera process after its run should have ended
+
+
+def make_event_video(path, seconds, fps, event_second, size=(1280, 720)):
+    """Moving shapes on a dark background; from event_second on, a bright block covers half the frame"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    width, height = size
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    for i in range(int(seconds * fps)):
+        frame[:] = 40
+        x = (i * 12) % (width - 160)
+        cv2.rectangle(frame, (x, height // 3), (x + 160, height // 3 + 160), (255, 255, 255), -1)
+        cv2.circle(frame, (width - x - 60, 2 * height // 3), 50, (200, 200, 200), -1)
+        if i >= event_second * fps:
+            cv2.rectangle(frame, (0, 0), (width // 2, height), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+# --- STUB BACKENDS ---
+class StubGemini:
+    """Stands in for the GenerativeModel: fixed latency, fixed well-formed answer"""
+    def __init__(self, latency):
+        self.latency = latency
+
+    def generate_content(self, content):
+        time.sleep(self.latency)
+        return types.SimpleNamespace(text=json.dumps({"activity_description": {
+            "summary": "entering a restricted area",
+            "involved_persons_actions": ["Person 1 entered the frame."],
+            "involved_objects": [],
+            "critical_level": "Low",
+        }}))
+
+
+def install_stub_backends(options, alerts):
+    """Replaces the ResNet/SVM module, Twilio and the Gemini SDK before the pipeline imports them"""
+    anomaly = types.ModuleType("Sih_ResNet_Anomaly")
+
+    def score_frames(frames, trace_id=None, return_features=False):
+        time.sleep(options["anomaly_ms_per_frame"] * len(frames) / 1000)
+        scores = (frames[:, ::8, ::8].mean(axis=(1, 2, 3)) - EVENT_BRIGHTNESS).astype(np.float32)
+        if not return_features:
+            return scores
+        # 2048-d stand-in for the ResNet features, so the feature store writes production-sized rows
+        return scores, frames[:, ::4, ::4].reshape(len(frames), -1)[:, :2048].astype(np.float32)
+
+    anomaly.score_frames = score_frames
+    sys.modules["Sih_ResNet_Anomaly"] = anomaly
+    os.environ.setdefault("FEATURE_STORE_DIR", os.path.join(tempfile.gettempdir(), "benchmark_visual_features"))
+
+    class Messages:
+        def create(self, **kwargs):
+            time.sleep(options["twilio_latency"])
+            alerts.append(time.time())
+            return types.SimpleNamespace(sid="SM-benchmark")
+
+    class Client:
+        def __init__(self, *args):
+            self.messages = Messages()
+
+    twilio = types.ModuleType("twilio")
+    twilio.rest = types.ModuleType("twilio.rest")
+    twilio.rest.Client = Client
+    sys.modules["twilio"] = twilio
+    sys.modules["twilio.rest"] = twilio.rest
+    for name in ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_PHONE_NUMBER", "RECIPIENT_PHONE_NUMBER"):
+        os.environ[name] = "benchmark"
+
+    # Only setup_gemini() touches the SDK, and the benchmark passes StubGemini instead
+    try:
+        importlib.import_module("google")
+    except ImportError:
+        sys.modules["google"] = types.ModuleType("google")
+    sys.modules["google.generativeai"] = types.ModuleType("google.generativeai")
+    sys.modules["google"].generativeai = sys.modules["google.generativeai"]
+
+
+def run_camera(camera_name, video_path, options, result_queue):
+    """Runs run_pipeline on one clip in this process and reports what it measured"""
+    alerts = []
+    install_stub_backends(options, alerts)
+    import TwillioWhatsappBotFinal as bot
+    import tracing
+    from metrics import CAMERA_FRAMES, STAGE_SECONDS
+
+    if options["trace"]:
+        tracing.enable(sample_rate=1.0)
+
+    bot.TARGET_FPS = options["target_fps"]
+    bot.SCORE_WINDOW = options["score_window"]
+    bot.SCORE_STRIDE = options["score_stride"]
+    bot.ANOMALY_MIN_FRACTION = options["min_fraction"]
+
+    ingest = {"frames": 0, "first": None, "last": None, "event": None}
+
+    class TimedFrameWindow(bot.FrameWindow):
+        def commit(self, timestamp):
+            now = time.time()
+            if ingest["event"] is None and self.frames[self.end, ::8, ::8].mean() > EVENT_BRIGHTNESS:
+                ingest["event"] = now
+            ingest["frames"] += 1
+            ingest["first"] = ingest["first"] or now
+            ingest["last"] = now
+            super().commit(timestamp)
+
+    bot.FrameWindow = TimedFrameWindow
+
+    process = psutil.Process()
+    peak = {"rss": process.memory_info().rss}
+    sampling = threading.Event()
+
+    def sample_rss():
+        while not sampling.wait(0.25):
+            peak["rss"] = max(peak["rss"], process.memory_info().rss)
+
+    threading.Thread(target=sample_rss, daemon=True).start()
+    threading.Timer(options["seconds"], bot.shutdown_event.set).start()
+    cpu_start = process.cpu_times()
+    wall_start = time.time()
+
+    log_file = os.path.join(tempfile.gettempdir(), f"benchmark_activity_{camera_name}.jsonl")
+    bot.run_pipeline(video_path, StubGemini(options["vlm_latency"]), log_file, is_rtsp=options["source"] == "rtsp")
+
+    wall = time.time() - wall_start
+    cpu_end = process.cpu_times()
+    sampling.set()
+    peak["rss"] = max(peak["rss"], process.memory_info().rss)
+    if options["trace"]:
+        tracing.export_chrome_trace(f"{options['trace']}.{camera_name}.json")
+
+    ingest_seconds = (ingest["last"] - ingest["first"]) if ingest["frames"] > 1 else 0
+    alert_after_event = [t for t in alerts if ingest["event"] is not None and t >= ingest["event"]]
+    stages = {
+        key[0]: {"count": sum(child.counts), "mean_ms": round(1000 * child.sum / max(1, sum(child.counts)), 3)}
+        for key, child in STAGE_SECONDS.children.items()
+    }
+    result_queue.put({
+        "camera": camera_name,
+        "frames_ingested": ingest["frames"],
+        "sustained_fps": round(ingest["frames"] / ingest_seconds, 2) if ingest_seconds else 0.0,
+        "event_to_alert_s": round(alert_after_event[0] - ingest["event"], 3) if alert_after_event else None,
+        "alerts": len(alerts),
+        "cpu_percent": round(100 * ((cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)) / wall, 1),
+        "peak_rss_mb": round(peak["rss"] / 1024 / 1024, 1),
+        "frame_counters": {key[1]: int(child.value) for key, child in CAMERA_FRAMES.children.items()},
+        "stages": stages,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cameras", type=int, default=2, help="Number of cameras, one process each")
+    parser.add_argument("--seconds", type=float, default=60, help="Run time per camera")
+    parser.add_argument("--source", choices=["rtsp", "file"], default="rtsp",
+                        help="rtsp: RTSPFrameCapture paced at --target-fps; file: unpaced file decoding")
+    parser.add_argument("--event-second", type=float, default=10, help="When the intruder appears in the clip")
+    parser.add_argument("--target-fps", type=int, default=5, help="TARGET_FPS for run_pipeline")
+    parser.add_argument("--score-window", type=int, default=50, help="SCORE_WINDOW for run_pipeline")
+    parser.add_argument("--score-stride", type=int, default=5, help="SCORE_STRIDE for run_pipeline")
+    parser.add_argument("--min-fraction", type=float, default=0.3, help="ANOMALY_MIN_FRACTION for run_pipeline")
+    parser.add_argument("--anomaly-ms-per-frame", type=float, default=2.0, help="Stub ResNet+SVM cost per frame")
+    parser.add_argument("--vlm-latency", type=float, default=1.5, help="Stub Gemini latency in seconds")
+    parser.add_argument("--twilio-latency", type=float, default=0.3, help="Stub Twilio latency in seconds")
+    parser.add_argument("--trace", help="Write a Chrome trace per camera to TRACE.<camera>.json")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    # Paced capture reads one clip frame per tick, so an rtsp clip is written at the target rate to play in real time
+    clip_fps = args.target_fps if args.source == "rtsp" else 25
+    clip_seconds = args.seconds + 10
+    video_path = os.path.join(tempfile.gettempdir(),
+                              f"benchmark_pipeline_{clip_fps}fps_{clip_seconds:g}s_event{args.event_second:g}.mp4")
+    if not os.path.exists(video_path):
+        print(f"Generating synthetic clip {video_path}...")
+        make_event_video(video_path, clip_seconds, clip_fps, args.event_second)
+
+    options = {
+        "source": args.source,
+        "seconds": args.seconds,
+        "target_fps": args.target_fps,
+        "score_window": args.score_window,
+        "score_stride": args.score_stride,
+        "min_fraction": args.min_fraction,
+        "anomaly_ms_per_frame": args.anomaly_ms_per_frame,
+        "vlm_latency": args.vlm_latency,
+        "twilio_latency": args.twilio_latency,
+        "trace": args.trace,
+    }
+    result_queue = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_camera, args=(f"cam{i}", video_path, options, result_queue),
+                                name=f"BenchmarkCamera-{i}")
+        for i in range(args.cameras)
+    ]
+    for process in processes:
+        process.start()
+
+    cameras = []
+    deadline = time.time() + args.seconds + RESULT_TIMEOUT
+    while len(cameras) < len(processes) and time.time() < deadline:
+        try:
+            cameras.append(result_queue.get(timeout=1))
+        except Exception:
+            if not any(process.is_alive() for process in processes):
+                break
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    cameras.sort(key=lambda camera: camera["camera"])
+
+    latencies = [camera["event_to_alert_s"] for camera in cameras if camera["event_to_alert_s"] is not None]
+    results = {
+        "config": {**options, "cameras": args.cameras, "event_second": args.event_second,
+                   "cpu_count": psutil.cpu_count()},
+        "cameras": cameras,
+        "summary": {
+            "cameras_reported": len(cameras),
+            "total_fps": round(sum(camera["sustained_fps"] for camera in cameras), 2),
+            "min_fps": min((camera["sustained_fps"] for camera in cameras), default=0.0),
+            "max_event_to_alert_s": max(latencies) if latencies else None,
+            "missed_alerts": len(cameras) - len(latencies),
+            "total_cpu_percent": round(sum(camera["cpu_percent"] for camera in cameras), 1),
+            "max_peak_rss_mb": max((camera["peak_rss_mb"] for camera in cameras), default=0.0),
+        },
+    }
+
+    print(f"\n{'camera':<8}{'fps':>10}{'alert_s':>10}{'cpu_%':>10}{'rss_mb':>10}")
+    for camera in cameras:
+        latency = camera["event_to_alert_s"]
+        print(f"{camera['camera']:<8}{camera['sustained_fps']:>10}{latency if latency is not None else '-':>10}"
+              f"{camera['cpu_percent']:>10}{camera['peak_rss_mb']:>10}")
+    print(json.dumps(results["summary"], indent=2))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
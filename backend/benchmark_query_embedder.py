@@ -0,0 +1,205 @@
+# File: benchmark_query_embedder.py
+"""
+Parity check and benchmark of the query embedders in query_embedder.py.
+
+Every backend (PyTorch, and each ONNX file found in --onnx-dir) runs in a fresh process,
+so startup is measured cold: imports, model load and the first query. Each then embeds
+the query set --repeats times one query at a time, as /search does, on EMBEDDER_THREADS
+threads, and reports p50/p95 latency, queries per second and RSS.
+
+Parity, as cosine similarity per text:
+  * ONNX vs PyTorch embeddings of the queries and library documents, when
+    sentence-transformers is installed, plus overlap of the top-k search results
+  * every backend vs the vectors stored in video_library.faiss, which indexing.py
+    produced with PyTorch from the documents in video_library_metadata.json
+The exit status is 1 if any cosine falls below --min-cosine.
+
+Usage: python benchmark_query_embedder.py [--onnx-dir ./weights/all-MiniLM-L6-v2-onnx] [--repeats 20] [--json results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+QUERIES = [
+    "person climbing over a fence at night",
+    "two people fighting on the street",
+    "man in a blue jacket carrying a backpack",
+    "car parked in a no parking zone",
+    "someone loitering near the entrance",
+    "crowd gathering outside a shop",
+    "person running away from a store",
+    "bicycle stolen from a rack",
+    "woman walking a dog in the park",
+    "delivery van unloading boxes",
+    "suspicious bag left unattended",
+    "people entering a restricted area",
+    "vehicle driving the wrong way",
+    "individual breaking a car window",
+    "security guard patrolling a corridor",
+    "a group of teenagers near the parking lot",
+    "person lying on the ground",
+    "motorcycle speeding through an intersection",
+    "shoplifting in a supermarket aisle",
+    "fire or smoke visible in the frame",
+]
+
+
+def worker(backend, model_file, repeats, documents, spawned_at):
+    """Runs in a child process: measures one backend and prints its results as JSON"""
+    if backend == "onnx":
+        os.environ["ONNX_EMBEDDER_FILE"] = model_file
+    import psutil
+    import query_embedder
+
+    embedder = query_embedder.load_embedder("all-MiniLM-L6-v2", backend)
+    if backend == "torch":
+        import torch
+        torch.set_num_threads(query_embedder.EMBEDDER_THREADS)
+    embedder.encode([QUERIES[0]])
+    startup = time.time() - spawned_at  # Includes starting the interpreter
+
+    latencies = []
+    for _ in range(repeats):
+        for query in QUERIES:
+            start = time.perf_counter()
+            embedder.encode([query])
+            latencies.append(time.perf_counter() - start)
+    print(json.dumps({
+        "startup_s": round(startup, 3),
+        "rss_mb": round(psutil.Process().memory_info().rss / 1024 / 1024, 1),
+        "p50_ms": round(1000 * float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(1000 * float(np.percentile(latencies, 95)), 3),
+        "queries_per_second": round(len(latencies) / sum(latencies), 1),
+        "queries": np.asarray(embedder.encode(QUERIES), dtype=np.float32).tolist(),
+        "documents": np.asarray(embedder.encode(documents), dtype=np.float32).tolist() if documents else [],
+    }))
+
+
+def run_backend(backend, model_file, repeats, documents_path):
+    command = [sys.executable, os.path.abspath(__file__), "--worker", backend, "--model-file", model_file or "",
+               "--repeats", str(repeats), "--documents", documents_path or "", "--spawned-at", repr(time.time())]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        print(f"⚠️ {backend} {model_file or ''} failed:\n{completed.stderr[-2000:]}")
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def cosine_summary(embeddings, reference):
+    embeddings, reference = np.asarray(embeddings), np.asarray(reference)
+    cosines = np.sum(embeddings * reference, axis=1) / (
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1))
+    return {"min": round(float(cosines.min()), 5), "mean": round(float(cosines.mean()), 5)}
+
+
+def top_k_overlap(embeddings, reference, library, k):
+    """Mean share of the reference top-k library entries that the embeddings also rank in their top-k"""
+    overlaps = []
+    for embedding, expected in zip(np.asarray(embeddings), np.asarray(reference)):
+        found = set(np.argsort(-(library @ embedding))[:k])
+        wanted = set(np.argsort(-(library @ expected))[:k])
+        overlaps.append(len(found & wanted) / len(wanted))
+    return round(float(np.mean(overlaps)), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--onnx-dir", help="Directory with the ONNX export (default: ONNX_EMBEDDER_DIR)")
+    parser.add_argument("--repeats", type=int, default=20, help="Passes over the query set per backend")
+    parser.add_argument("--index", default="video_library.faiss")
+    parser.add_argument("--metadata", default="video_library_metadata.json")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--model-file", help=argparse.SUPPRESS)
+    parser.add_argument("--documents", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        documents = []
+        if args.documents:
+            with open(args.documents, encoding="utf-8") as f:
+                documents = json.load(f)
+        worker(args.worker, args.model_file, args.repeats, documents, args.spawned_at)
+        return
+
+    if args.onnx_dir:
+        os.environ["ONNX_EMBEDDER_DIR"] = args.onnx_dir
+    onnx_dir = args.onnx_dir or os.getenv("ONNX_EMBEDDER_DIR", "./weights/all-MiniLM-L6-v2-onnx")
+
+    # Library documents and the vectors indexing.py stored for them
+    documents, stored = [], None
+    documents_path = None
+    if os.path.exists(args.index) and os.path.exists(args.metadata):
+        import faiss
+        with open(args.metadata, encoding="utf-8") as f:
+            documents = [entry["document"] for entry in json.load(f)]
+        index = faiss.read_index(args.index)
+        stored = np.stack([index.reconstruct(i) for i in range(index.ntotal)])
+        documents_path = os.path.join(tempfile.gettempdir(), "benchmark_query_embedder_documents.json")
+        with open(documents_path, "w", encoding="utf-8") as f:
+            json.dump(documents, f)
+
+    backends = []
+    try:
+        import sentence_transformers  # noqa: F401  Only probing whether the PyTorch backend can run
+        backends.append(("torch", None))
+    except ImportError:
+        print("sentence-transformers is not installed; comparing ONNX with the stored index vectors only")
+    for model_file in ("model.onnx", "model_int8.onnx"):
+        if os.path.exists(os.path.join(onnx_dir, model_file)):
+            backends.append(("onnx", model_file))
+
+    results = {}
+    for backend, model_file in backends:
+        name = backend if model_file is None else f"onnx:{model_file}"
+        print(f"Measuring {name}...")
+        result = run_backend(backend, model_file, args.repeats, documents_path)
+        if result is not None:
+            results[name] = result
+    if documents_path:
+        os.remove(documents_path)
+
+    failed = False
+    reference = results.get("torch")
+    report = {}
+    for name, result in results.items():
+        row = {key: result[key] for key in ("startup_s", "rss_mb", "p50_ms", "p95_ms", "queries_per_second")}
+        checks = []
+        if stored is not None and result["documents"]:
+            row["vs_index"] = cosine_summary(result["documents"], stored)
+            checks.append(row["vs_index"]["min"])
+        if reference is not None and name != "torch":
+            row["vs_torch_queries"] = cosine_summary(result["queries"], reference["queries"])
+            checks.append(row["vs_torch_queries"]["min"])
+            if stored is not None:
+                row["top_k_overlap"] = top_k_overlap(result["queries"], reference["queries"], stored, args.top_k)
+        row["passed"] = all(value >= args.min_cosine for value in checks)
+        failed = failed or not row["passed"]
+        report[name] = row
+
+    print(f"\n{'backend':<24}{'startup_s':>10}{'rss_mb':>9}{'p50_ms':>9}{'p95_ms':>9}{'q/s':>8}"
+          f"{'cos_index':>11}{'cos_torch':>11}{'top_k':>7}  parity")
+    for name, row in report.items():
+        print(f"{name:<24}{row['startup_s']:>10}{row['rss_mb']:>9}{row['p50_ms']:>9}{row['p95_ms']:>9}"
+              f"{row['queries_per_second']:>8}{row.get('vs_index', {}).get('min', '-'):>11}"
+              f"{row.get('vs_torch_queries', {}).get('min', '-'):>11}{row.get('top_k_overlap', '-'):>7}"
+              f"  {'PASS' if row['passed'] else 'FAIL'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# File: benchmark_scoring_head.py
+"""
+Parity check and benchmark of the NumPy scoring heads against the joblib SVM.
+
+Exports every head that applies to the model (linear; rbf, nystroem, rff) and, on
+held-out features, compares its margin with the pickle's decision_function (max, mean and
+relative error, sign agreement), its calibrated probability with predict_proba when the
+pickle is calibrated, and checks that a saved and reloaded head scores identically.
+Exact heads (linear, rbf) must match; the exit status is 1 if one doesn't. Then it times
+the pickle's predict() and every head at each batch size.
+
+Without --model it trains stand-ins on synthetic 2048-d ResNet-like features: a
+calibrated RBF SVC and a LinearSVC.
+
+Usage: python benchmark_scoring_head.py [--model weights/svm_model.pkl --features eval.npy]
+                                        [--batch-sizes 64,256,1024,4096] [--json results.json]
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from scoring_head import _anomaly_sign, _unwrap, export_head, load_head
+
+FEATURE_DIM = 2048
+EXACT_TOLERANCE = 1e-3   # Max margin error relative to the margins' spread, for exact heads
+EXACT_SIGN_AGREEMENT = 0.999
+
+
+def synthetic_features(count, rng, anomalous_fraction=0.3):
+    """Non-negative, sparse-ish vectors like pooled ResNet activations; anomalies shift a block of channels"""
+    labels = (rng.random(count) < anomalous_fraction).astype(int)
+    features = np.maximum(rng.normal(0.2, 1.0, (count, FEATURE_DIM)), 0)
+    features[labels == 1, :256] += rng.gamma(2.0, 0.15, (int(labels.sum()), 256))
+    return features.astype(np.float32), labels
+
+
+def synthetic_models(rng, train_count):
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.svm import SVC, LinearSVC
+
+    features, labels = synthetic_features(train_count, rng)
+    rbf = CalibratedClassifierCV(SVC(kernel="rbf", C=1.0), method="sigmoid", ensemble=False, cv=3).fit(features, labels)
+    linear = LinearSVC(C=0.01).fit(features, labels)
+    return {"rbf_svc": rbf, "linear_svc": linear}
+
+
+def methods_for(model):
+    estimator = _unwrap(model)[0]
+    if getattr(estimator, "kernel", "linear") == "linear":
+        return ["linear"]
+    return ["rbf", "nystroem", "rff"]
+
+
+def best_time(fn, features, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(features)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def check_model(name, model, features, batch_sizes, repeats):
+    estimator, _, _ = _unwrap(model)
+    reference = _anomaly_sign(estimator) * model_decision(model, features)
+    spread = float(np.std(reference)) or 1.0
+    anomaly_column = list(model.classes_).index(1) if hasattr(model, "predict_proba") else None
+    reference_probability = model.predict_proba(features)[:, anomaly_column] if anomaly_column is not None else None
+    result = {"model": name, "support_vectors": int(len(getattr(estimator, "support_vectors_", []))),
+              "heads": {}, "timings_ms": {}}
+
+    heads = {}
+    for method in methods_for(model):
+        head = export_head(model, method)
+        path = os.path.join(tempfile.gettempdir(), f"benchmark_scoring_head_{name}_{method}.npz")
+        head.save(path)
+        reloaded = load_head(path)
+        margin = head.decision(features)
+        error = float(np.max(np.abs(margin - reference)))
+        parity = {
+            "max_abs_error": round(error, 6),
+            "mean_abs_error": round(float(np.mean(np.abs(margin - reference))), 6),
+            "relative_error": round(error / spread, 6),
+            "sign_agreement": round(float(np.mean((margin > 0) == (reference > 0))), 5),
+            "reload_identical": bool(np.array_equal(reloaded.score(features), head.score(features))),
+        }
+        if reference_probability is not None:
+            parity["max_probability_error"] = round(float(np.max(np.abs(head.probability(features) - reference_probability))), 6)
+        if method in ("linear", "rbf"):
+            parity["passed"] = (parity["relative_error"] <= EXACT_TOLERANCE
+                                and parity["sign_agreement"] >= EXACT_SIGN_AGREEMENT and parity["reload_identical"]
+                                and parity.get("max_probability_error", 0.0) <= EXACT_TOLERANCE)
+        result["heads"][method] = parity
+        heads[method] = head
+
+    for batch_size in batch_sizes:
+        batch = features[np.arange(batch_size) % len(features)]
+        timings = {"sklearn_predict": best_time(estimator.predict, batch, repeats)}
+        for method, head in heads.items():
+            timings[method] = best_time(head.score, batch, repeats)
+        result["timings_ms"][batch_size] = {key: round(1000 * value, 3) for key, value in timings.items()}
+    return result
+
+
+def model_decision(model, features):
+    """decision_function of the underlying estimator (CalibratedClassifierCV doesn't expose one)"""
+    estimator, scaler, _ = _unwrap(model)
+    if scaler is not None:
+        features = (features - scaler[0]) / scaler[1]
+    return estimator.decision_function(features)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="joblib pickle to check (default: synthetic stand-ins)")
+    parser.add_argument("--features", help=".npy of held-out ResNet features (default: synthetic)")
+    parser.add_argument("--eval-count", type=int, default=2000, help="Synthetic held-out features")
+    parser.add_argument("--train-count", type=int, default=3000, help="Synthetic training features")
+    parser.add_argument("--batch-sizes", default="64,256,1024,4096")
+    parser.add_argument("--repeats", type=int, default=3, help="Timing runs per measurement; the best is kept")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.model:
+        models = {os.path.basename(args.model): joblib.load(args.model)}
+    else:
+        print("Training synthetic stand-in models...")
+        models = synthetic_models(rng, args.train_count)
+    if args.features:
+        features = np.load(args.features).astype(np.float32)
+    else:
+        features = synthetic_features(args.eval_count, rng)[0]
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+
+    results = [check_model(name, model, features, batch_sizes, args.repeats) for name, model in models.items()]
+
+    failed = False
+    for result in results:
+        print(f"\n{result['model']} ({result['support_vectors']} support vectors)")
+        print(f"  {'head':<10}{'max_err':>12}{'mean_err':>12}{'rel_err':>12}{'sign_agree':>12}{'prob_err':>12}  parity")
+        for method, parity in result["heads"].items():
+            status = {True: "PASS", False: "FAIL"}.get(parity.get("passed"), "approx")
+            failed = failed or parity.get("passed") is False
+            print(f"  {method:<10}{parity['max_abs_error']:>12}{parity['mean_abs_error']:>12}{parity['relative_error']:>12}"
+                  f"{parity['sign_agreement']:>12}{parity.get('max_probability_error', '-'):>12}  {status}")
+        methods = list(next(iter(result["timings_ms"].values())))
+        print(f"  {'batch':<10}" + "".join(f"{method + ' ms':>18}" for method in methods))
+        for batch_size, timings in result["timings_ms"].items():
+            print(f"  {batch_size:<10}" + "".join(f"{timings[method]:>18}" for method in methods))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
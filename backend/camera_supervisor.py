@@ -0,0 +1,356 @@
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from queue import Empty
+
+import psutil
+
+from rate_controller import AdaptiveRateController
+from rtspHandler import MultiCameraManager
+
+# --- SUPERVISOR CONFIGURATION ---
+STATUS_INTERVAL = 5.0             # Seconds between worker status reports
+RESTART_BASE_BACKOFF = 1.0        # First restart delay for a dead worker, doubled per consecutive crash
+RESTART_MAX_BACKOFF = 60.0
+RESTART_RESET_SECONDS = 120.0     # A worker alive this long has its crash count reset
+OVERLOAD_CPU_PERCENT = 85.0       # Per pinned core; above this a worker is overloaded
+REBALANCE_MARGIN_PERCENT = 25.0   # Target worker must be at least this much less loaded
+REBALANCE_COOLDOWN = 60.0         # Seconds between camera moves, so load can settle
+MIN_CAMERA_FPS = 1.0              # Bounds for the per-worker rate controller when a frame handler is set
+MAX_CAMERA_FPS = 10.0
+
+
+def pin_to_cores(cores):
+    """Restricts the current process to the given CPU cores where the platform allows it"""
+    try:
+        psutil.Process().cpu_affinity(list(cores))
+        return True
+    except (AttributeError, ValueError, psutil.Error):
+        return False  # Not supported on this platform (e.g. macOS)
+
+
+def _consume_frames(camera_name, capture, frame_handler, stop_event, controller):
+    """Calls frame_handler once for every new frame of one camera and reports the load to the rate controller"""
+    last_seq = 0
+    while not stop_event.is_set():
+        lease = capture.acquire_frame()
+        if lease is None or lease.seq == last_seq:
+            if lease is not None:
+                lease.release()
+            time.sleep(capture.target_frame_time / 2)
+            continue
+        skipped = lease.seq - last_seq - 1 if last_seq else 0
+        last_seq = lease.seq
+        work_start = time.perf_counter()
+        try:
+            frame_handler(camera_name, lease.frame, time.time())
+        except Exception as e:
+            print(f"⚠️ [PID:{os.getpid()}] [{camera_name}] Frame handler error: {e}")
+        finally:
+            lease.release()
+        controller.observe(camera_name, frames=1, busy_seconds=time.perf_counter() - work_start, skipped=skipped)
+
+
+def camera_worker(worker_id, cores, commands, status_queue, frame_handler=None, capture_kwargs=None):
+    """
+    Worker process: runs a MultiCameraManager for the cameras it is told to add,
+    optionally feeding every new frame to frame_handler(camera_name, frame, timestamp),
+    and reports its CPU load and per-camera FPS to the supervisor. With a frame handler,
+    an AdaptiveRateController sets each camera's sampling rate by its weight so the
+    handlers keep up on the worker's cores.
+    """
+    pid = os.getpid()
+    pinned = pin_to_cores(cores)
+    print(f"👷 [PID:{pid}] Camera worker {worker_id} started" + (f", pinned to cores {list(cores)}" if pinned else ""))
+
+    manager = MultiCameraManager()
+    consumers = {}
+    controller = AdaptiveRateController(parallelism=len(cores))
+    process = psutil.Process()
+    process.cpu_percent(None)  # Prime the counter
+    next_status = time.time() + STATUS_INTERVAL
+
+    def remove(camera_name):
+        if camera_name in consumers:
+            stop_event, thread = consumers.pop(camera_name)
+            stop_event.set()
+            thread.join(timeout=2)
+        controller.remove_camera(camera_name)
+        manager.remove_camera(camera_name)
+
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=max(0.0, next_status - time.time()))
+            except Empty:
+                command = None
+
+            if command is not None:
+                action = command[0]
+                if action == "stop":
+                    break
+                elif action == "add":
+                    _, camera_name, rtsp_url, weight = command
+                    if manager.add_camera(camera_name, rtsp_url, **(capture_kwargs or {})) and frame_handler:
+                        capture = manager.cameras[camera_name]
+                        controller.add_camera(camera_name, capture.set_required_fps, capture.required_fps,
+                                              MIN_CAMERA_FPS, MAX_CAMERA_FPS, weight)
+                        stop_event = threading.Event()
+                        thread = threading.Thread(target=_consume_frames, daemon=True, name=f"Consumer-{camera_name}",
+                                                  args=(camera_name, capture, frame_handler, stop_event, controller))
+                        thread.start()
+                        consumers[camera_name] = (stop_event, thread)
+                elif action == "remove":
+                    remove(command[1])
+
+            if time.time() >= next_status:
+                status_queue.put({
+                    "worker_id": worker_id,
+                    "pid": pid,
+                    # Normalized to the pinned cores, so 100% means the worker's share of the box is saturated
+                    "cpu_percent": process.cpu_percent(None) / max(1, len(cores)),
+                    "rss_mb": process.memory_info().rss / 1024 / 1024,
+                    "cameras": {
+                        name: {"fps": cam.get_fps(), "sampling_fps": cam.required_fps, "dead": cam.is_stream_dead(),
+                               **cam.get_recovery_stats()}
+                        for name, cam in manager.cameras.items()
+                    },
+                })
+                next_status = time.time() + STATUS_INTERVAL
+    finally:
+        for camera_name in list(consumers):
+            remove(camera_name)
+        manager.stop_all()
+        print(f"🛑 [PID:{pid}] Camera worker {worker_id} stopped")
+
+
+class CameraSupervisor:
+    """
+    Spreads cameras over worker processes, one per group of CPU cores, pins each
+    worker to its cores, restarts dead workers with exponential backoff and moves
+    cameras off workers that stay overloaded.
+
+    frame_handler, if given, must be a module-level function so it can be sent to
+    the workers; it is called in the worker process for every new frame. weights maps
+    camera names to their priority when a worker's rate controller shares out frame
+    rate (default 1.0).
+    """
+
+    def __init__(self, cameras, num_workers=None, frame_handler=None, capture_kwargs=None, weights=None):
+        self.camera_urls = dict(cameras)
+        self.camera_weights = dict(weights or {})
+        self.frame_handler = frame_handler
+        self.capture_kwargs = capture_kwargs or {}
+        cpu_count = psutil.cpu_count() or 1
+        self.num_workers = max(1, min(num_workers or cpu_count, cpu_count, len(self.camera_urls) or 1))
+        cores_per_worker = max(1, cpu_count // self.num_workers)
+        self.workers = {
+            worker_id: {
+                "cores": [(worker_id * cores_per_worker + i) % cpu_count for i in range(cores_per_worker)],
+                "process": None,
+                "commands": None,
+                "cameras": set(),
+                "crashes": 0,
+                "started_at": 0.0,
+                "restart_at": None,
+                "status": None,
+            }
+            for worker_id in range(self.num_workers)
+        }
+        self.assignments = {}
+        self.status_queue = multiprocessing.Queue()
+        self.running = False
+        self.last_rebalance = 0.0
+        self.lock = threading.Lock()
+        self.monitor_thread = None
+        self.process_id = os.getpid()
+
+    # --- worker lifecycle ---
+    def _spawn(self, worker_id):
+        worker = self.workers[worker_id]
+        worker["commands"] = multiprocessing.Queue()
+        worker["process"] = multiprocessing.Process(
+            target=camera_worker,
+            args=(worker_id, worker["cores"], worker["commands"], self.status_queue,
+                  self.frame_handler, self.capture_kwargs),
+            name=f"CameraWorker-{worker_id}",
+            daemon=True,
+        )
+        worker["process"].start()
+        worker["started_at"] = time.time()
+        worker["restart_at"] = None
+        worker["status"] = None
+        for camera_name in sorted(worker["cameras"]):
+            worker["commands"].put(("add", camera_name, self.camera_urls[camera_name],
+                                    self.camera_weights.get(camera_name, 1.0)))
+
+    def _least_loaded_worker(self, exclude=None):
+        candidates = [w for w in self.workers if w != exclude]
+        return min(candidates, key=lambda w: (len(self.workers[w]["cameras"]), w)) if candidates else None
+
+    def start(self):
+        self.running = True
+        for camera_name in self.camera_urls:
+            worker_id = self._least_loaded_worker()
+            self.workers[worker_id]["cameras"].add(camera_name)
+            self.assignments[camera_name] = worker_id
+        for worker_id in self.workers:
+            self._spawn(worker_id)
+        self.monitor_thread = threading.Thread(target=self._monitor, daemon=True, name="CameraSupervisor")
+        self.monitor_thread.start()
+        print(f"🎮 [PID:{self.process_id}] Supervising {len(self.camera_urls)} cameras across {self.num_workers} workers")
+
+    def stop(self):
+        self.running = False
+        if self.monitor_thread:
+            self.monitor_thread.join(timeout=STATUS_INTERVAL + 1)
+        for worker in self.workers.values():
+            if worker["process"] is not None and worker["process"].is_alive():
+                worker["commands"].put(("stop",))
+        for worker in self.workers.values():
+            if worker["process"] is not None:
+                worker["process"].join(timeout=10)
+                if worker["process"].is_alive():
+                    worker["process"].terminate()
+        print(f"🛑 [PID:{self.process_id}] Camera supervisor stopped")
+
+    # --- camera placement ---
+    def add_camera(self, camera_name, rtsp_url, weight=1.0):
+        with self.lock:
+            self.camera_urls[camera_name] = rtsp_url
+            self.camera_weights[camera_name] = weight
+            worker_id = self._least_loaded_worker()
+            self.workers[worker_id]["cameras"].add(camera_name)
+            self.assignments[camera_name] = worker_id
+            if self.running and self.workers[worker_id]["restart_at"] is None:
+                self.workers[worker_id]["commands"].put(("add", camera_name, rtsp_url, weight))
+
+    def remove_camera(self, camera_name):
+        with self.lock:
+            worker_id = self.assignments.pop(camera_name, None)
+            self.camera_urls.pop(camera_name, None)
+            self.camera_weights.pop(camera_name, None)
+            if worker_id is not None:
+                self.workers[worker_id]["cameras"].discard(camera_name)
+                if self.running and self.workers[worker_id]["restart_at"] is None:
+                    self.workers[worker_id]["commands"].put(("remove", camera_name))
+
+    def move_camera(self, camera_name, target_worker):
+        with self.lock:
+            source_worker = self.assignments[camera_name]
+            if source_worker == target_worker:
+                return
+            self.workers[source_worker]["cameras"].discard(camera_name)
+            self.workers[source_worker]["commands"].put(("remove", camera_name))
+            self.workers[target_worker]["cameras"].add(camera_name)
+            self.workers[target_worker]["commands"].put(("add", camera_name, self.camera_urls[camera_name],
+                                                         self.camera_weights.get(camera_name, 1.0)))
+            self.assignments[camera_name] = target_worker
+        print(f"🔀 [PID:{self.process_id}] Moved camera {camera_name} from worker {source_worker} to worker {target_worker}")
+
+    # --- monitoring ---
+    def _monitor(self):
+        while self.running:
+            deadline = time.time() + STATUS_INTERVAL
+            while time.time() < deadline:
+                try:
+                    status = self.status_queue.get(timeout=max(0.0, deadline - time.time()))
+                except Empty:
+                    break
+                worker = self.workers.get(status["worker_id"])
+                if worker and worker["process"] is not None and worker["process"].pid == status["pid"]:
+                    worker["status"] = status
+            if not self.running:
+                break
+            with self.lock:
+                self._check_workers()
+            self._rebalance()
+
+    def _check_workers(self):
+        now = time.time()
+        for worker_id, worker in self.workers.items():
+            if worker["restart_at"] is not None:
+                if now >= worker["restart_at"]:
+                    print(f"♻️ [PID:{self.process_id}] Restarting camera worker {worker_id}")
+                    self._spawn(worker_id)
+                continue
+            if worker["process"].is_alive():
+                if worker["crashes"] and now - worker["started_at"] >= RESTART_RESET_SECONDS:
+                    worker["crashes"] = 0
+                continue
+            delay = min(RESTART_MAX_BACKOFF, RESTART_BASE_BACKOFF * (2 ** worker["crashes"]))
+            worker["crashes"] += 1
+            worker["restart_at"] = now + delay
+            print(f"💥 [PID:{self.process_id}] Camera worker {worker_id} died (exit code {worker['process'].exitcode}); "
+                  f"restarting in {delay:.0f}s with cameras {sorted(worker['cameras'])}")
+
+    def _rebalance(self):
+        """Moves one camera from the busiest overloaded worker to a clearly less loaded one"""
+        if time.time() - self.last_rebalance < REBALANCE_COOLDOWN:
+            return
+        loads = {
+            worker_id: worker["status"]["cpu_percent"]
+            for worker_id, worker in self.workers.items()
+            if worker["status"] is not None and worker["restart_at"] is None
+        }
+        if len(loads) < 2:
+            return
+        busiest = max(loads, key=loads.get)
+        idlest = min(loads, key=loads.get)
+        if (loads[busiest] < OVERLOAD_CPU_PERCENT or loads[busiest] - loads[idlest] < REBALANCE_MARGIN_PERCENT
+                or len(self.workers[busiest]["cameras"]) < 2):
+            return
+        # Move the busiest camera by frame rate; it carries the most decode work
+        camera_stats = self.workers[busiest]["status"]["cameras"]
+        candidates = [name for name in self.workers[busiest]["cameras"] if name in camera_stats]
+        if not candidates:
+            return
+        camera_name = max(candidates, key=lambda name: camera_stats[name]["fps"])
+        self.move_camera(camera_name, idlest)
+        self.last_rebalance = time.time()
+        # Stale reports would trigger another move before the new load shows up
+        self.workers[busiest]["status"] = None
+        self.workers[idlest]["status"] = None
+
+    def get_status(self):
+        with self.lock:
+            return {
+                worker_id: {
+                    "pid": worker["process"].pid if worker["process"] is not None else None,
+                    "alive": worker["process"] is not None and worker["process"].is_alive(),
+                    "cores": worker["cores"],
+                    "cameras": sorted(worker["cameras"]),
+                    "crashes": worker["crashes"],
+                    "last_status": worker["status"],
+                }
+                for worker_id, worker in self.workers.items()
+            }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python camera_supervisor.py cameras.json  (a JSON object of camera_name -> rtsp_url)")
+        return
+    with open(sys.argv[1], "r") as f:
+        cameras = json.load(f)
+
+    supervisor = CameraSupervisor(cameras)
+    supervisor.start()
+    try:
+        while True:
+            time.sleep(STATUS_INTERVAL * 3)
+            for worker_id, status in supervisor.get_status().items():
+                last = status["last_status"] or {}
+                print(f"📊 [PID:{supervisor.process_id}] Worker {worker_id}: alive={status['alive']} "
+                      f"CPU={last.get('cpu_percent', 0):.1f}% cameras={status['cameras']}")
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# File: feature_store.py
+"""
+Append-only store of the ResNet50 frame features the anomaly pipeline already computes,
+searchable by visual similarity.
+
+    FEATURE_STORE_DIR/<YYYY-MM-DD>/<camera>-<projection>/
+        meta.json      camera, day, vector dimension and projection id
+        vectors.f16    float16 rows, L2-normalized after the projection
+        rows.bin       per-row capture timestamp (float64) and anomaly score (float32)
+    FEATURE_STORE_DIR/projections/<projection>.npz
+
+Rows are only ever appended. A crash can leave one file a partial row longer than the
+other; readers use the shorter of the two, and the writer truncates the extra bytes.
+The projection is a PCA fitted on stored features (FEATURE_PCA_PATH, see fit-pca), or
+"raw" for the full 2048-d vectors before one exists. Because the projection id is part
+of the partition name, fitting a new PCA starts new partitions and never mixes spaces.
+
+The store is off unless FEATURE_STORE_ENABLED=1. Raw rows take about 1.7 GB per camera
+per day at 5 fps, a 256-component PCA an eighth of that, so run the pipeline raw only
+long enough to fit the PCA. Writers delete days older than FEATURE_RETENTION_DAYS when
+they roll over to a new day; readers unmap them.
+
+Usage: python feature_store.py status
+       python feature_store.py fit-pca [--components 256] [--sample 200000]
+       python feature_store.py retention [--days 90]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from index_shards import SHARD_RETENTION_DAYS, retention_cutoff, safe_name
+
+# --- FEATURE STORE CONFIGURATION ---
+FEATURE_STORE_ENABLED = os.getenv("FEATURE_STORE_ENABLED", "0") == "1"
+FEATURE_RETENTION_DAYS = int(os.getenv("FEATURE_RETENTION_DAYS", str(SHARD_RETENTION_DAYS)))
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "visual_features")
+FEATURE_PCA_PATH = os.getenv("FEATURE_PCA_PATH", "./weights/feature_pca.npz")
+FEATURE_PCA_COMPONENTS = 256
+FEATURE_SCAN_CHUNK = 65536  # Rows converted to float32 at a time while scanning a partition
+ROW_DTYPE = np.dtype([("timestamp", "<f8"), ("score", "<f4")])
+VECTOR_DTYPE = np.dtype("<f2")
+
+
+# --- PROJECTIONS ---
+def _normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class Projection:
+    """
+    L2 normalization, then optionally a PCA (mean, components) and normalization again, so
+    inner product is cosine similarity. The PCA is fitted on normalized "raw" rows.
+    """
+    def __init__(self, mean=None, components=None):
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.asarray(components, dtype=np.float32)
+        if self.components is None:
+            self.id = "raw"
+        else:
+            self.id = hashlib.sha1(self.mean.tobytes() + self.components.tobytes()).hexdigest()[:12]
+
+    def apply(self, features):
+        vectors = _normalize(np.asarray(features, dtype=np.float32).reshape(len(features), -1))
+        if self.components is not None:
+            vectors = _normalize((vectors - self.mean) @ self.components.T)
+        return vectors
+
+    def save(self, path):
+        if self.components is not None:
+            tmp_path = path + ".tmp.npz"
+            np.savez(tmp_path, mean=self.mean, components=self.components)
+            os.replace(tmp_path, path)
+
+
+def load_projection(path):
+    if not os.path.exists(path):
+        return Projection()
+    with np.load(path) as data:
+        return Projection(data["mean"], data["components"])
+
+
+def fit_pca(features, components=FEATURE_PCA_COMPONENTS):
+    """PCA of a (rows, dim) sample via SVD of the centered data"""
+    features = np.asarray(features, dtype=np.float32)
+    mean = features.mean(axis=0)
+    _, singular_values, vt = np.linalg.svd(features - mean, full_matrices=False)
+    components = min(components, vt.shape[0])
+    explained = float((singular_values[:components] ** 2).sum() / (singular_values ** 2).sum())
+    return Projection(mean, vt[:components]), explained
+
+
+# --- WRITER ---
+class FeatureWriter:
+    """Appends one camera's frame features to the store, rolling over to a new partition every day"""
+    def __init__(self, camera_name, root=FEATURE_STORE_DIR, projection=None):
+        self.camera_name = camera_name
+        self.root = root
+        self.projection = projection if projection is not None else load_projection(FEATURE_PCA_PATH)
+        projections_dir = os.path.join(root, "projections")
+        os.makedirs(projections_dir, exist_ok=True)
+        self.projection.save(os.path.join(projections_dir, f"{self.projection.id}.npz"))
+        self.day = None
+        self.vectors_file = None
+        self.rows_file = None
+        if self.projection.id == "raw":
+            print(f"⚠️ [{camera_name}] No PCA at {FEATURE_PCA_PATH}; storing full 2048-d features "
+                  "(~1.7 GB per camera per day). Fit one with: python feature_store.py fit-pca")
+
+    def append(self, features, timestamps, scores):
+        """Stores one row per frame: its projected feature, capture time (epoch seconds) and anomaly score"""
+        if len(features) == 0:
+            return
+        vectors = self.projection.apply(features).astype(VECTOR_DTYPE)
+        rows = np.empty(len(vectors), dtype=ROW_DTYPE)
+        rows["timestamp"] = timestamps
+        rows["score"] = scores
+        days = [datetime.date.fromtimestamp(ts).isoformat() for ts in rows["timestamp"]]
+        start = 0
+        for end in range(1, len(days) + 1):  # A stride can straddle midnight
+            if end == len(days) or days[end] != days[start]:
+                self._open(days[start], vectors.shape[1])
+                # Readers only count rows that are complete in both files
+                self.vectors_file.write(vectors[start:end].tobytes())
+                self.rows_file.write(rows[start:end].tobytes())
+                start = end
+        self.vectors_file.flush()
+        self.rows_file.flush()
+
+    def _open(self, day, dim):
+        if day == self.day:
+            return
+        self.close()
+        expire(self.root)  # Once per writer and day; other writers' passes find nothing left to delete
+        partition = os.path.join(self.root, day, f"{safe_name(self.camera_name)}-{self.projection.id}")
+        os.makedirs(partition, exist_ok=True)
+        meta_path = os.path.join(partition, "meta.json")
+        if not os.path.exists(meta_path):
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump({"camera": self.camera_name, "day": day, "dim": dim, "projection": self.projection.id}, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        vectors_path, rows_path = os.path.join(partition, "vectors.f16"), os.path.join(partition, "rows.bin")
+        count = _row_count(vectors_path, rows_path, dim)
+        for path, row_size in ((vectors_path, dim * VECTOR_DTYPE.itemsize), (rows_path, ROW_DTYPE.itemsize)):
+            if os.path.exists(path) and os.path.getsize(path) != count * row_size:
+                os.truncate(path, count * row_size)  # Drop a torn row left by a crash
+        self.vectors_file = open(vectors_path, "ab")
+        self.rows_file = open(rows_path, "ab")
+        self.day = day
+
+    def close(self):
+        for f in (self.vectors_file, self.rows_file):
+            if f is not None:
+                f.close()
+        self.vectors_file = self.rows_file = None
+        self.day = None
+
+
+def _row_count(vectors_path, rows_path, dim):
+    try:
+        return min(os.path.getsize(vectors_path) // (dim * VECTOR_DTYPE.itemsize),
+                   os.path.getsize(rows_path) // ROW_DTYPE.itemsize)
+    except OSError:
+        return 0
+
+
+# --- READER ---
+class FeaturePartition:
+    """Memory-mapped rows of one partition; refresh() maps rows appended since"""
+    def __init__(self, path, meta):
+        self.path = path
+        self.camera = meta["camera"]
+        self.day = meta["day"]
+        self.dim = meta["dim"]
+        self.projection = meta["projection"]
+        self.count = 0
+        self.vectors = np.empty((0, self.dim), dtype=VECTOR_DTYPE)
+        self.rows = np.empty(0, dtype=ROW_DTYPE)
+
+    def refresh(self):
+        vectors_path, rows_path = os.path.join(self.path, "vectors.f16"), os.path.join(self.path, "rows.bin")
+        count = _row_count(vectors_path, rows_path, self.dim)
+        if count != self.count:
+            self.vectors = np.memmap(vectors_path, dtype=VECTOR_DTYPE, mode="r", shape=(count, self.dim)) \
+                if count else np.empty((0, self.dim), dtype=VECTOR_DTYPE)
+            self.rows = np.memmap(rows_path, dtype=ROW_DTYPE, mode="r", shape=(count,)) \
+                if count else np.empty(0, dtype=ROW_DTYPE)
+            self.count = count  # Set last: a concurrent search that sees it also sees the maps that cover it
+        return self
+
+    def close(self):
+        """Unmaps the files; searches already running keep their own references"""
+        self.count = 0
+        self.vectors = np.empty((0, self.dim), dtype=VECTOR_DTYPE)
+        self.rows = np.empty(0, dtype=ROW_DTYPE)
+
+    def search(self, query, k, start_ts=-np.inf, end_ts=np.inf):
+        """(similarities, row numbers) of the k rows closest to a projected, normalized query"""
+        count = self.count
+        vectors, timestamps = self.vectors, self.rows["timestamp"]
+        best_sims, best_rows = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        for lo in range(0, count, FEATURE_SCAN_CHUNK):
+            hi = min(lo + FEATURE_SCAN_CHUNK, count)
+            sims = vectors[lo:hi].astype(np.float32) @ query
+            chunk_timestamps = timestamps[lo:hi]
+            sims[(chunk_timestamps < start_ts) | (chunk_timestamps > end_ts)] = -np.inf
+            if len(sims) > k:
+                top = np.argpartition(-sims, k)[:k]
+            else:
+                top = np.arange(len(sims))
+            best_sims = np.concatenate([best_sims, sims[top]])
+            best_rows = np.concatenate([best_rows, top + lo])
+            if len(best_sims) > k:
+                keep = np.argpartition(-best_sims, k)[:k]
+                best_sims, best_rows = best_sims[keep], best_rows[keep]
+        found = np.isfinite(best_sims)
+        return best_sims[found], best_rows[found]
+
+
+class FeatureIndex:
+    """Reader side of the store; partitions are discovered and refreshed on every lookup"""
+    def __init__(self, root=FEATURE_STORE_DIR):
+        self.root = root
+        self.partitions = {}
+        self.projections = {"raw": Projection()}
+
+    def projection(self, projection_id):
+        if projection_id not in self.projections:
+            self.projections[projection_id] = load_projection(
+                os.path.join(self.root, "projections", f"{projection_id}.npz"))
+        return self.projections[projection_id]
+
+    def select(self, camera=None, start_ts=-np.inf, end_ts=np.inf):
+        """Partitions of the camera whose day can overlap [start_ts, end_ts], with their newest rows mapped"""
+        first_day = datetime.date.fromtimestamp(start_ts).isoformat() if np.isfinite(start_ts) else ""
+        last_day = datetime.date.fromtimestamp(end_ts).isoformat() if np.isfinite(end_ts) else "9999"
+        days = sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []
+        self.forget_missing(days)
+        cutoff = retention_cutoff(FEATURE_RETENTION_DAYS)
+        selected = []
+        for day in days:
+            if day == "projections" or day < cutoff or not first_day <= day <= last_day:
+                continue
+            for name in os.listdir(os.path.join(self.root, day)):
+                path = os.path.join(self.root, day, name)
+                partition = self.partitions.get(path)
+                if partition is None:
+                    try:
+                        with open(os.path.join(path, "meta.json"), "r") as f:
+                            partition = self.partitions[path] = FeaturePartition(path, json.load(f))
+                    except (OSError, ValueError):
+                        continue  # Being created
+                if camera is None or partition.camera == camera:
+                    selected.append(partition.refresh())
+        return selected
+
+    def frame_vector(self, camera, timestamp):
+        """(projection id, stored vector) of the camera's frame captured closest to timestamp, or None"""
+        best = None
+        for partition in self.select(camera, timestamp - 86400, timestamp + 86400):
+            if not partition.count:
+                continue
+            i = int(np.argmin(np.abs(partition.rows["timestamp"] - timestamp)))
+            gap = abs(float(partition.rows["timestamp"][i]) - timestamp)
+            if best is None or gap < best[0]:
+                best = (gap, partition.projection, np.asarray(partition.vectors[i], dtype=np.float32))
+        return None if best is None else best[1:]
+
+    def forget_missing(self, days=None):
+        """
+        Drops and unmaps the partitions of days that were deleted or are past retention
+        (days: the day directory names, as listed by select()); an open map would keep
+        Windows from deleting them
+        """
+        if days is None:
+            days = os.listdir(self.root) if os.path.isdir(self.root) else []
+        days, cutoff = set(days), retention_cutoff(FEATURE_RETENTION_DAYS)
+        for path, partition in list(self.partitions.items()):
+            if partition.day not in days or partition.day < cutoff:
+                del self.partitions[path]
+                partition.close()
+
+
+def expire(root=FEATURE_STORE_DIR, days=FEATURE_RETENTION_DAYS, today=None):
+    """Deletes the day directories older than the retention window"""
+    cutoff = retention_cutoff(days, today)
+    expired = [day for day in (os.listdir(root) if os.path.isdir(root) else [])
+               if day != "projections" and day < cutoff]
+    for day in expired:
+        shutil.rmtree(os.path.join(root, day), ignore_errors=True)
+    if expired:
+        print(f"🗑️ Feature store retention: removed {len(expired)} days older than {cutoff}.")
+    return expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "fit-pca", "retention"])
+    parser.add_argument("--root", default=FEATURE_STORE_DIR)
+    parser.add_argument("--components", type=int, default=FEATURE_PCA_COMPONENTS)
+    parser.add_argument("--sample", type=int, default=200000, help="Raw rows to fit the PCA on")
+    parser.add_argument("--output", default=FEATURE_PCA_PATH)
+    parser.add_argument("--days", type=int, default=FEATURE_RETENTION_DAYS, help="Days of features to keep")
+    args = parser.parse_args()
+
+    index = FeatureIndex(args.root)
+    partitions = index.select()
+    if args.command == "fit-pca":
+        raw = [partition for partition in partitions if partition.projection == "raw" and partition.count]
+        if not raw:
+            raise SystemExit(f"No raw features in '{args.root}' yet; run the pipeline without a PCA first.")
+        rng = np.random.default_rng(0)
+        total = sum(partition.count for partition in raw)
+        sample = np.concatenate([
+            np.asarray(partition.vectors[np.sort(rng.choice(
+                partition.count, min(partition.count, max(1, args.sample * partition.count // total)),
+                replace=False))], dtype=np.float32)
+            for partition in raw])
+        projection, explained = fit_pca(sample, args.components)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        projection.save(args.output)
+        print(f"✅ PCA {projection.id}: {projection.components.shape[0]} components from {len(sample)} rows, "
+              f"{explained:.1%} of the variance. Saved to {args.output}; restart the pipeline to use it.")
+        return
+    if args.command == "retention":
+        expire(args.root, args.days)
+        partitions = index.select()
+
+    print(f"{len(partitions)} partitions, {sum(partition.count for partition in partitions)} frames")
+    for partition in partitions:
+        print(f"  {partition.day}  {partition.camera:<30}{partition.count:>10} frames  "
+              f"{partition.dim}-d  projection {partition.projection}")
+
+
+if __name__ == "__main__":
+    main()
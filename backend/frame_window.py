@@ -0,0 +1,105 @@
+import numpy as np
+
+
+class FrameWindow:
+    """
+    Preallocated window of resized frames and their capture timestamps.
+
+    Frames are written straight into the buffer (see next_slot) and batches are
+    handed out as contiguous views, so the pipeline creates no per-frame objects
+    and inference reads the batch without stacking a copy first.
+    """
+
+    def __init__(self, capacity, frame_shape=(224, 224, 3)):
+        self.capacity = capacity
+        self.frames = np.empty((capacity, *frame_shape), dtype=np.uint8)
+        self.timestamps = np.empty(capacity, dtype=np.float64)  # Epoch seconds
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def next_slot(self):
+        """
+        Returns the buffer slot the next frame should be written into, e.g. as the
+        dst of cv2.resize. The frame becomes part of the window on commit().
+        """
+        if self.end == self.capacity:
+            self._compact()
+        return self.frames[self.end]
+
+    def commit(self, timestamp):
+        self.timestamps[self.end] = timestamp
+        self.end += 1
+
+    def append(self, frame, timestamp):
+        np.copyto(self.next_slot(), frame)
+        self.commit(timestamp)
+
+    def peek(self, count, offset=0):
+        """
+        Zero-copy views of `count` frames and timestamps starting `offset` frames after
+        the oldest one. Views stay valid until the next frame is written.
+        """
+        lo = self.start + offset
+        return self.frames[lo:lo + count], self.timestamps[lo:lo + count]
+
+    def consume(self, count):
+        """Drops the oldest `count` frames"""
+        self.start = min(self.start + count, self.end)
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def _compact(self):
+        # Only the frames not yet consumed move, and it happens once every (capacity - len) frames
+        pending = self.end - self.start
+        if pending == self.capacity:
+            raise OverflowError(f"FrameWindow is full ({self.capacity} frames); consume() frames before adding more")
+        self.frames[:pending] = self.frames[self.start:self.end]
+        self.timestamps[:pending] = self.timestamps[self.start:self.end]
+        self.start, self.end = 0, pending
+
+
+class ScoreWindow:
+    """
+    Sliding window over the last `size` per-frame anomaly scores.
+
+    Scores arrive a stride at a time as frames are scored; after each stride the window
+    decides whether the scene is anomalous: at least `min_fraction` of `size` frames
+    scored above `threshold`. A lone misclassified frame can't raise an alert, and a
+    real event is caught as soon as enough of its frames have been scored.
+    """
+
+    def __init__(self, size, threshold=0.0, min_fraction=0.3):
+        self.size = size
+        self.threshold = threshold
+        self.required = max(1, int(np.ceil(min_fraction * size)))
+        self.scores = np.zeros(size, dtype=np.float32)
+        self.count = 0  # Scores held, up to size
+        self.pos = 0    # Ring position of the next score
+
+    def __len__(self):
+        return self.count
+
+    def add(self, scores):
+        scores = np.asarray(scores, dtype=np.float32)[-self.size:]
+        end = self.pos + len(scores)
+        if end <= self.size:
+            self.scores[self.pos:end] = scores
+        else:
+            split = self.size - self.pos
+            self.scores[self.pos:] = scores[:split]
+            self.scores[:end - self.size] = scores[split:]
+        self.pos = end % self.size
+        self.count = min(self.size, self.count + len(scores))
+
+    def anomalous_count(self):
+        # Until the ring wraps, the scores held are the first `count` slots
+        return int(np.count_nonzero(self.scores[:self.count] > self.threshold))
+
+    def is_anomalous(self):
+        return self.anomalous_count() >= self.required
+
+    def clear(self):
+        self.count = self.pos = 0
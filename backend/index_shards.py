@@ -0,0 +1,307 @@
+# File: index_shards.py
+"""
+Video library stored as shards, one FAISS index + metadata file per day and camera.
+
+    SHARD_DIR/manifest.json                      generation and published version of every shard
+    SHARD_DIR/<YYYY-MM-DD>/<camera>/index.<version>.faiss
+    SHARD_DIR/<YYYY-MM-DD>/<camera>/metadata.<version>.json
+
+A shard's files are written once, under a new version, and never modified; replacing the
+manifest publishes them. search_api.py therefore always reads complete shards and only
+reloads the ones whose version changed, indexing.py only rewrites the shards a video
+touches, and retention drops whole days by removing them from the manifest and deleting
+their directories, along with their segments' previews and cached clips.
+
+Shards group segments by camera. A video's camera is the `camera` group of
+CAMERA_NAME_PATTERN matched against its file name ('gate_2025-09-10_10-00.mp4' -> 'gate');
+videos whose name doesn't match are assigned to the folder they are in.
+
+Usage: python index_shards.py status
+       python index_shards.py retention [--days 90]
+       python index_shards.py migrate [--index video_library.faiss --metadata video_library_metadata.json]
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+# --- SHARD CONFIGURATION ---
+SHARD_DIR = os.getenv("SHARD_DIR", "video_library_shards")
+SHARD_RETENTION_DAYS = int(os.getenv("SHARD_RETENTION_DAYS", "90"))
+SHARD_LOCK_TIMEOUT = 60        # Seconds a writer waits for another writer (indexing vs a retention cron)
+SHARD_LOCK_STALE_SECONDS = 600  # A lock older than this was left by a crashed writer
+LEGACY_INDEX_PATH = "video_library.faiss"
+LEGACY_METADATA_PATH = "video_library_metadata.json"
+SHARD_FILE_PATTERN = re.compile(r"^(index|metadata)\.(\d+)\.(faiss|json)$")
+CAMERA_NAME_PATTERN = re.compile(os.getenv("CAMERA_NAME_PATTERN", r"^(?P<camera>.+?)[ _-]\d{4}-?\d{2}-?\d{2}"))
+# Segment assets outside the shards; written by indexing.py (previews) and search_api.py (clips)
+PREVIEW_DIR = os.getenv("PREVIEW_DIR", "video_library_previews")
+CLIP_CACHE_DIR = os.getenv("CLIP_CACHE_DIR", tempfile.gettempdir())
+
+
+def camera_id_for(video_path):
+    """The camera that recorded a video, from its file name or else its folder (see the module docstring)"""
+    match = CAMERA_NAME_PATTERN.search(os.path.basename(video_path))
+    if match:
+        return match.groupdict().get("camera") or match.group(0)
+    return os.path.basename(os.path.dirname(os.path.abspath(video_path))) or "_"
+
+
+def camera_name_for(metadata):
+    """Entries written before cameras were tracked get the camera their video path maps to"""
+    return metadata.get("camera") or camera_id_for(metadata["video_path"])
+
+
+def video_key(video_path):
+    """'<stem>-<hash of the absolute path>', which keeps same-named videos in different folders apart"""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return f"{stem}-{hashlib.sha1(os.path.abspath(video_path).encode('utf-8')).hexdigest()[:8]}"
+
+
+def clip_cache_path(video_path, start_frame):
+    """Where search_api caches the clip cut for a segment"""
+    key = hashlib.sha1(f"{video_path}:{start_frame}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(CLIP_CACHE_DIR, f"clip_{key}.mp4")
+
+
+def safe_name(name):
+    """A camera name made safe to use as a directory name"""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name).strip(".") or "_"
+
+
+def shard_id_for(metadata):
+    """'<YYYY-MM-DD>/<camera>' of the day the segment starts on"""
+    return f"{metadata['absolute_start_time'][:10]}/{safe_name(camera_name_for(metadata))}"
+
+
+def shard_files(root, shard_id, version):
+    """(index path, metadata path) of one version of a shard"""
+    shard_dir = os.path.join(root, *shard_id.split("/"))
+    return (os.path.join(shard_dir, f"index.{version}.faiss"),
+            os.path.join(shard_dir, f"metadata.{version}.json"))
+
+
+def read_manifest(root=SHARD_DIR):
+    """The published manifest, or None for a library that hasn't been sharded yet"""
+    try:
+        with open(os.path.join(root, "manifest.json"), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def retention_cutoff(days=SHARD_RETENTION_DAYS, today=None):
+    """First day ('YYYY-MM-DD') that is still kept"""
+    today = today or datetime.date.today()
+    return (today - datetime.timedelta(days=days)).isoformat()
+
+
+class ShardStore:
+    """
+    Writer side of the sharded library. Every change re-reads the manifest under a lock
+    file, writes new shard versions, then publishes the next generation.
+    """
+    def __init__(self, root=SHARD_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def manifest(self):
+        return read_manifest(self.root) or {"generation": 0, "shards": {}}
+
+    def indexed_videos(self):
+        return {video for info in self.manifest()["shards"].values() for video in info["videos"]}
+
+    @contextmanager
+    def _locked(self):
+        lock_path = os.path.join(self.root, "manifest.lock")
+        deadline = time.time() + SHARD_LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > SHARD_LOCK_STALE_SECONDS:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue  # Released in the meantime
+                if time.time() > deadline:
+                    raise TimeoutError(f"Another process holds {lock_path}")
+                time.sleep(0.2)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            yield self.manifest()
+        finally:
+            os.remove(lock_path)
+
+    def _publish(self, manifest):
+        tmp_path = os.path.join(self.root, "manifest.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(self.root, "manifest.json"))
+
+    def add(self, embeddings, metadata):
+        """Appends entries to their day/camera shards; only those shards are rewritten"""
+        if not len(embeddings):
+            return []
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        groups = {}
+        for i, entry in enumerate(metadata):
+            groups.setdefault(shard_id_for(entry), []).append(i)
+
+        with self._locked() as manifest:
+            version = manifest["generation"] + 1
+            previous_versions = {}
+            for shard_id, rows in groups.items():
+                entries = [metadata[i] for i in rows]
+                info = manifest["shards"].get(shard_id)
+                if info is None:
+                    index, shard_metadata = faiss.IndexFlatL2(embeddings.shape[1]), []
+                    info = {"day": shard_id.split("/")[0], "camera": camera_name_for(entries[0]), "videos": []}
+                else:
+                    index_path, metadata_path = shard_files(self.root, shard_id, info["version"])
+                    index = faiss.read_index(index_path)
+                    with open(metadata_path, "r") as f:
+                        shard_metadata = json.load(f)
+                    previous_versions[shard_id] = info["version"]
+                index.add(embeddings[rows])
+                shard_metadata.extend(entries)
+
+                index_path, metadata_path = shard_files(self.root, shard_id, version)
+                os.makedirs(os.path.dirname(index_path), exist_ok=True)
+                faiss.write_index(index, index_path)
+                with open(metadata_path, "w") as f:
+                    json.dump(shard_metadata, f, indent=2)
+                manifest["shards"][shard_id] = {
+                    **info,
+                    "version": version,
+                    "entries": index.ntotal,
+                    "min_start": min(m["absolute_start_time"] for m in shard_metadata),
+                    "max_end": max(m["absolute_end_time"] for m in shard_metadata),
+                    "videos": sorted(set(info["videos"]) | {m["video_path"] for m in entries}),
+                }
+            manifest["generation"] = version
+            self._publish(manifest)
+
+        # The version just replaced stays on disk for readers that are still loading it
+        for shard_id in groups:
+            self._prune_versions(shard_id, {version, previous_versions.get(shard_id)})
+        return sorted(groups)
+
+    def _prune_versions(self, shard_id, keep):
+        shard_dir = os.path.dirname(shard_files(self.root, shard_id, 0)[0])
+        for name in os.listdir(shard_dir):
+            match = SHARD_FILE_PATTERN.match(name)
+            if match and int(match.group(2)) not in keep:
+                try:
+                    os.remove(os.path.join(shard_dir, name))
+                except OSError:
+                    pass
+
+    def _segment_files(self, shard_id, info):
+        """(preview images, cached clips) of a shard's segments"""
+        try:
+            with open(shard_files(self.root, shard_id, info["version"])[1], "r") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return [], []
+        previews, clips = [], []
+        for entry in metadata:
+            clips.append(clip_cache_path(entry["video_path"], entry["start_frame"]))
+            if entry.get("thumbnail"):
+                previews.append(os.path.join(PREVIEW_DIR, entry["thumbnail"]))
+            if entry.get("sprite"):
+                previews.append(os.path.join(PREVIEW_DIR, entry["sprite"]["path"]))
+        return previews, clips
+
+    def expire(self, days=SHARD_RETENTION_DAYS, today=None):
+        """Unpublishes and deletes every shard of a day older than the retention window, with its segments' assets"""
+        cutoff = retention_cutoff(days, today)
+        with self._locked() as manifest:
+            expired = [shard_id for shard_id, info in manifest["shards"].items() if info["day"] < cutoff]
+            if not expired:
+                return []
+            previews, clips = [], []
+            for shard_id in expired:
+                shard_previews, shard_clips = self._segment_files(shard_id, manifest["shards"][shard_id])
+                previews.extend(shard_previews)
+                clips.extend(shard_clips)
+            for shard_id in expired:
+                del manifest["shards"][shard_id]
+            manifest["generation"] += 1
+            self._publish(manifest)
+
+        for shard_id in expired:
+            shutil.rmtree(os.path.dirname(shard_files(self.root, shard_id, 0)[0]), ignore_errors=True)
+        removed = 0
+        for path in previews + clips:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass  # Clips are only cached once someone played them
+        empty_dirs = {os.path.join(self.root, shard_id.split("/")[0]) for shard_id in expired}
+        empty_dirs |= {os.path.dirname(path) for path in previews}
+        for directory in empty_dirs:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass  # Still holds other cameras' shards of that day, or a video's later previews
+        print(f"🗑️ Retention: removed {len(expired)} shards older than {cutoff} and {removed} preview/clip files.")
+        return expired
+
+    def migrate_legacy(self, index_path=LEGACY_INDEX_PATH, metadata_path=LEGACY_METADATA_PATH):
+        """Splits a single-file library into shards, once; the legacy files are left in place"""
+        if self.manifest().get("migrated_from") or not (os.path.exists(index_path) and os.path.exists(metadata_path)):
+            return 0
+        index = faiss.read_index(index_path)
+        with open(metadata_path, "r") as f:
+            metadata = json.load(f)
+        if index.ntotal != len(metadata):
+            raise ValueError(f"'{index_path}' has {index.ntotal} vectors but '{metadata_path}' {len(metadata)} entries")
+        print(f"Migrating {len(metadata)} entries from '{index_path}' into shards...")
+        shard_ids = self.add(index.reconstruct_n(0, index.ntotal) if index.ntotal else [], metadata)
+        with self._locked() as manifest:
+            manifest["migrated_from"] = os.path.abspath(index_path)
+            self._publish(manifest)
+        print(f"✅ Migrated into {len(shard_ids)} shards under '{self.root}'.")
+        return len(metadata)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["status", "retention", "migrate"])
+    parser.add_argument("--root", default=SHARD_DIR)
+    parser.add_argument("--days", type=int, default=SHARD_RETENTION_DAYS, help="Days of footage to keep")
+    parser.add_argument("--index", default=LEGACY_INDEX_PATH)
+    parser.add_argument("--metadata", default=LEGACY_METADATA_PATH)
+    args = parser.parse_args()
+
+    store = ShardStore(args.root)
+    if args.command == "retention":
+        store.expire(args.days)
+    elif args.command == "migrate":
+        store.migrate_legacy(args.index, args.metadata)
+
+    manifest = store.manifest()
+    shards = manifest["shards"]
+    print(f"Generation {manifest['generation']}: {len(shards)} shards, "
+          f"{sum(info['entries'] for info in shards.values())} entries")
+    for shard_id, info in sorted(shards.items()):
+        print(f"  {shard_id:<40}{info['entries']:>8} entries  v{info['version']}  "
+              f"{info['min_start']} - {info['max_end']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,11 +8,14 @@ import base64
 import json
 import datetime
 import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from types import SimpleNamespace
 from dotenv import load_dotenv
 from tqdm import tqdm
-import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from index_shards import PREVIEW_DIR, SHARD_RETENTION_DAYS, ShardStore, camera_id_for, retention_cutoff, video_key
 
 # --- LOAD ENVIRONMENT ---
 load_dotenv()
@@ -22,12 +25,38 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 FPS = 5
 BATCH_SIZE = 100
 FRAME_INTERVAL = 10
+VLM_FRAME_MAX_SIDE = int(os.getenv("VLM_FRAME_MAX_SIDE", "768"))  # Frames sent to the VLM are downscaled to this
+JPEG_QUALITY = 85
 MODEL_NAME = 'gemini-2.5-pro'
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
-FAISS_INDEX_PATH = "video_library.faiss"
+FAISS_INDEX_PATH = "video_library.faiss"  # Single-file library of earlier versions, migrated into shards
 METADATA_PATH = "video_library_metadata.json"
-
-frame_queue = queue.Queue(maxsize=BATCH_SIZE*2)
+JOURNAL_PATH = "video_library_journal.jsonl"
+
+# --- SCHEDULER CONFIGURATION ---
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 1)))  # Videos decoded in parallel
+VLM_MAX_IN_FLIGHT = int(os.getenv("VLM_MAX_IN_FLIGHT", "4"))  # Concurrent generate_content calls
+VLM_REQUESTS_PER_MINUTE = float(os.getenv("VLM_REQUESTS_PER_MINUTE", "0"))  # 0 disables rate limiting
+USE_MOCK_VLM = os.getenv("USE_MOCK_VLM", "0") == "1"
+MOCK_VLM_LATENCY = float(os.getenv("MOCK_VLM_LATENCY", "1.0"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))  # Most descriptions embedded per encode() call
+STAGE_QUEUE_SIZE = 2  # Batches buffered between stages; keeps memory flat when a stage falls behind
+STAGE_REPORT_SECONDS = float(os.getenv("STAGE_REPORT_SECONDS", "60"))
+
+# --- SCENE CHANGE CONFIGURATION ---
+# Mean absolute difference (0-255) between tiny grayscale thumbnails above which a batch is
+# described again; at or below it the previous description is reused. 0 disables reuse.
+SCENE_CHANGE_THRESHOLD = float(os.getenv("SCENE_CHANGE_THRESHOLD", "6.0"))
+SCENE_THUMB_SIZE = 32
+STATIC_MAX_REUSE = int(os.getenv("STATIC_MAX_REUSE", "30"))  # Re-describe at least every N+1 batches
+
+# --- PREVIEW CONFIGURATION ---
+# A JPEG thumbnail and a sprite sheet of the decoded frames are written per described batch, for
+# search results, under PREVIEW_DIR (see index_shards.py)
+THUMBNAIL_WIDTH = 320
+SPRITE_TILE_WIDTH = 160
+SPRITE_COLUMNS = 5
+PREVIEW_JPEG_QUALITY = 75
 
 # --- SETUP FUNCTIONS ---
 def setup_gemini():
@@ -47,6 +76,22 @@ def setup_gemini():
         generation_config=generation_config
     )
 
+class MockVLM:
+    """Local stand-in for the Gemini model, used to exercise the scheduler without API calls"""
+    def __init__(self, latency=MOCK_VLM_LATENCY):
+        self.latency = latency
+
+    def generate_content(self, content):
+        time.sleep(self.latency)
+        description = f"Mock scene description generated from {len(content) - 1} frames."
+        return SimpleNamespace(text=json.dumps({"overall_scene": {"description": description}}))
+
+def setup_vlm():
+    if USE_MOCK_VLM:
+        print(f"Using mock VLM ({MOCK_VLM_LATENCY:.1f}s per request).")
+        return MockVLM()
+    return setup_gemini()
+
 def setup_embedder():
     print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
     embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
@@ -54,26 +99,190 @@ def setup_embedder():
     return embedder
 
 # --- FRAME CAPTURE ---
-def capture_frames(video_path):
-    cap = cv2.VideoCapture(video_path)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    input_fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_skip = int(input_fps // FPS) if input_fps > FPS and FPS > 0 else 1
-    for frame_count in tqdm(range(total_frames), desc=f"Capturing from {os.path.basename(video_path)}"):
-        ret, frame = cap.read()
-        if not ret:
-            break
-        if frame_count % frame_skip == 0:
-            ts_sec = frame_count / input_fps
-            timestamp = f"{int(ts_sec//3600):02d}:{int((ts_sec%3600)//60):02d}:{int(ts_sec%60):02d}"
-            frame_queue.put({
-                "timestamp": timestamp,
-                "frame": frame,
-                "frame_num": frame_count
-            })
-    cap.release()
-    frame_queue.put(None)
-    print(f"\nFinished capturing frames for {os.path.basename(video_path)}.")
+def compress_frame(frame):
+    """
+    Downscales a frame that will be sent to the VLM and keeps only its JPEG bytes, scene
+    thumbnail and a THUMBNAIL_WIDTH-wide JPEG preview for the search result assets
+    """
+    h, w = frame.shape[:2]
+    scale = VLM_FRAME_MAX_SIDE / max(h, w)
+    if scale < 1:
+        frame = cv2.resize(frame, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (SCENE_THUMB_SIZE, SCENE_THUMB_SIZE),
+                       interpolation=cv2.INTER_AREA)
+    h, w = frame.shape[:2]
+    preview = cv2.resize(frame, (THUMBNAIL_WIDTH, max(1, round(h * THUMBNAIL_WIDTH / w))), interpolation=cv2.INTER_AREA)
+    _, preview_buffer = cv2.imencode('.jpg', preview, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    return {"jpeg": buffer.tobytes(), "thumb": thumb, "preview": preview_buffer.tobytes()}
+
+def frame_records(frames):
+    return [{"timestamp": f["timestamp"], "frame_num": f["frame_num"]} for f in frames]
+
+def encode_batch(frames):
+    """Builds the VLM payload from the frames that were compressed at capture"""
+    images_base64 = [
+        {"mime_type": "image/jpeg", "data": base64.b64encode(f["jpeg"]).decode('utf-8')}
+        for f in frames if "jpeg" in f
+    ]
+    return {"frames": frame_records(frames), "images": images_base64}
+
+def write_bytes(path, data):
+    # Written aside and renamed, so search_api never serves a half-written file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def write_jpeg(path, image):
+    _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY])
+    write_bytes(path, buffer.tobytes())
+
+def write_previews(video_path, frames):
+    """
+    Writes the batch's thumbnail (its middle decoded frame, as encoded at capture) and a
+    sprite sheet of all its decoded frames under PREVIEW_DIR; returns the metadata fields
+    that point at them
+    """
+    decoded = [f for f in frames if "preview" in f]
+    if not decoded:
+        return {}
+    key = video_key(video_path)  # The same key search_api's /clip takes
+    os.makedirs(os.path.join(PREVIEW_DIR, key), exist_ok=True)
+    start_frame = frames[0]["frame_num"]
+    thumbnail = f"{key}/{start_frame}.jpg"
+    write_bytes(os.path.join(PREVIEW_DIR, thumbnail), decoded[len(decoded) // 2]["preview"])
+
+    images = [cv2.imdecode(np.frombuffer(f["preview"], dtype=np.uint8), cv2.IMREAD_COLOR) for f in decoded]
+    h, w = images[0].shape[:2]
+    tile_w, tile_h = SPRITE_TILE_WIDTH, max(1, round(h * SPRITE_TILE_WIDTH / w))
+    columns = min(SPRITE_COLUMNS, len(decoded))
+    rows = -(-len(decoded) // columns)
+    sheet = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+    for i, image in enumerate(images):
+        row, column = divmod(i, columns)
+        sheet[row * tile_h:(row + 1) * tile_h, column * tile_w:(column + 1) * tile_w] = cv2.resize(
+            image, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+    sprite = f"{key}/{start_frame}_sprite.jpg"
+    write_jpeg(os.path.join(PREVIEW_DIR, sprite), sheet)
+    return {
+        "thumbnail": thumbnail,
+        "sprite": {"path": sprite, "columns": columns, "rows": rows, "tile_width": tile_w, "tile_height": tile_h,
+                   "count": len(decoded), "timestamps": [f["timestamp"] for f in decoded]},
+    }
+
+def scene_signature(frames):
+    """Tiny grayscale thumbnails of the frames that would be sent to the VLM"""
+    return np.array([f["thumb"] for f in frames if "thumb" in f], dtype=np.float32)
+
+def scene_changed(signature, reference):
+    # Every sampled frame is compared, so a short event inside an otherwise quiet batch still counts
+    difference = np.abs(signature - reference.mean(axis=0)).mean(axis=(1, 2))
+    return float(difference.max()) > SCENE_CHANGE_THRESHOLD
+
+def encode_batches(video_path, raw_batches, out_queue, result):
+    """
+    Encode stage of a decode worker: builds the VLM payload of a batch while the next
+    one is decoded. Batches that look like the last described batch are sent without
+    images and with "reuse_of" set to that batch's start frame, so they skip the VLM.
+    """
+    reference = None
+    reference_start = None
+    reuse_count = 0
+    while True:
+        item = raw_batches.get()
+        if item is None:
+            return
+        frames, decode_seconds, after_seek = item
+        try:
+            started = time.perf_counter()
+            if after_seek:
+                reference = None  # The last described batch isn't the one right before this
+            signature = scene_signature(frames) if SCENE_CHANGE_THRESHOLD > 0 else None
+            if (reference is not None and reuse_count < STATIC_MAX_REUSE
+                    and not scene_changed(signature, reference)):
+                batch = {"frames": frame_records(frames), "reuse_of": reference_start}
+                reuse_count += 1
+            else:
+                batch = encode_batch(frames)
+                try:
+                    batch["previews"] = write_previews(video_path, frames)
+                except OSError as e:
+                    print(f"\nCould not write previews for {os.path.basename(video_path)}: {e}")
+                reference, reference_start, reuse_count = signature, frames[0]["frame_num"], 0
+            batch["stage_seconds"] = {"decode": decode_seconds, "encode": time.perf_counter() - started}
+        except Exception as e:
+            print(f"\nError while encoding a batch of {os.path.basename(video_path)}: {e}")
+            result["ok"] = False
+            continue
+        out_queue.put(("batch", video_path, batch))
+
+def capture_frames(video_path, out_queue, completed_starts=()):
+    """
+    Runs in a decode worker process as two stages, decode/sample and encode, joined
+    by a small queue. Only every FRAME_INTERVAL-th sampled frame is decoded to pixels,
+    and it is kept downscaled and JPEG-compressed; the other frames are grabbed without
+    decoding and kept as timestamp records, so a worker holds megabytes, not gigabytes.
+    Sends ("batch", video_path, batch) for every BATCH_SIZE sampled frames and always
+    finishes with ("done", video_path, decoded_ok), even if decoding fails part-way.
+
+    Batches always start on the same frames, so batches whose start frame is in
+    completed_starts (already journaled) are seeked over instead of decoded.
+    """
+    raw_batches = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+    result = {"ok": True}
+    encoder = threading.Thread(target=encode_batches, args=(video_path, raw_batches, out_queue, result), daemon=True)
+    encoder.start()
+    decoded_ok = False
+    try:
+        cap = cv2.VideoCapture(video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        input_fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_skip = int(input_fps // FPS) if input_fps > FPS and FPS > 0 else 1
+        frames_per_batch = BATCH_SIZE * frame_skip
+        batch = []
+        frame_count = 0
+        after_seek = False
+        batch_started = time.perf_counter()
+        while frame_count < total_frames:
+            if frame_count % frames_per_batch == 0 and frame_count in completed_starts:
+                while frame_count in completed_starts:
+                    frame_count += frames_per_batch
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+                after_seek = True
+                continue
+            sampled = frame_count % frame_skip == 0
+            sent_to_vlm = sampled and len(batch) % FRAME_INTERVAL == 0
+            if sent_to_vlm:
+                ret, frame = cap.read()
+            else:
+                ret, frame = cap.grab(), None
+            if not ret:
+                break
+            if sampled:
+                ts_sec = frame_count / input_fps
+                timestamp = f"{int(ts_sec//3600):02d}:{int((ts_sec%3600)//60):02d}:{int(ts_sec%60):02d}"
+                record = {"timestamp": timestamp, "frame_num": frame_count}
+                if sent_to_vlm:
+                    record.update(compress_frame(frame))
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    raw_batches.put((batch, time.perf_counter() - batch_started, after_seek))
+                    batch = []
+                    after_seek = False
+                    batch_started = time.perf_counter()
+            frame_count += 1
+        if batch:
+            raw_batches.put((batch, time.perf_counter() - batch_started, after_seek))
+        cap.release()
+        decoded_ok = True
+        print(f"\nFinished capturing frames for {os.path.basename(video_path)}.")
+    except Exception as e:
+        print(f"\nError while decoding {os.path.basename(video_path)}: {e}")
+    finally:
+        raw_batches.put(None)
+        encoder.join()
+        out_queue.put(("done", video_path, decoded_ok and result["ok"]))
 
 # --- HELPERS ---
 def parse_time_string_to_timedelta(ts_str):
@@ -84,16 +293,20 @@ def parse_time_string_to_timedelta(ts_str):
         return datetime.timedelta(seconds=0)
 
 # --- ANALYZE BATCHES ---
-def analyze_and_prepare_batch(frames, model, embedder, video_path, video_start_datetime):
-    if not frames:
-        return None, None
+def segment_document(video_filename, absolute_start_time, absolute_end_time, scene_description):
+    """The text that is embedded for a segment; it names the segment's time range"""
+    return (
+        f"The following event occurred in the video '{video_filename}' "
+        f"between {absolute_start_time} and {absolute_end_time}. "
+        f"Scene description: {scene_description}"
+    )
 
-    selected_frames = frames[::FRAME_INTERVAL]
-    images_base64 = []
-    for f in selected_frames:
-        _, buffer = cv2.imencode('.jpg', f["frame"])
-        encoded = base64.b64encode(buffer).decode('utf-8')
-        images_base64.append({"mime_type": "image/jpeg", "data": encoded})
+def describe_batch(batch, model, video_path, video_start_datetime):
+    """Asks the VLM to describe a batch; returns its metadata entry, whose document is the text to embed"""
+    frames = batch["frames"]
+    if not frames:
+        return None
+    images_base64 = batch["images"]
 
     prompt = prompt = """You are a forensic analysis AI specialized in extracting detailed scene understanding from a sequence of images. Analyze this batch of exactly 5 consecutive frames taken from surveillance footage.
 
@@ -129,59 +342,378 @@ def analyze_and_prepare_batch(frames, model, embedder, video_path, video_start_d
         scene_data = data.get('overall_scene', {})
         scene_description = scene_data.get('description', '')
 
-        embedding_text = (
-            f"The following event occurred in the video '{video_filename}' "
-            f"between {absolute_start_time.strftime('%Y-%m-%d %H:%M:%S')} and "
-            f"{absolute_end_time.strftime('%Y-%m-%d %H:%M:%S')}. "
-            f"Scene description: {scene_description}"
-        )
-
-        embedding = embedder.encode(embedding_text).tolist()
+        embedding_text = segment_document(video_filename, absolute_start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                                          absolute_end_time.strftime('%Y-%m-%d %H:%M:%S'), scene_description)
 
         metadata_entry = {
             "video_path": os.path.abspath(video_path),
+            "camera": camera_id_for(video_path),
             "start_time_offset": frames[0]['timestamp'],
             "end_time_offset": frames[-1]['timestamp'],
             "absolute_start_time": absolute_start_time.strftime('%Y-%m-%d %H:%M:%S'),
             "absolute_end_time": absolute_end_time.strftime('%Y-%m-%d %H:%M:%S'),
             "start_frame": frames[0]['frame_num'],
             "end_frame": frames[-1]['frame_num'],
-            "document": embedding_text
+            "document": embedding_text,
+            "scene_description": scene_description,
+            **batch.get("previews", {}),
         }
-        return embedding, metadata_entry
+        return metadata_entry
 
     except Exception as e:
         print(f"\nError during analysis or preparation: {e}")
-        return None, None
-
-# --- INCREMENTAL SAVE HELPERS ---
-def load_existing_data():
-    if os.path.exists(FAISS_INDEX_PATH) and os.path.exists(METADATA_PATH):
-        print("Loading existing index and metadata...")
-        index = faiss.read_index(FAISS_INDEX_PATH)
-        all_embeddings = [index.reconstruct(i).tolist() for i in range(index.ntotal)]
-        with open(METADATA_PATH, 'r') as f:
-            metadata_store = json.load(f)
-        print(f"Loaded {len(metadata_store)} existing entries.")
-        return all_embeddings, metadata_store
-    return [], []
-
-def save_index_and_metadata(all_embeddings, metadata_store):
-    if not all_embeddings:
-        print("No embeddings to save.")
+        return None
+
+# --- BATCH JOURNAL ---
+class BatchJournal:
+    """
+    Append-only JSONL log of analyzed batches, written as each VLM call completes.
+    Entries for a video are merged into the index once all of its batches succeed,
+    so a crash only costs the batches that were still in flight.
+    """
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(self.path, 'a', encoding='utf-8')
+
+    def load(self):
+        """Returns {video_path: {start_frame: (embedding, metadata)}}"""
+        entries = {}
+        with self.lock, open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Torn final line from a crash mid-write
+                entries.setdefault(record["video_path"], {})[record["start_frame"]] = (record["embedding"], record["metadata"])
+        return entries
+
+    def append(self, video_path, start_frame, embedding, metadata):
+        line = json.dumps({"video_path": video_path, "start_frame": start_frame,
+                           "embedding": embedding, "metadata": metadata})
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def discard(self, video_paths):
+        """Drops entries for videos that are now part of the saved index"""
+        video_paths = set(video_paths)
+        with self.lock:
+            self.file.close()
+            tmp_path = self.path + ".tmp"
+            with open(self.path, 'r', encoding='utf-8') as src, open(tmp_path, 'w', encoding='utf-8') as dst:
+                for line in src:
+                    try:
+                        if json.loads(line)["video_path"] in video_paths:
+                            continue
+                    except ValueError:
+                        continue
+                    dst.write(line)
+            os.replace(tmp_path, self.path)
+            self.file = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# --- SCHEDULER ---
+class RateLimiter:
+    """Spaces request starts so no more than `per_minute` begin in any minute (0 disables)"""
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        time.sleep(max(0.0, slot - now))
+
+class StageStats:
+    """Batches handled and busy time (excluding queue waits) for one pipeline stage"""
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self.lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def summary(self, wall_seconds):
+        rate = self.items / self.busy_seconds if self.busy_seconds else 0.0
+        utilization = self.busy_seconds / (wall_seconds * self.workers) if wall_seconds else 0.0
+        return (f"{self.name:<8} {self.items:>6} batches | {rate:8.2f} batches/s per worker | "
+                f"{self.workers:>3} workers | {utilization:6.1%} busy")
+
+def report_stages(stages, started):
+    """The stage closest to 100% busy is the bottleneck"""
+    wall_seconds = time.perf_counter() - started
+    print(f"\n--- Stage throughput after {wall_seconds:.0f}s ---")
+    for stage in stages.values():
+        print(stage.summary(wall_seconds))
+
+def extend_static_segments(batches, static_batches):
+    """
+    Stretches each described segment over the static batches that reused its description.
+    The document is rewritten for the new time range; returns the start frames whose
+    embeddings no longer match their document.
+    """
+    extended = set()
+    for start_frame in sorted(static_batches):
+        stub = static_batches[start_frame]
+        if stub["reuse_of"] not in batches:
+            continue
+        embedding, metadata = batches[stub["reuse_of"]]
+        if stub["end_frame"] > metadata["end_frame"]:
+            metadata = dict(metadata)
+            for key in ("end_frame", "end_time_offset", "absolute_end_time"):
+                metadata[key] = stub[key]
+            metadata["reused_batches"] = metadata.get("reused_batches", 0) + 1
+            batches[stub["reuse_of"]] = (embedding, metadata)
+            extended.add(stub["reuse_of"])
+
+    for start_frame in extended:
+        embedding, metadata = batches[start_frame]
+        # Journals written before scene_description was stored only have it inside the document
+        scene_description = metadata.get("scene_description",
+                                          metadata["document"].partition("Scene description: ")[2])
+        metadata["document"] = segment_document(os.path.basename(metadata["video_path"]),
+                                                metadata["absolute_start_time"], metadata["absolute_end_time"],
+                                                scene_description)
+    return sorted(extended)
+
+def finalize_video(video_path, state, journal, on_video_done, embedder):
+    """
+    Hands a video's batches, merged with the journaled ones, over in frame order.
+    Videos with failed batches stay in the journal for the next run.
+    """
+    batches = state["batches"]
+    static_batches = state["static"]
+    if not state["decoded_ok"]:
+        print(f"\nDecoding of {os.path.basename(video_path)} did not finish; "
+              f"{len(batches)} completed batches are journaled and the rest will be retried on the next run.")
+        return
+    if state["failed"]:
+        print(f"\n{state['failed']} batches of {os.path.basename(video_path)} failed; "
+              f"{len(batches)} completed batches are journaled and the rest will be retried on the next run.")
         return
 
-    print(f"\nRebuilding and saving index with {len(all_embeddings)} total entries...")
-    embeddings_np = np.array(all_embeddings).astype('float32')
-    d = embeddings_np.shape[1]
-    index = faiss.IndexFlatL2(d)
-    index.add(embeddings_np)
+    total = len(batches) + len(static_batches)
+    if total:
+        print(f"\n{os.path.basename(video_path)}: reused descriptions for {len(static_batches)} of {total} batches "
+              f"({len(static_batches) / total:.0%} of VLM calls skipped).")
+    batches = dict(batches)
+    extended = extend_static_segments(batches, static_batches)
+    if extended:
+        try:
+            vectors = embedder.encode([batches[start_frame][1]["document"] for start_frame in extended])
+        except Exception as e:
+            print(f"\nError while embedding {len(extended)} extended segments of {os.path.basename(video_path)}: {e}; "
+                  f"its batches are journaled and it will be retried on the next run.")
+            return
+        for start_frame, vector in zip(extended, vectors):
+            batches[start_frame] = (vector.tolist(), batches[start_frame][1])
+    ordered = [batches[start_frame] for start_frame in sorted(batches)]
+    on_video_done(video_path, [e for e, _ in ordered], [m for _, m in ordered])
+    journal.discard([video_path])
+
+def index_videos(video_paths, model, embedder, on_video_done, journal, workers=INDEX_WORKERS,
+                 max_in_flight=VLM_MAX_IN_FLIGHT, requests_per_minute=VLM_REQUESTS_PER_MINUTE):
+    """
+    Runs indexing as concurrent stages joined by bounded queues:
+
+        decode/sample -> encode images   (per video, in worker processes)
+        -> VLM describe                  (up to max_in_flight requests)
+        -> batched embedding             (one thread, batches whatever has queued up)
+        -> index append                  (one thread, journals batches and completes videos)
+
+    on_video_done(video_path, embeddings, metadata) is called once per fully analyzed
+    video, from the append thread, with batches in frame order. Batches already in the
+    journal are not decoded or sent again.
+    """
+    if not video_paths:
+        return
 
-    faiss.write_index(index, FAISS_INDEX_PATH)
-    with open(METADATA_PATH, 'w') as f:
-        json.dump(metadata_store, f, indent=2)
+    start_times = {}
+    for video_path in video_paths:
+        video_start_datetime = datetime.datetime.fromtimestamp(os.path.getmtime(video_path))
+        start_times[video_path] = video_start_datetime
+        print(f"Queued '{os.path.basename(video_path)}' (Assumed Start Time: {video_start_datetime.strftime('%Y-%m-%d %H:%M:%S')})")
+
+    journal_entries = journal.load()
+    for video_path in video_paths:
+        if journal_entries.get(video_path):
+            print(f"Resuming '{os.path.basename(video_path)}' with {len(journal_entries[video_path])} journaled batches.")
+
+    decode_workers = max(1, min(workers, len(video_paths)))
+    stages = {
+        "decode": StageStats("decode", decode_workers),
+        "encode": StageStats("encode", decode_workers),
+        "vlm": StageStats("vlm", max_in_flight),
+        "embed": StageStats("embed"),
+        "append": StageStats("append"),
+    }
+    started = time.perf_counter()
+    rate_limiter = RateLimiter(requests_per_minute)
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    describe_queue = queue.Queue(maxsize=max(EMBED_BATCH_SIZE, max_in_flight))
+    append_queue = queue.Queue(maxsize=max(EMBED_BATCH_SIZE, max_in_flight))
+    pbar = tqdm(desc="Indexed batches")
+    videos = {}
+    for video_path in video_paths:
+        journaled = journal_entries.get(video_path, {})
+        videos[video_path] = {
+            # Static batches are journaled without an embedding
+            "batches": {sf: entry for sf, entry in journaled.items() if entry[0] is not None},
+            "static": {sf: entry[1] for sf, entry in journaled.items() if entry[0] is None},
+            "dispatched": 0, "received": 0, "failed": 0,
+            "expected": None, "decoded_ok": True, "finalized": False,
+        }
 
-    print(f"SUCCESS: Index saved to '{FAISS_INDEX_PATH}' and metadata to '{METADATA_PATH}'.")
+    def describe(batch, video_path):
+        metadata = None
+        try:
+            rate_limiter.wait()
+            t0 = time.perf_counter()
+            metadata = describe_batch(batch, model, video_path, start_times[video_path])
+            stages["vlm"].record(1, time.perf_counter() - t0)
+        finally:
+            # Always forwarded, even as a failure, so the append stage can account for every batch
+            in_flight.release()
+            describe_queue.put((video_path, batch["frames"][0]["frame_num"], metadata))
+
+    def embed_stage():
+        finished = False
+        while not finished:
+            items = []
+            item = describe_queue.get()
+            # Take whatever else is already waiting, so batches grow only when the VLM outpaces us
+            while item is not None:
+                items.append(item)
+                if len(items) >= EMBED_BATCH_SIZE:
+                    break
+                try:
+                    item = describe_queue.get_nowait()
+                except queue.Empty:
+                    break
+            finished = item is None
+
+            described = [item for item in items if item[2] is not None]
+            embeddings = {}
+            if described:
+                t0 = time.perf_counter()
+                try:
+                    vectors = embedder.encode([metadata["document"] for _, _, metadata in described])
+                    embeddings = {(v, sf): vector.tolist() for (v, sf, _), vector in zip(described, vectors)}
+                except Exception as e:
+                    print(f"\nError while embedding {len(described)} descriptions: {e}")
+                stages["embed"].record(len(described), time.perf_counter() - t0)
+            for video_path, start_frame, metadata in items:
+                append_queue.put(("batch", video_path, start_frame, embeddings.get((video_path, start_frame)), metadata))
+        append_queue.put(None)
+
+    def append_stage():
+        while True:
+            item = append_queue.get()
+            if item is None:
+                return
+            kind, video_path, *payload = item
+            state = videos[video_path]
+            t0 = time.perf_counter()
+            if kind == "batch":
+                start_frame, embedding, metadata = payload
+                state["received"] += 1
+                if embedding is None:
+                    state["failed"] += 1
+                else:
+                    journal.append(video_path, start_frame, embedding, metadata)
+                    state["batches"][start_frame] = (embedding, metadata)
+                pbar.update(1)
+            elif kind == "static":
+                start_frame, stub = payload
+                state["received"] += 1
+                journal.append(video_path, start_frame, None, stub)
+                state["static"][start_frame] = stub
+                pbar.update(1)
+            elif kind == "done":
+                state["expected"], state["decoded_ok"] = payload
+            if not state["finalized"] and state["expected"] is not None and state["received"] >= state["expected"]:
+                state["finalized"] = True
+                finalize_video(video_path, state, journal, on_video_done, embedder)
+            stages["append"].record(1 if kind != "done" else 0, time.perf_counter() - t0)
+
+    embed_thread = threading.Thread(target=embed_stage, daemon=True, name="IndexEmbed")
+    append_thread = threading.Thread(target=append_stage, daemon=True, name="IndexAppend")
+    embed_thread.start()
+    append_thread.start()
+
+    manager = multiprocessing.Manager()
+    # Small queue: decoders block once the VLM budget is saturated instead of buffering whole videos
+    batch_queue = manager.Queue(maxsize=max_in_flight * STAGE_QUEUE_SIZE)
+    last_report = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=decode_workers) as decode_pool, \
+         ThreadPoolExecutor(max_workers=max_in_flight) as vlm_pool:
+        decode_futures = {
+            decode_pool.submit(capture_frames, path, batch_queue, frozenset(journal_entries.get(path, {}))): path
+            for path in video_paths
+        }
+        pending = set(video_paths)
+
+        def finish(video_path, decoded_ok):
+            pending.discard(video_path)
+            append_queue.put(("done", video_path, videos[video_path]["dispatched"], decoded_ok))
+
+        while pending:
+            if time.perf_counter() - last_report >= STAGE_REPORT_SECONDS:
+                report_stages(stages, started)
+                last_report = time.perf_counter()
+            try:
+                kind, video_path, *payload = batch_queue.get(timeout=1)
+            except queue.Empty:
+                # A worker that crashed outright never sends "done"
+                for decode_future, video_path in decode_futures.items():
+                    if video_path in pending and decode_future.done() and decode_future.exception():
+                        print(f"\nDecode worker for {os.path.basename(video_path)} failed: {decode_future.exception()}")
+                        finish(video_path, False)
+                continue
+
+            if kind == "batch":
+                batch = payload[0]
+                for name, seconds in batch.pop("stage_seconds", {}).items():
+                    stages[name].record(1, seconds)
+                videos[video_path]["dispatched"] += 1
+                if "reuse_of" in batch:
+                    frames = batch["frames"]
+                    absolute_end_time = start_times[video_path] + parse_time_string_to_timedelta(frames[-1]["timestamp"])
+                    stub = {
+                        "reuse_of": batch["reuse_of"],
+                        "end_frame": frames[-1]["frame_num"],
+                        "end_time_offset": frames[-1]["timestamp"],
+                        "absolute_end_time": absolute_end_time.strftime('%Y-%m-%d %H:%M:%S'),
+                    }
+                    append_queue.put(("static", video_path, frames[0]["frame_num"], stub))
+                    continue
+                in_flight.acquire()
+                vlm_pool.submit(describe, batch, video_path)
+            elif kind == "done":
+                finish(video_path, payload[0])
+
+    describe_queue.put(None)
+    embed_thread.join()
+    append_thread.join()
+    pbar.close()
+    manager.shutdown()
+    report_stages(stages, started)
 
 # --- MAIN FUNCTION ---
 def main():
@@ -190,69 +722,42 @@ def main():
         print(f"Error: Directory not found at '{video_dir}'")
         return
 
-    model = setup_gemini()
+    model = setup_vlm()
     embedder = setup_embedder()
 
-    all_embeddings, metadata_store = load_existing_data()
-    processed_videos = {item['video_path'] for item in metadata_store}
-
-    video_files = [
-        f for f in os.listdir(video_dir)
-        if f.lower().endswith(('.mp4', '.mov', '.avi', '.mkv'))
-    ]
-
-    for video_filename in video_files:
+    store = ShardStore()
+    store.migrate_legacy(FAISS_INDEX_PATH, METADATA_PATH)
+    store.expire(SHARD_RETENTION_DAYS)
+    processed_videos = store.indexed_videos()
+    cutoff = retention_cutoff(SHARD_RETENTION_DAYS)
+    journal = BatchJournal()
+    # A crash between saving the index and compacting the journal leaves stale entries behind
+    journal.discard(processed_videos)
+
+    video_paths = []
+    for video_filename in os.listdir(video_dir):
+        if not video_filename.lower().endswith(('.mp4', '.mov', '.avi', '.mkv')):
+            continue
         video_path = os.path.abspath(os.path.join(video_dir, video_filename))
-
         if video_path in processed_videos:
             print(f"\nSkipping '{video_filename}' as it is already in the index.")
             continue
+        if datetime.date.fromtimestamp(os.path.getmtime(video_path)).isoformat() < cutoff:
+            print(f"\nSkipping '{video_filename}' as it is older than the {SHARD_RETENTION_DAYS}-day retention.")
+            continue
+        video_paths.append(video_path)
 
-        file_mod_time = os.path.getmtime(video_path)
-        video_start_datetime = datetime.datetime.fromtimestamp(file_mod_time)
-        print(f"\n--- Processing '{video_filename}' (Assumed Start Time: {video_start_datetime.strftime('%Y-%m-%d %H:%M:%S')}) ---")
-
-        current_video_embeddings = []
-        current_video_metadata = []
+    print(f"\nIndexing {len(video_paths)} videos with {INDEX_WORKERS} decode workers and "
+          f"up to {VLM_MAX_IN_FLIGHT} VLM requests in flight.")
 
-        while not frame_queue.empty():
-            frame_queue.get()
-        capture_thread = threading.Thread(target=capture_frames, args=(video_path,), daemon=True)
-        capture_thread.start()
+    def on_video_done(video_path, embeddings, metadata):
+        if embeddings:
+            shard_ids = store.add(embeddings, metadata)
+            print(f"\nSaved {len(embeddings)} entries to shards {', '.join(shard_ids)}.")
+        print(f"--- Finished processing and updated index for: {os.path.basename(video_path)} ---")
 
-        batch = []
-        pbar = tqdm(desc=f"Processing Batches for {video_filename}")
-        while capture_thread.is_alive() or not frame_queue.empty():
-            try:
-                item = frame_queue.get(timeout=1)
-                if item is None:
-                    break
-                batch.append(item)
-                if len(batch) >= BATCH_SIZE:
-                    embedding, metadata = analyze_and_prepare_batch(batch, model, embedder, video_path, video_start_datetime)
-                    if embedding:
-                        current_video_embeddings.append(embedding)
-                        current_video_metadata.append(metadata)
-                    batch = []
-                    pbar.update(1)
-                    # print("\nBatch processed. Waiting for 31 seconds...")
-                    # time.sleep(31)
-            except queue.Empty:
-                continue
-        if batch:
-            embedding, metadata = analyze_and_prepare_batch(batch, model, embedder, video_path, video_start_datetime)
-            if embedding:
-                current_video_embeddings.append(embedding)
-                current_video_metadata.append(metadata)
-            pbar.update(1)
-        pbar.close()
-
-        if current_video_embeddings:
-            all_embeddings.extend(current_video_embeddings)
-            metadata_store.extend(current_video_metadata)
-            save_index_and_metadata(all_embeddings, metadata_store)
-
-        print(f"--- Finished processing and updated index for: {video_filename} ---")
+    index_videos(video_paths, model, embedder, on_video_done, journal)
+    journal.close()
 
     print("\nAll videos have been processed and indexed.")
 
@@ -0,0 +1,253 @@
+# File: live_preview.py
+"""
+Live preview streams for the cameras dashboard.
+
+Every camera gets one encoder thread. Once per tick (PREVIEW_FPS) and only while someone is
+watching, it resizes the camera's latest frame to PREVIEW_WIDTH and JPEG-encodes it once.
+The same bytes are then handed to every subscriber, either an MJPEG response or a
+WebSocket. Each subscriber has a one-frame mailbox, so a client that falls behind skips
+straight to the newest frame instead of queueing old ones. Extra viewers cost bandwidth,
+not encoding.
+
+    GET /cameras/live                      cameras with a preview and their viewer counts
+    GET /cameras/{camera}/preview.mjpeg    multipart/x-mixed-replace stream, for an <img> tag
+    WS  /cameras/{camera}/preview          one binary message per JPEG frame
+"""
+import asyncio
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from metrics import CAMERA_FRAMES, QUEUE_DEPTH, stage_timer
+
+# --- PREVIEW CONFIGURATION ---
+PREVIEW_WIDTH = int(os.getenv("LIVE_PREVIEW_WIDTH", "640"))  # Height follows the camera's aspect ratio
+PREVIEW_FPS = float(os.getenv("LIVE_PREVIEW_FPS", "5"))
+PREVIEW_JPEG_QUALITY = int(os.getenv("LIVE_PREVIEW_JPEG_QUALITY", "70"))
+MJPEG_BOUNDARY = "frame"
+PREVIEW_ENCODE_SECONDS = stage_timer("preview_encode")
+
+
+class LatestFrame:
+    """
+    Frame source for pipelines that read frames themselves (video files): offer() keeps a
+    reference to the newest frame and acquire_frame() hands it out like
+    RTSPFrameCapture.acquire_frame(), as a lease with a seq and release().
+    """
+    def __init__(self):
+        self.frame = None
+        self.seq = 0
+
+    def offer(self, frame):
+        # cv2.VideoCapture.read() returns a new array per frame, so holding a reference is safe
+        self.frame, self.seq = frame, self.seq + 1
+
+    def acquire_frame(self):
+        frame, seq = self.frame, self.seq
+        if frame is None:
+            return None
+        return _FrameLease(frame, seq)
+
+
+class _FrameLease:
+    def __init__(self, frame, seq):
+        self.frame = frame
+        self.seq = seq
+
+    def release(self):
+        self.frame = None
+
+
+class _Subscriber:
+    """One viewer's mailbox: the newest undelivered frame, replaced (and counted as dropped) if unsent"""
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.frame = None
+        self.closed = False
+
+    def offer(self, jpeg):
+        dropped = self.frame is not None
+        self.frame = jpeg
+        self.loop.call_soon_threadsafe(self.event.set)
+        return dropped
+
+    def close(self):
+        self.closed = True
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    async def next_frame(self):
+        """The newest frame, or None once the stream has stopped"""
+        # An offer() between clear() and the swap leaves the event set with the mailbox already
+        # emptied; that wake-up finds no frame and just waits again
+        while self.frame is None and not self.closed:
+            await self.event.wait()
+            self.event.clear()
+        if self.closed:
+            return None
+        jpeg, self.frame = self.frame, None
+        return jpeg
+
+
+class PreviewStream:
+    """Encodes one camera's latest frame once per tick and fans the JPEG out to its subscribers"""
+    def __init__(self, camera_name, source, width=PREVIEW_WIDTH, fps=PREVIEW_FPS, quality=PREVIEW_JPEG_QUALITY):
+        self.camera_name = camera_name
+        self.source = source  # Has acquire_frame(), e.g. RTSPFrameCapture or LatestFrame
+        self.width = width
+        self.frame_time = 1.0 / fps
+        self.encode_params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.latest = None  # Last encoded JPEG, sent to new subscribers straight away
+        self.last_seq = 0
+        self.resized = None
+        self.running = True
+        self.frames_dropped = CAMERA_FRAMES.labels(camera=camera_name, outcome="preview_dropped")
+        self.viewers = QUEUE_DEPTH.labels(queue=f"preview_viewers:{camera_name}")
+        self.thread = threading.Thread(target=self._run, daemon=True, name=f"Preview-{camera_name}")
+        self.thread.start()
+
+    def subscribe(self):
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self.lock:
+            self.subscribers.add(subscriber)
+            self.viewers.set(len(self.subscribers))
+            if self.latest is not None:
+                subscriber.offer(self.latest)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            self.viewers.set(len(self.subscribers))
+
+    def stop(self):
+        self.running = False
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.close()  # Wakes the viewer so its response ends
+            except RuntimeError:
+                pass
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while self.running:
+            next_tick += self.frame_time
+            if self.subscribers:
+                jpeg = self._encode_latest()
+                if jpeg is not None:
+                    with self.lock:
+                        self.latest = jpeg
+                        subscribers = list(self.subscribers)
+                    for subscriber in subscribers:
+                        try:
+                            if subscriber.offer(jpeg):
+                                self.frames_dropped.inc()
+                        except RuntimeError:
+                            self.unsubscribe(subscriber)  # Its event loop has closed
+            else:
+                self.latest = None  # Don't greet the next viewer with a stale frame
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+            next_tick = max(next_tick, time.perf_counter() - self.frame_time)  # Don't burst after a stall
+
+    def _encode_latest(self):
+        """JPEG of the source's newest frame, or None if it hasn't produced one since the last tick"""
+        lease = self.source.acquire_frame()
+        if lease is None:
+            return None
+        try:
+            if lease.seq == self.last_seq:
+                return None
+            self.last_seq = lease.seq
+            started = time.perf_counter()
+            h, w = lease.frame.shape[:2]
+            size = (min(self.width, w), max(1, round(h * min(self.width, w) / w)))
+            if self.resized is None or self.resized.shape[1::-1] != size:
+                self.resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+            cv2.resize(lease.frame, size, dst=self.resized, interpolation=cv2.INTER_AREA)
+        finally:
+            lease.release()  # The capture buffer goes back to the pool before the encode
+        ok, buffer = cv2.imencode('.jpg', self.resized, self.encode_params)
+        PREVIEW_ENCODE_SECONDS.observe(time.perf_counter() - started)
+        return buffer.tobytes() if ok else None
+
+
+class PreviewHub:
+    """The preview streams of one process, by camera name"""
+    def __init__(self):
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def add_camera(self, camera_name, source, **kwargs):
+        with self.lock:
+            old = self.streams.get(camera_name)
+            self.streams[camera_name] = PreviewStream(camera_name, source, **kwargs)
+        if old is not None:
+            old.stop()
+
+    def remove_camera(self, camera_name):
+        with self.lock:
+            stream = self.streams.pop(camera_name, None)
+        if stream is not None:
+            stream.stop()
+
+    def get(self, camera_name):
+        return self.streams.get(camera_name)
+
+
+def add_preview_routes(app, hub):
+    """Mounts the live preview endpoints for the hub's cameras on a FastAPI app"""
+    from fastapi import HTTPException, WebSocket, WebSocketDisconnect
+    from fastapi.responses import StreamingResponse
+
+    @app.get("/cameras/live")
+    def live_cameras():
+        return {"cameras": [{"name": name, "viewers": len(stream.subscribers)}
+                            for name, stream in sorted(hub.streams.items())]}
+
+    @app.get("/cameras/{camera}/preview.mjpeg")
+    async def preview_mjpeg(camera: str):
+        stream = hub.get(camera)
+        if stream is None:
+            raise HTTPException(status_code=404, detail=f"No live preview for camera '{camera}'")
+        subscriber = stream.subscribe()
+
+        async def parts():
+            try:
+                while True:
+                    jpeg = await subscriber.next_frame()
+                    if jpeg is None:
+                        break
+                    yield (f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                           f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+            finally:
+                stream.unsubscribe(subscriber)
+
+        return StreamingResponse(parts(), media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+                                 headers={"Cache-Control": "no-store"})
+
+    @app.websocket("/cameras/{camera}/preview")
+    async def preview_websocket(websocket: WebSocket, camera: str):
+        stream = hub.get(camera)
+        if stream is None:
+            await websocket.close(code=4404)
+            return
+        await websocket.accept()
+        subscriber = stream.subscribe()
+        try:
+            while True:
+                jpeg = await subscriber.next_frame()
+                if jpeg is None:
+                    await websocket.close()
+                    break
+                await websocket.send_bytes(jpeg)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            stream.unsubscribe(subscriber)
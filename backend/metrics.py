@@ -0,0 +1,183 @@
+import bisect
+import threading
+import time
+
+# --- METRICS CONFIGURATION ---
+# Stage latencies range from sub-millisecond resizes to multi-second Gemini/ffmpeg calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """
+    A metric family with optional labels. Hot paths should call labels() once and keep
+    the child, so recording a sample is a lock and an add, not a dict lookup.
+    """
+    kind = ""
+
+    def __init__(self, name, help_text, labelnames=(), registry=None):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self.children.items()):
+            lines.extend(child.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+    def render(self, name, labelnames, key):
+        return [f"{name}{_format_labels(labelnames, key)} {self.value:g}"]
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Context manager that observes the duration of its block in seconds"""
+        return _Timer(self)
+
+    def render(self, name, labelnames, key):
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += count
+            le = bound if bound == "+Inf" else f"{bound:g}"
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, [('le', le)])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {total:g}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+
+    def render(self):
+        """The registry in the Prometheus text exposition format"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- SHARED METRICS ---
+# Stages: decode, resize, preprocess, resnet, svm, gemini, twilio, embed, faiss_search, clip_extraction
+STAGE_SECONDS = Histogram("pipeline_stage_seconds", "Time spent in each pipeline stage", ["stage"])
+CAMERA_FRAMES = Counter("camera_frames_total",
+                        "Frames per camera by outcome (captured, dropped, duplicated, skipped)", ["camera", "outcome"])
+QUEUE_DEPTH = Gauge("queue_depth", "Items waiting in each pipeline queue", ["queue"])
+CAMERA_SAMPLING_FPS = Gauge("camera_sampling_fps", "Sampling rate chosen by the rate controller", ["camera"])
+RATE_CONTROLLER_PRESSURE = Gauge("rate_controller_pressure",
+                                 "Worst of load signal / target at the last adjustment; above 1 means over budget").labels()
+
+
+def stage_timer(stage):
+    """Histogram child for one stage; keep it around on hot paths and use it with `with timer.time():`"""
+    return STAGE_SECONDS.labels(stage=stage)
+
+
+def add_metrics_route(app):
+    """Exposes REGISTRY at GET /metrics on a FastAPI app"""
+    from fastapi import Response
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
@@ -0,0 +1,131 @@
+# File: query_embedder.py
+"""
+Query embedders for search_api.
+
+  torch  SentenceTransformer(all-MiniLM-L6-v2), as used by indexing.py
+  onnx   the same model exported to ONNX (optionally int8-quantized) and run with
+         onnxruntime and a bare `tokenizers` tokenizer; no PyTorch import, so a
+         search process starts in about a second
+
+Both return L2-normalized float32 embeddings from encode(list_of_texts). The ONNX files
+are produced once, on a machine with sentence-transformers installed:
+
+Usage: python query_embedder.py export [--output ./weights/all-MiniLM-L6-v2-onnx] [--no-quantize]
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+# --- EMBEDDER CONFIGURATION ---
+EMBEDDER_BACKEND = os.getenv("EMBEDDER_BACKEND", "torch")  # torch | onnx
+ONNX_EMBEDDER_DIR = os.getenv("ONNX_EMBEDDER_DIR", "./weights/all-MiniLM-L6-v2-onnx")
+ONNX_EMBEDDER_FILE = os.getenv("ONNX_EMBEDDER_FILE", "model_int8.onnx")  # or model.onnx for fp32
+EMBEDDER_THREADS = int(os.getenv("EMBEDDER_THREADS", "1"))  # Per query; concurrency comes from requests
+MAX_SEQ_LENGTH = 256  # all-MiniLM-L6-v2's max_seq_length; longer texts are truncated as in sentence-transformers
+ENCODE_BATCH_SIZE = 32
+
+
+class OnnxEmbedder:
+    """
+    Transformer in onnxruntime, then mean pooling over real tokens and L2 normalization,
+    matching the Transformer -> Pooling(mean) -> Normalize modules of the original model.
+    """
+
+    def __init__(self, model_dir=ONNX_EMBEDDER_DIR, model_file=ONNX_EMBEDDER_FILE, threads=EMBEDDER_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(os.path.join(model_dir, model_file), options,
+                                                    providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size=ENCODE_BATCH_SIZE, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        embeddings = [self._encode_batch(sentences[lo:lo + batch_size]) for lo in range(0, len(sentences), batch_size)]
+        return np.concatenate(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+
+    def _encode_batch(self, sentences):
+        encodings = self.tokenizer.encode_batch(list(sentences))
+        feeds = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        mask = feeds["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        pooled /= np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+
+def load_embedder(model_name, backend=EMBEDDER_BACKEND):
+    """The configured query embedder; falls back to PyTorch if the ONNX export is missing"""
+    started = time.time()
+    if backend == "onnx":
+        model_path = os.path.join(ONNX_EMBEDDER_DIR, ONNX_EMBEDDER_FILE)
+        if os.path.exists(model_path):
+            embedder = OnnxEmbedder(ONNX_EMBEDDER_DIR, ONNX_EMBEDDER_FILE)
+            print(f"Query embedder: ONNX {model_path} ({time.time() - started:.2f}s)")
+            return embedder
+        print(f"⚠️ {model_path} not found, falling back to PyTorch. Create it with: python query_embedder.py export")
+    from sentence_transformers import SentenceTransformer
+
+    embedder = SentenceTransformer(model_name)
+    print(f"Query embedder: PyTorch {model_name} ({time.time() - started:.2f}s)")
+    return embedder
+
+
+# --- EXPORT ---
+def export_onnx(model_name, output_dir, quantize=True):
+    """Writes model.onnx, tokenizer.json and (with quantize) model_int8.onnx for OnnxEmbedder"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    transformer = SentenceTransformer(model_name, device="cpu")[0]  # The Transformer module: HF model + tokenizer
+    model, tokenizer = transformer.auto_model.eval(), transformer.tokenizer
+    tokenizer.save_pretrained(output_dir)  # Writes tokenizer.json for the fast tokenizer
+
+    sample = tokenizer(["a person walking near the gate"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    torch.onnx.export(
+        model, tuple(sample[name] for name in names), fp32_path,
+        input_names=names, output_names=["last_hidden_state"],
+        dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]},
+        opset_version=17,
+    )
+    print(f"✅ Exported {fp32_path}")
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, "model_int8.onnx")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        print(f"✅ Quantized {int8_path}")
+    with open(os.path.join(output_dir, "export.json"), "w") as f:
+        json.dump({"model_name": model_name, "max_seq_length": MAX_SEQ_LENGTH, "quantized": quantize}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--output", default=ONNX_EMBEDDER_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="Only write the fp32 model")
+    args = parser.parse_args()
+    export_onnx(args.model, args.output, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
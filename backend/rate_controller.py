@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+
+import psutil
+
+from metrics import CAMERA_SAMPLING_FPS, RATE_CONTROLLER_PRESSURE
+
+# --- RATE CONTROLLER CONFIGURATION ---
+CONTROL_INTERVAL = float(os.getenv("RATE_CONTROL_INTERVAL", "5"))     # Seconds between rate adjustments
+TARGET_UTILIZATION = float(os.getenv("RATE_TARGET_UTILIZATION", "0.7"))  # Share of time the chosen rates need for resize + inference
+TARGET_SKIP_RATIO = float(os.getenv("RATE_TARGET_SKIP_RATIO", "0.05"))   # Frames published but never consumed
+TARGET_QUEUE_DEPTH = int(os.getenv("RATE_TARGET_QUEUE_DEPTH", "150"))    # Frames waiting for inference
+TARGET_CPU_PERCENT = float(os.getenv("RATE_TARGET_CPU_PERCENT", "85"))   # Whole machine, all processes
+INCREASE_STEP = 0.5     # fps added per camera per interval when there is headroom
+HEADROOM = 0.8          # Rates only go up while every signal is below this fraction of its target
+SMOOTHING = 0.5         # Weight of the previous intervals; inference arrives in bursts (one batch at a time)
+
+
+class AdaptiveRateController:
+    """
+    Chooses each camera's sampling rate so capture, resize and inference keep up with
+    the hardware. Callers report the frames they handled, the time spent on them, frames
+    that were skipped and the queue depth; every CONTROL_INTERVAL the controller compares
+    the load the current rates ask for (rate x smoothed cost per frame), the skip ratio,
+    queue depth and the machine's CPU with their targets, shrinks the total rate when
+    any is over (multiplicatively) or grows it when all are well under (additively), and
+    splits the total between cameras by weight within each camera's bounds.
+    """
+
+    def __init__(self, parallelism=1, interval=CONTROL_INTERVAL):
+        self.parallelism = parallelism  # Cameras whose inference can run at the same time
+        self.interval = interval
+        self.cameras = {}
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.smoothed = None
+        psutil.cpu_percent(None)  # Prime the counter
+
+    def add_camera(self, camera_name, apply, initial_fps, min_fps, max_fps, weight=1.0):
+        """apply(fps) is called whenever the camera's rate changes"""
+        with self.lock:
+            self.cameras[camera_name] = {
+                "apply": apply,
+                "fps": float(initial_fps),
+                "min_fps": float(min_fps),
+                "max_fps": float(max_fps),
+                "weight": float(weight),
+                "frames": 0,
+                "skipped": 0,
+                "busy": 0.0,
+                "smoothed_busy": 0.0,
+                "smoothed_frames": 0.0,
+                "queue_depth": 0,
+            }
+        apply(float(initial_fps))
+        CAMERA_SAMPLING_FPS.labels(camera=camera_name).set(initial_fps)
+
+    def remove_camera(self, camera_name):
+        with self.lock:
+            self.cameras.pop(camera_name, None)
+
+    def get_fps(self, camera_name):
+        return self.cameras[camera_name]["fps"]
+
+    def observe(self, camera_name, frames=0, busy_seconds=0.0, skipped=0, queue_depth=None):
+        """Reports work done for one camera; adjusts rates when the control interval has elapsed"""
+        with self.lock:
+            camera = self.cameras.get(camera_name)
+            if camera is None:
+                return
+            camera["frames"] += frames
+            camera["busy"] += busy_seconds
+            camera["skipped"] += skipped
+            if queue_depth is not None:
+                camera["queue_depth"] = max(camera["queue_depth"], queue_depth)
+            if time.time() - self.window_start < self.interval:
+                return
+            changes = self._adjust()
+        for apply, fps in changes:
+            apply(fps)
+
+    def _adjust(self):
+        self.window_start = time.time()
+        cameras = self.cameras.values()
+
+        # Offered load rather than measured busy time: frames a slow consumer never got to don't hide the cost
+        utilization = 0.0
+        for camera in cameras:
+            camera["smoothed_busy"] = SMOOTHING * camera["smoothed_busy"] + (1 - SMOOTHING) * camera["busy"]
+            camera["smoothed_frames"] = SMOOTHING * camera["smoothed_frames"] + (1 - SMOOTHING) * camera["frames"]
+            if camera["smoothed_frames"] > 0:
+                utilization += camera["fps"] * camera["smoothed_busy"] / camera["smoothed_frames"]
+        utilization /= self.parallelism
+
+        current = {
+            "frames": sum(camera["frames"] for camera in cameras),
+            "skipped": sum(camera["skipped"] for camera in cameras),
+        }
+        if self.smoothed is None:
+            self.smoothed = current
+        else:
+            self.smoothed = {key: SMOOTHING * self.smoothed[key] + (1 - SMOOTHING) * value
+                             for key, value in current.items()}
+        skip_ratio = self.smoothed["skipped"] / max(1e-6, self.smoothed["frames"] + self.smoothed["skipped"])
+        queue_depth = max((camera["queue_depth"] for camera in cameras), default=0)
+        cpu_percent = psutil.cpu_percent(None)
+        for camera in cameras:
+            camera["frames"] = camera["skipped"] = camera["queue_depth"] = 0
+            camera["busy"] = 0.0
+
+        if skip_ratio <= TARGET_SKIP_RATIO:
+            skip_pressure = skip_ratio / TARGET_SKIP_RATIO
+        else:
+            # Only (1 - skip_ratio) of the rate is actually consumed; scale down to about that
+            skip_pressure = (1 - TARGET_SKIP_RATIO) / max(0.01, 1 - skip_ratio)
+        pressure = max(utilization / TARGET_UTILIZATION, skip_pressure,
+                       queue_depth / TARGET_QUEUE_DEPTH, cpu_percent / TARGET_CPU_PERCENT)
+        RATE_CONTROLLER_PRESSURE.set(pressure)
+
+        total = sum(camera["fps"] for camera in cameras)
+        if pressure > 1.0:
+            total /= min(pressure, 2.0)  # Back off at most by half per interval
+        elif pressure < HEADROOM:
+            total += INCREASE_STEP * len(self.cameras)
+        # Otherwise keep the total, but still apply weight and bound changes
+        changes = []
+        for camera_name, fps in self._share(total).items():
+            camera = self.cameras[camera_name]
+            if abs(fps - camera["fps"]) >= 0.05:
+                camera["fps"] = fps
+                changes.append((camera["apply"], fps))
+                CAMERA_SAMPLING_FPS.labels(camera=camera_name).set(fps)
+        if changes:
+            print(f"🎚️ [PID:{os.getpid()}] Rate controller: pressure {pressure:.2f} (util {utilization:.2f}, "
+                  f"skipped {skip_ratio:.0%}, queue {queue_depth}, CPU {cpu_percent:.0f}%) -> "
+                  + ", ".join(f"{name} {camera['fps']:.1f} fps" for name, camera in self.cameras.items()))
+        return changes
+
+    def _share(self, total):
+        """Splits total fps between cameras in proportion to weight, honouring each camera's bounds"""
+        shares = {}
+        remaining = dict(self.cameras)
+        while remaining:
+            weight_sum = sum(camera["weight"] for camera in remaining.values())
+            budget = total - sum(shares.values())
+            clamped = {}
+            for camera_name, camera in remaining.items():
+                fps = budget * camera["weight"] / weight_sum if weight_sum > 0 else 0.0
+                if fps < camera["min_fps"]:
+                    clamped[camera_name] = camera["min_fps"]
+                elif fps > camera["max_fps"]:
+                    clamped[camera_name] = camera["max_fps"]
+            if not clamped:
+                for camera_name, camera in remaining.items():
+                    shares[camera_name] = budget * camera["weight"] / weight_sum if weight_sum > 0 else camera["min_fps"]
+                break
+            # Fix the cameras that hit a bound and share what is left between the others
+            shares.update(clamped)
+            for camera_name in clamped:
+                del remaining[camera_name]
+        return shares
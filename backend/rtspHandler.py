@@ -2,13 +2,14 @@ import threading
 import time
 import numpy as np
 import cv2
-from queue import Queue, Empty
 from typing import Any
 import os
 import gc
 import random
 import socket
 import psutil
+from collections import deque
+from metrics import CAMERA_FRAMES, stage_timer
 
 try:
     from vidgear.gears import CamGear
@@ -19,8 +20,74 @@ except ImportError:
     print(f"❌ [PID:{os.getpid()}] VidGear not available - install with: pip install vidgear")
     print("   Falling back to threaded OpenCV capture")
 
+DECODE_SECONDS = stage_timer("decode")
+
+# Deployments (and benchmarks on local files) can override the FFmpeg options used by OpenCV
+FFMPEG_CAPTURE_OPTIONS = os.getenv("OPENCV_FFMPEG_CAPTURE_OPTIONS", "rtsp_transport;tcp|video_codec;h264|hwaccel;auto")
+
+
+class PooledFrame:
+    """A reference to a pooled frame buffer; release() it (or use it as a context manager) when done"""
+    def __init__(self, pool, slot, seq=0):
+        self.pool = pool
+        self.slot = slot
+        self.seq = seq
+        self.frame = pool.buffers[slot]
+
+    def retain(self):
+        """Returns another reference to the same buffer, e.g. to hand to a consumer"""
+        self.pool.retain(self.slot)
+        return PooledFrame(self.pool, self.slot, self.seq)
+
+    def release(self):
+        if self.pool is not None:
+            self.pool.release(self.slot)
+            self.pool = None
+            self.frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class FramePool:
+    """
+    Fixed set of preallocated frame buffers shared by a reader thread and its consumers.
+    Each buffer is reference counted and only written again once every holder has
+    released it, so frames are handed over without copies and decoding allocates nothing.
+    """
+    def __init__(self, shape, size=4):
+        self.shape = shape
+        self.buffers = [np.empty(shape, dtype=np.uint8) for _ in range(size)]
+        self.refs = [0] * size
+        self.free = list(range(size))
+        self.lock = threading.Lock()
+
+    def lease(self, seq=0):
+        """Takes a free buffer to write into, or returns None if consumers hold them all"""
+        with self.lock:
+            if not self.free:
+                return None
+            slot = self.free.pop()
+            self.refs[slot] = 1
+        return PooledFrame(self, slot, seq)
+
+    def retain(self, slot):
+        with self.lock:
+            self.refs[slot] += 1
+
+    def release(self, slot):
+        with self.lock:
+            self.refs[slot] -= 1
+            if self.refs[slot] == 0:
+                self.free.append(slot)
+
+
 class RTSPFrameCapture:
-    def __init__(self, rtsp_url, width=1920, height=1080, camera_name="MainCam", required_fps=5, **kwargs) -> Any:
+    def __init__(self, rtsp_url, width=1920, height=1080, camera_name="MainCam", required_fps=5, pool_size=4,
+                 auto_reconnect=True, warm_standby=True, standby_gap=2.0, **kwargs) -> Any:
         self.rtsp_url = rtsp_url
         self.camera_name = camera_name
         self.width = width
@@ -30,7 +97,6 @@ class RTSPFrameCapture:
         self.thread = None
         self.current_frame = None
         self.frame_lock = threading.RLock()  # Use RLock for better performance
-        self.frame_queue = Queue(maxsize=1)  # Ultra-minimal queue for multi-process
         self.fps_estimate = required_fps
         self._fps_timestamps = []   
         self.required_fps = required_fps
@@ -48,15 +114,42 @@ class RTSPFrameCapture:
         self.consecutive_failures = 0
         self.max_consecutive_failures = 15  # Increased tolerance for multi-process
         
-        # Memory optimization
-        self.frame_buffer = None
+        # Memory optimization: frames are decoded into pooled buffers and handed out by reference
+        self.pool_size = pool_size
+        self.frame_pool = None
+        self.current_lease = None
+        self.frame_seq = 0
+        self.pool_exhausted_drops = 0
         self.frame_ready = threading.Event()
+        self.frames_captured = CAMERA_FRAMES.labels(camera=camera_name, outcome="captured")
+        self.frames_dropped = CAMERA_FRAMES.labels(camera=camera_name, outcome="dropped")
         
         # Connection retry parameters
         self.max_retries = 10
         self.base_retry_delay = 1.0
         self.connection_timeout = 15
         
+        # Reconnection: a dead stream is reopened with exponential backoff instead of ending the reader,
+        # and once frames stop for standby_gap seconds a standby connection is opened in parallel
+        self.auto_reconnect = auto_reconnect
+        self.warm_standby = warm_standby
+        self.standby_gap = standby_gap
+        self.reconnect_base_delay = 0.5
+        self.reconnect_max_delay = 30.0
+        self.vidgear_options = {}
+        self.standby = None
+        self.standby_wanted = False
+        self.standby_retry_at = 0
+        self.standby_thread = None
+        self.standby_lock = threading.Lock()
+        
+        # Time-to-recover metrics
+        self.last_good_frame_time = 0
+        self.connection_replaced = False
+        self.reconnect_count = 0
+        self.standby_switches = 0
+        self.recovery_times = deque(maxlen=100)
+        
         # Multi-process safety - randomize initialization delay
         self.init_delay = random.uniform(0.5, 2.0)
         
@@ -96,6 +189,190 @@ class RTSPFrameCapture:
         jitter = random.uniform(0.8, 1.2)
         time.sleep(base_delay * jitter)
 
+    def _lease_buffer(self, shape):
+        """Takes a free pooled buffer of the given shape, rebuilding the pool if the stream resolution changed"""
+        if self.frame_pool is None or self.frame_pool.shape != shape:
+            self.frame_pool = FramePool(shape, self.pool_size)
+        return self.frame_pool.lease(self.frame_seq + 1)
+
+    def _publish(self, lease):
+        """Makes a filled buffer the current frame and drops the reader's reference to the previous one"""
+        with self.frame_lock:
+            previous = self.current_lease
+            self.current_lease = lease
+            self.current_frame = lease.frame
+            self.frame_seq = lease.seq
+            self.frame_ready.set()
+        self.frames_captured.inc()
+        if previous is not None:
+            previous.release()
+
+    def _wait_for_next_frame(self):
+        """Sleeps until the next frame is due instead of spinning"""
+        delay = self.last_frame_time + self.target_frame_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _sleep_while_running(self, delay):
+        """Sleeps up to delay seconds, returning early once stop() is called"""
+        deadline = time.time() + delay
+        while self.running and time.time() < deadline:
+            time.sleep(min(0.1, deadline - time.time()))
+
+    def _open_opencv_capture(self):
+        # Set environment variables for this process with H.264 preference
+        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = FFMPEG_CAPTURE_OPTIONS
+
+        # Bounded reads, so a stalled stream fails over instead of blocking the reader
+        cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG, [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(self.connection_timeout * 1000),
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(max(self.standby_gap, self.target_frame_time) * 1000),
+        ])
+
+        # Multi-process OpenCV optimization settings
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        cap.set(cv2.CAP_PROP_FPS, self.required_fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimal buffer for multi-process
+        cap.set(cv2.CAP_PROP_POS_MSEC, 0)    # Start from current position
+
+        # H.264 specific optimizations
+        try:
+            # Force H.264 codec preference (input codec, not output fourcc)
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('H', '2', '6', '4'))
+            # CAP_PROP_CONVERT_RGB stays on: without it yuv420p streams come back as just the luma plane
+            # Additional H.264 optimizations
+            cap.set(cv2.CAP_PROP_MODE, 0)        # Use default mode for H.264
+        except:
+            pass
+        return cap
+
+    def _open_connection(self):
+        """Opens a new connection with the active backend and waits for its first frame; returns None on failure"""
+        if self.use_vidgear:
+            stream = CamGear(source=self.rtsp_url, colorspace="BGR", logging=False, time_delay=0,
+                             **self.vidgear_options).start()
+            if stream.read() is not None:
+                return stream
+            stream.stop()
+            return None
+        cap = self._open_opencv_capture()
+        if cap.isOpened() and cap.grab():
+            return cap
+        cap.release()
+        return None
+
+    def _close_connection(self, connection):
+        try:
+            if self.use_vidgear:
+                connection.stop()
+            else:
+                connection.release()
+        except Exception as e:
+            print(f"⚠️ [PID:{self.process_id}] [{self.camera_name}] Error closing connection: {e}")
+
+    def _start_standby(self):
+        """Opens a second connection in the background so a stalled stream can switch over without a full handshake"""
+        with self.standby_lock:
+            if not self.warm_standby or self.standby_wanted or time.time() < self.standby_retry_at:
+                return
+            self.standby_wanted = True
+        print(f"🧯 [PID:{self.process_id}] [{self.camera_name}] No frames for {self.standby_gap:.1f}s, opening standby connection")
+        self.standby_thread = threading.Thread(target=self._open_standby, daemon=True,
+                                               name=f"Standby-{self.camera_name}-PID{self.process_id}")
+        self.standby_thread.start()
+
+    def _open_standby(self):
+        try:
+            connection = self._open_connection()
+        except Exception as e:
+            print(f"⚠️ [PID:{self.process_id}] [{self.camera_name}] Standby connection failed: {e}")
+            connection = None
+        with self.standby_lock:
+            if connection is not None and self.standby_wanted and self.running:
+                self.standby = connection
+                return
+            if connection is None:
+                self.standby_retry_at = time.time() + self.standby_gap
+            self.standby_wanted = False
+        if connection is not None:
+            self._close_connection(connection)  # Primary recovered or we're stopping
+
+    def _take_standby(self):
+        with self.standby_lock:
+            connection, self.standby = self.standby, None
+            if connection is not None:
+                self.standby_wanted = False
+        return connection
+
+    def _discard_standby(self):
+        """Drops a standby connection that is no longer needed, or stops one being opened from being kept"""
+        with self.standby_lock:
+            connection, self.standby = self.standby, None
+            self.standby_wanted = False
+        if connection is not None:
+            self._close_connection(connection)
+
+    def _record_good_frame(self, now):
+        """Records time-to-recover when frames resume after a stall or a replaced connection"""
+        if self.last_good_frame_time and (self.connection_replaced or now - self.last_good_frame_time >= self.standby_gap):
+            self.connection_replaced = False
+            recovery = now - self.last_good_frame_time
+            self.recovery_times.append(recovery)
+            print(f"✅ [PID:{self.process_id}] [{self.camera_name}] Stream recovered after {recovery:.1f}s")
+        self.last_good_frame_time = now
+        if self.standby_wanted:
+            self._discard_standby()
+
+    def _handle_failed_read(self, connection):
+        """
+        Called after a failed read. Returns the connection to keep reading from: a warm
+        standby once the stream has stalled and one is ready, a new connection after too
+        many failures, or None if the reader should stop.
+        """
+        if time.time() - self.last_good_frame_time >= self.standby_gap:
+            standby = self._take_standby()
+            if standby is not None:
+                self.standby_switches += 1
+                self.connection_replaced = True
+                print(f"🔀 [PID:{self.process_id}] [{self.camera_name}] Switched to standby connection")
+                self._close_connection(connection)
+                self.consecutive_failures = 0
+                return standby
+            self._start_standby()
+        if self.consecutive_failures < self.max_consecutive_failures:
+            return connection
+        if not self.auto_reconnect:
+            return None
+        return self._reconnect(connection)
+
+    def _reconnect(self, connection):
+        """Replaces a dead connection, preferring a warm standby, with exponential backoff and jitter between attempts"""
+        print(f"🔌 [PID:{self.process_id}] [{self.camera_name}] Stream dead, reconnecting...")
+        self._close_connection(connection)
+        attempt = 0
+        while self.running:
+            if self.standby_thread and self.standby_thread.is_alive():
+                # A standby handshake is already under way; it is further along than a new attempt would be
+                self.standby_thread.join(timeout=self.connection_timeout)
+            connection = self._take_standby()
+            if connection is None:
+                try:
+                    connection = self._open_connection()
+                except Exception as e:
+                    print(f"⚠️ [PID:{self.process_id}] [{self.camera_name}] Reconnect attempt {attempt + 1} failed: {e}")
+            if connection is not None:
+                self.reconnect_count += 1
+                self.connection_replaced = True
+                self.consecutive_failures = 0
+                print(f"✅ [PID:{self.process_id}] [{self.camera_name}] Reconnected after {attempt + 1} attempt(s)")
+                return connection
+            delay = min(self.reconnect_max_delay, self.reconnect_base_delay * (2 ** attempt))
+            attempt += 1
+            print(f"⏳ [PID:{self.process_id}] [{self.camera_name}] Retrying connection in ~{delay:.1f}s...")
+            self._sleep_while_running(delay * random.uniform(0.5, 1.5))
+        return None
+
     def start(self):
         """Start the video frame capture with multi-process safety"""
         print(f"⏳ [PID:{self.process_id}] [{self.camera_name}] Starting initialization...")
@@ -135,6 +412,7 @@ class RTSPFrameCapture:
             # Add process-specific parameters to avoid conflicts
             process_specific_delay = self.process_id % 1000  # Use PID for uniqueness
             options["user_agent"] = f"RTSPCapture-PID{self.process_id}"
+            self.vidgear_options = options  # Reused for reconnects and standby connections
             
             success = self._initialize_stream_with_retry("vidgear", options)
             if success:
@@ -186,7 +464,7 @@ class RTSPFrameCapture:
                     print(f"🔄 [PID:{self.process_id}] [{self.camera_name}] OpenCV attempt {attempt + 1}/{self.max_retries}")
                     
                     # Set environment variables for this process with H.264 preference
-                    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|video_codec;h264|hwaccel;auto"
+                    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = FFMPEG_CAPTURE_OPTIONS
                     
                     cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
                     
@@ -223,60 +501,47 @@ class RTSPFrameCapture:
         frame_count = 0
         last_fps_time = time.time()
         fps_frame_count = 0
+        self.last_good_frame_time = time.time()
         
         print(f"🎬 [PID:{self.process_id}] [{self.camera_name}] VidGear frame reading thread started")
         
         while self.running:
             try:
+                self._wait_for_next_frame()
                 current_time = time.time()
                 
-                # Adaptive frame rate control with jitter for multi-process
-                frame_interval = self.target_frame_time * random.uniform(0.9, 1.1)
-                if current_time - self.last_frame_time < frame_interval:
-                    time.sleep(0.001)  # Micro-sleep to prevent CPU hammering
-                    continue
-                
                 # Read frame from VidGear CamGear
-                frame = self.stream.read()
+                with DECODE_SECONDS.time():
+                    frame = self.stream.read()
                 
                 if frame is not None:
                     frame_count += 1
                     fps_frame_count += 1
                     self.consecutive_failures = 0
                     self.last_frame_time = current_time
+                    self._record_good_frame(current_time)
                     
-                    # Update current frame (minimal locking for multi-process)
-                    with self.frame_lock:
-                        self.current_frame = frame
-                        self.frame_ready.set()
-                    
-                    # Ultra-minimal queue management for multi-process
-                    try:
-                        # Clear all old frames and keep only the latest
-                        while not self.frame_queue.empty():
-                            try:
-                                self.frame_queue.get_nowait()
-                            except Empty:
-                                break
-                        self.frame_queue.put_nowait(frame)
-                    except:
-                        pass  # Queue operations are non-critical
+                    # CamGear decodes into its own arrays, so copy into a pooled buffer consumers can hold
+                    lease = self._lease_buffer(frame.shape)
+                    if lease is None:
+                        self.pool_exhausted_drops += 1
+                        self.frames_dropped.inc()
+                    else:
+                        np.copyto(lease.frame, frame)
+                        self._publish(lease)
                     
                     # Calculate FPS every second
                     if current_time - last_fps_time >= 1.0:
                         self.fps_estimate = fps_frame_count / (current_time - last_fps_time)
                         fps_frame_count = 0
                         last_fps_time = current_time
-                        if frame_count % (self.required_fps * 10) == 0:  # Log every 10 seconds for multi-process
+                        if frame_count % max(1, int(self.required_fps * 10)) == 0:  # Log every 10 seconds for multi-process
                             print(f"🎯 [PID:{self.process_id}] [{self.camera_name}] Frame {frame_count} | FPS: {self.fps_estimate:.1f}")
-                    
-                    # Aggressive memory management for multi-process
-                    if frame_count % 100 == 0:
-                        gc.collect()
                 
                 else:
                     self.consecutive_failures += 1
-                    if self.consecutive_failures >= self.max_consecutive_failures:
+                    self.stream = self._handle_failed_read(self.stream)
+                    if self.stream is None:
                         print(f"❌ [PID:{self.process_id}] [{self.camera_name}] Too many consecutive failures, stopping")
                         break
                     time.sleep(0.01)  # Brief pause on failure
@@ -284,10 +549,12 @@ class RTSPFrameCapture:
             except Exception as e:
                 print(f"❌ [PID:{self.process_id}] [{self.camera_name}] VidGear frame read error: {e}")
                 self.consecutive_failures += 1
-                if self.consecutive_failures >= self.max_consecutive_failures:
+                self.stream = self._handle_failed_read(self.stream)
+                if self.stream is None:
                     break
                 time.sleep(0.1)
                 
+        self._discard_standby()
         self.stream_ended = True
         print(f"🛑 [PID:{self.process_id}] [{self.camera_name}] VidGear frame reader stopped")
 
@@ -295,78 +562,64 @@ class RTSPFrameCapture:
         """Optimized OpenCV frame reading for multi-process scenarios"""
         print(f"🎬 [PID:{self.process_id}] [{self.camera_name}] OpenCV frame reading thread started")
         
-        # Set H.264 environment variables for this thread
-        os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp|video_codec;h264|hwaccel;auto"
-        
         # Create new connection in this thread to avoid multi-process conflicts
-        cap = cv2.VideoCapture(self.rtsp_url, cv2.CAP_FFMPEG)
-        
-        # Multi-process OpenCV optimization settings
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
-        cap.set(cv2.CAP_PROP_FPS, self.required_fps)
-        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Minimal buffer for multi-process
-        cap.set(cv2.CAP_PROP_POS_MSEC, 0)    # Start from current position
-        
-        # H.264 specific optimizations
-        try:
-            # Force H.264 codec preference (input codec, not output fourcc)
-            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc('H', '2', '6', '4'))
-            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)  # Skip unnecessary conversions for efficiency
-            # Additional H.264 optimizations
-            cap.set(cv2.CAP_PROP_MODE, 0)        # Use default mode for H.264
-        except:
-            pass
+        cap = self._open_opencv_capture()
         
         frame_count = 0
         last_time = time.time()
+        self.last_good_frame_time = time.time()
         
+        frame_shape = None
         while self.running:
             try:
+                self._wait_for_next_frame()
                 current_time = time.time()
                 
-                # Frame rate control with jitter for multi-process
-                frame_interval = self.target_frame_time * random.uniform(0.9, 1.1)
-                if current_time - self.last_frame_time < frame_interval:
-                    time.sleep(0.001)
-                    continue
-                
-                ret, frame = cap.read()
+                # Decode straight into a free pooled buffer once the frame size is known
+                lease = self._lease_buffer(frame_shape) if frame_shape else None
+                if frame_shape and lease is None:
+                    # Consumers hold every buffer: keep the stream moving without decoding
+                    self.pool_exhausted_drops += 1
+                    self.frames_dropped.inc()
+                    ret, frame = cap.grab(), None
+                    if ret:
+                        self.consecutive_failures = 0
+                        self.last_frame_time = current_time
+                        self._record_good_frame(current_time)
+                        continue
+                elif lease is not None:
+                    with DECODE_SECONDS.time():
+                        ret, frame = cap.read(lease.frame)
+                else:
+                    with DECODE_SECONDS.time():
+                        ret, frame = cap.read()
                 
                 if ret and frame is not None:
                     frame_count += 1
                     self.consecutive_failures = 0
                     self.last_frame_time = current_time
+                    self._record_good_frame(current_time)
                     
-                    # Update current frame (minimal locking for multi-process)
-                    with self.frame_lock:
-                        self.current_frame = frame
-                        self.frame_ready.set()
-                    
-                    # Ultra-minimal queue management for multi-process
-                    try:
-                        # Clear all old frames and keep only the latest
-                        while not self.frame_queue.empty():
-                            try:
-                                self.frame_queue.get_nowait()
-                            except Empty:
-                                break
-                        self.frame_queue.put_nowait(frame)
-                    except:
-                        pass
+                    if lease is None or frame is not lease.frame:
+                        # First frame, or the stream changed resolution: size the pool from it
+                        if lease is not None:
+                            lease.release()
+                        frame_shape = frame.shape
+                        lease = self._lease_buffer(frame_shape)
+                        np.copyto(lease.frame, frame)
+                    self._publish(lease)
                         
                     # Log every 10 seconds for multi-process scenarios
                     if current_time - last_time >= 10.0:
                         print(f"📹 [PID:{self.process_id}] [{self.camera_name}] OpenCV Frame {frame_count}")
                         last_time = current_time
-                    
-                    # Aggressive memory management for multi-process
-                    if frame_count % 100 == 0:
-                        gc.collect()
                         
                 else:
+                    if lease is not None:
+                        lease.release()
                     self.consecutive_failures += 1
-                    if self.consecutive_failures >= self.max_consecutive_failures:
+                    cap = self._handle_failed_read(cap)
+                    if cap is None:
                         print(f"❌ [PID:{self.process_id}] [{self.camera_name}] OpenCV: Too many failures, stopping")
                         break
                     time.sleep(0.01)
@@ -374,19 +627,27 @@ class RTSPFrameCapture:
             except Exception as e:
                 print(f"❌ [PID:{self.process_id}] [{self.camera_name}] OpenCV frame read error: {e}")
                 self.consecutive_failures += 1
-                if self.consecutive_failures >= self.max_consecutive_failures:
+                cap = self._handle_failed_read(cap)
+                if cap is None:
                     break
                 time.sleep(0.1)
         
-        cap.release()
+        if cap is not None:
+            cap.release()
+        self._discard_standby()
         self.stream_ended = True
         print(f"🛑 [PID:{self.process_id}] [{self.camera_name}] OpenCV frame reader stopped")
             
     def get_fps(self):
         return self.fps_estimate
+
+    def set_required_fps(self, fps):
+        """Changes the sampling rate of a running capture; takes effect from the next frame"""
+        self.required_fps = fps
+        self.target_frame_time = 1.0 / fps
     
     def get_frame(self):
-        """Returns the most recent frame (optimized for speed)"""
+        """Returns a copy of the most recent frame; acquire_frame() avoids the copy"""
         if not self.frame_ready.is_set():
             return None
             
@@ -395,14 +656,43 @@ class RTSPFrameCapture:
                 return self.current_frame.copy()
         return None
     
-    def get_frame_nowait(self):
-        """Get frame without copying (faster but frame may change)"""
+    def acquire_frame(self):
+        """
+        Returns a PooledFrame referencing the most recent frame without copying it. The
+        buffer is not reused until the caller releases it; its seq increases with every
+        new frame, so callers can tell a new frame from one they've already seen.
+        """
         if not self.frame_ready.is_set():
             return None
-        return self.current_frame
+            
+        with self.frame_lock:
+            if self.current_lease is not None:
+                return self.current_lease.retain()
+        return None
+    
+    def get_frame_nowait(self):
+        """
+        Kept for older callers; same as get_frame(). The pooled buffer behind current_frame
+        is overwritten by later frames, so it can't be handed out without a lease.
+        """
+        return self.get_frame()
         
     def is_stream_dead(self):
         return self.stream_ended or self.consecutive_failures >= self.max_consecutive_failures
+
+    def get_recovery_stats(self):
+        """Reconnect counts and time-to-recover (seconds) of past outages for this camera"""
+        recoveries = list(self.recovery_times)
+        stalled_for = time.time() - self.last_good_frame_time if self.last_good_frame_time else 0
+        return {
+            "reconnects": self.reconnect_count,
+            "standby_switches": self.standby_switches,
+            "recoveries": len(recoveries),
+            "last_recovery_s": recoveries[-1] if recoveries else None,
+            "mean_recovery_s": sum(recoveries) / len(recoveries) if recoveries else None,
+            "max_recovery_s": max(recoveries) if recoveries else None,
+            "stalled_for_s": stalled_for if stalled_for >= self.standby_gap else 0,
+        }
     
     def stop(self):
         """Stop thread and clean resources with multi-process safety"""
@@ -420,16 +710,14 @@ class RTSPFrameCapture:
                 print(f"🛑 [PID:{self.process_id}] [{self.camera_name}] VidGear CamGear stream stopped")
             except Exception as e:
                 print(f"⚠️ [PID:{self.process_id}] [{self.camera_name}] Error stopping VidGear: {e}")
+        self._discard_standby()
         
-        # Clear queues and buffers aggressively for multi-process
-        try:
-            while not self.frame_queue.empty():
-                self.frame_queue.get_nowait()
-        except:
-            pass
-            
-        self.current_frame = None
-        self.frame_buffer = None
+        # Drop the reader's reference; buffers still leased to consumers stay valid until released
+        with self.frame_lock:
+            if self.current_lease is not None:
+                self.current_lease.release()
+            self.current_lease = None
+            self.current_frame = None
         self.frame_ready.clear()
         
         # Aggressive garbage collection for multi-process
@@ -471,7 +759,7 @@ class MultiCameraManager:
         frames = {}
         for name, camera in self.cameras.items():
             if not camera.is_stream_dead():
-                frame = camera.get_frame_nowait()  # Use faster non-copying method
+                frame = camera.get_frame()  # Callers keep these, so copies rather than pooled buffers
                 if frame is not None:
                     frames[name] = frame
         return frames
@@ -494,9 +782,10 @@ class MultiCameraManager:
                     
                     active_cameras = sum(1 for cam in self.cameras.values() if not cam.is_stream_dead())
                     total_fps = sum(cam.get_fps() for cam in self.cameras.values())
+                    reconnects = sum(cam.reconnect_count + cam.standby_switches for cam in self.cameras.values())
                     
                     print(f"📊 [PID:{self.process_id}] Performance: CPU: {cpu_percent:.1f}% | Memory: {memory_mb:.1f}MB | "
-                          f"Active Cameras: {active_cameras} | Total FPS: {total_fps:.1f}")
+                          f"Active Cameras: {active_cameras} | Total FPS: {total_fps:.1f} | Reconnects: {reconnects}")
                     
                     time.sleep(15)  # Monitor every 15 seconds for multi-process scenarios
                 except Exception as e:
@@ -0,0 +1,315 @@
+# File: scoring_head.py
+"""
+Scoring heads: turn ResNet features into calibrated anomaly scores with plain NumPy.
+
+A head returns the log-odds that a frame is anomalous, so above 0 means anomalous
+(probability above 0.5). Heads are exported once from the joblib SVM and saved as .npz:
+
+  linear     w.x + b for linear SVMs/classifiers; exact
+  rbf        sum(alpha * exp(-gamma |x - sv|^2)) + b over every support vector; exact,
+             but as one matrix product per batch instead of libsvm's per-pair loop
+  nystroem   the same sum over `components` sampled support vectors, with weights
+             fitted to the SVM's margins at all support vectors; approximate, cost
+             independent of the support vector count
+  rff        random Fourier features of the RBF kernel; approximate
+
+Calibration (Platt scaling) comes from a CalibratedClassifierCV(method="sigmoid") pickle,
+or is fitted from labelled features with --calibration; otherwise the raw margin is used.
+Classifiers are oriented by their classes_; models without them (OneClassSVM) need
+--anomaly-sign or ANOMALY_SIGN.
+
+Usage: python scoring_head.py weights/svm_model.pkl [--method auto|linear|rbf|nystroem|rff]
+                              [--components 512] [--calibration labelled.npz] [--output weights/scoring_head.npz]
+                              [--anomaly-sign 1|-1]
+"""
+import argparse
+import os
+
+import joblib
+import numpy as np
+
+# --- SCORING HEAD CONFIGURATION ---
+NYSTROEM_COMPONENTS = int(os.getenv("NYSTROEM_COMPONENTS", "512"))
+RFF_COMPONENTS = int(os.getenv("RFF_COMPONENTS", "4096"))
+KERNEL_CHUNK_ROWS = 256  # Rows per kernel block; bounds the (rows x centers) temporary
+ANOMALY_LABEL = 1
+# Orientation of decision_function for models without classes_: 1 if positive means anomalous,
+# -1 if positive means normal (a OneClassSVM trained on normal footage). Unset means infer from classes_.
+ANOMALY_SIGN = os.getenv("ANOMALY_SIGN")
+
+
+class ScoringHead:
+    """
+    Base head. decision() is the model's raw margin (positive = anomalous); score() applies
+    the Platt calibration, slope * margin + offset, giving log-odds of an anomaly.
+    """
+    kind = ""
+
+    def __init__(self, slope=1.0, offset=0.0, mean=None, scale=None):
+        self.slope = float(slope)
+        self.offset = float(offset)
+        self.mean = mean      # Optional StandardScaler folded in front of the model
+        self.scale = scale
+
+    def _prepare(self, features):
+        features = np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+        if self.mean is not None:
+            features = (features - self.mean) / self.scale
+        return features
+
+    def decision(self, features):
+        raise NotImplementedError
+
+    def score(self, features):
+        return (self.slope * self.decision(features) + self.offset).astype(np.float32)
+
+    def probability(self, features):
+        return 1.0 / (1.0 + np.exp(-self.score(features)))
+
+    def _arrays(self):
+        return {}
+
+    def save(self, path):
+        arrays = self._arrays()
+        if self.mean is not None:
+            arrays.update(mean=self.mean, scale=self.scale)
+        np.savez(path, kind=self.kind, slope=self.slope, offset=self.offset, **arrays)
+
+
+class SklearnHead(ScoringHead):
+    """The pickled model itself, oriented so positive means anomalous"""
+    kind = "sklearn"
+
+    def __init__(self, model, anomaly_sign=None, **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+        self.sign = _anomaly_sign(model, anomaly_sign)
+
+    def _prepare(self, features):
+        return np.asarray(features, dtype=np.float32).reshape(len(features), -1)
+
+    def decision(self, features):
+        return self.sign * self.model.decision_function(self._prepare(features))
+
+    def save(self, path):
+        raise ValueError("SklearnHead wraps a pickle; export a linear, rbf, nystroem or rff head instead")
+
+
+class LinearHead(ScoringHead):
+    kind = "linear"
+
+    def __init__(self, weights, intercept, **kwargs):
+        super().__init__(**kwargs)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.intercept = float(intercept)
+
+    def decision(self, features):
+        return self._prepare(features) @ self.weights + self.intercept
+
+    def _arrays(self):
+        return {"weights": self.weights, "intercept": self.intercept}
+
+
+class KernelHead(ScoringHead):
+    """
+    sum_i weights_i * exp(-gamma |x - center_i|^2) + intercept. With the support vectors as
+    centers and the dual coefficients as weights this is the SVM's decision function.
+    """
+    kind = "rbf"
+
+    def __init__(self, centers, weights, intercept, gamma, kind=None, **kwargs):
+        super().__init__(**kwargs)
+        self.centers = np.asarray(centers, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.intercept = float(intercept)
+        self.gamma = float(gamma)
+        self.center_norms = np.einsum("ij,ij->i", self.centers, self.centers)
+        if kind:
+            self.kind = kind
+
+    def decision(self, features):
+        features = self._prepare(features)
+        out = np.empty(len(features), dtype=np.float32)
+        for lo in range(0, len(features), KERNEL_CHUNK_ROWS):
+            out[lo:lo + KERNEL_CHUNK_ROWS] = rbf_kernel(features[lo:lo + KERNEL_CHUNK_ROWS], self.centers,
+                                                        self.gamma, self.center_norms) @ self.weights
+        return out + self.intercept
+
+    def _arrays(self):
+        return {"centers": self.centers, "weights": self.weights, "intercept": self.intercept, "gamma": self.gamma}
+
+
+class RandomFeatureHead(ScoringHead):
+    """RBF kernel approximated by random Fourier features: sqrt(2/D) cos(x W + phase) . weights + intercept"""
+    kind = "rff"
+
+    def __init__(self, projection, phase, weights, intercept, **kwargs):
+        super().__init__(**kwargs)
+        self.projection = np.asarray(projection, dtype=np.float32)
+        self.phase = np.asarray(phase, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.intercept = float(intercept)
+
+    def transform(self, features):
+        return np.sqrt(2.0 / len(self.phase)) * np.cos(features @ self.projection + self.phase)
+
+    def decision(self, features):
+        return self.transform(self._prepare(features)) @ self.weights + self.intercept
+
+    def _arrays(self):
+        return {"projection": self.projection, "phase": self.phase, "weights": self.weights,
+                "intercept": self.intercept}
+
+
+def rbf_kernel(features, centers, gamma, center_norms=None):
+    """exp(-gamma |x - c|^2) for every row/center pair, as one matrix product"""
+    if center_norms is None:
+        center_norms = np.einsum("ij,ij->i", centers, centers)
+    distances = np.einsum("ij,ij->i", features, features)[:, None] + center_norms[None, :] - 2 * features @ centers.T
+    np.maximum(distances, 0, out=distances)  # Rounding can leave tiny negatives
+    return np.exp(-gamma * distances)
+
+
+def load_head(path):
+    data = np.load(path)
+    kind = str(data["kind"])
+    common = {"slope": float(data["slope"]), "offset": float(data["offset"]),
+              "mean": data["mean"] if "mean" in data else None, "scale": data["scale"] if "scale" in data else None}
+    if kind == "linear":
+        return LinearHead(data["weights"], float(data["intercept"]), **common)
+    if kind in ("rbf", "nystroem"):
+        return KernelHead(data["centers"], data["weights"], float(data["intercept"]), float(data["gamma"]),
+                          kind=kind, **common)
+    if kind == "rff":
+        return RandomFeatureHead(data["projection"], data["phase"], data["weights"], float(data["intercept"]), **common)
+    raise ValueError(f"Unknown scoring head kind '{kind}' in {path}")
+
+
+# --- EXPORT ---
+def _anomaly_sign(model, anomaly_sign=None):
+    """+1 or -1, so that sign * decision_function is positive for anomalies"""
+    if anomaly_sign is None:
+        anomaly_sign = ANOMALY_SIGN
+    if anomaly_sign is not None:
+        if float(anomaly_sign) not in (1.0, -1.0):
+            raise ValueError(f"The anomaly sign must be 1 or -1, got {anomaly_sign!r}")
+        return float(anomaly_sign)
+    if not hasattr(model, "classes_"):
+        # A OneClassSVM, say, is positive for inliers; guessing would invert every score
+        raise ValueError(f"{type(model).__name__} has no classes_, so its orientation is unknown; "
+                         f"pass --anomaly-sign (or set ANOMALY_SIGN) to 1 if its positive margin means anomalous, "
+                         f"-1 if it means normal")
+    # decision_function is positive for classes_[1]; flip it if that isn't the anomaly label
+    return 1.0 if list(model.classes_)[-1] == ANOMALY_LABEL else -1.0
+
+
+def _unwrap(model):
+    """(estimator, scaler, platt) from a bare estimator, a Pipeline ending in one, or a sigmoid CalibratedClassifierCV"""
+    platt = None
+    if hasattr(model, "calibrated_classifiers_"):
+        calibrated = model.calibrated_classifiers_
+        if len(calibrated) != 1 or not hasattr(calibrated[0].calibrators[0], "a_"):
+            raise ValueError("Only CalibratedClassifierCV(method='sigmoid', ensemble=False) can be exported")
+        calibrator = calibrated[0].calibrators[0]
+        platt = (float(calibrator.a_), float(calibrator.b_))
+        model = calibrated[0].estimator
+    scaler = None
+    if hasattr(model, "steps"):
+        *preprocessing, (_, model) = model.steps
+        for _, step in preprocessing:
+            if scaler is not None or not hasattr(step, "mean_"):
+                raise ValueError(f"Only a single StandardScaler can precede the model, found {type(step).__name__}")
+            scaler = (step.mean_.astype(np.float32) if step.with_mean else np.float32(0),
+                      step.scale_.astype(np.float32) if step.with_std else np.float32(1))
+    return model, scaler, platt
+
+
+def export_head(model, method="auto", components=None, seed=0, anomaly_sign=None):
+    """
+    Builds the NumPy head for a fitted sklearn model (see the module docstring for methods).
+    anomaly_sign is required for models without classes_, see _anomaly_sign().
+    """
+    estimator, scaler, platt = _unwrap(model)
+    sign = _anomaly_sign(estimator, anomaly_sign)
+    common = {}
+    if scaler is not None:
+        common.update(mean=scaler[0], scale=scaler[1])
+    if platt is not None:
+        # sklearn's sigmoid calibration is P(classes_[1]) = 1 / (1 + exp(a * d + b)) on the classes_[1]
+        # margin d; on the anomaly margin (sign * d) the anomaly log-odds are -a * margin - sign * b
+        a, b = platt
+        common.update(slope=-a, offset=-sign * b)
+
+    kernel = getattr(estimator, "kernel", "linear")
+    if method == "auto":
+        # The approximations trade accuracy for speed; check them with benchmark_scoring_head.py before opting in
+        method = "linear" if kernel == "linear" else "rbf"
+
+    if method == "linear":
+        if kernel != "linear" or not hasattr(estimator, "coef_"):
+            raise ValueError(f"A linear head needs a linear model, got kernel '{kernel}'")
+        return LinearHead(sign * np.ravel(estimator.coef_), sign * float(np.ravel(estimator.intercept_)[0]), **common)
+
+    if kernel != "rbf":
+        raise ValueError(f"Kernel '{kernel}' can't be exported; only linear and rbf are supported")
+    support_vectors = estimator.support_vectors_.astype(np.float32)
+    alpha = sign * estimator.dual_coef_.ravel().astype(np.float64)
+    intercept = sign * float(estimator.intercept_[0])
+    gamma = float(estimator._gamma)
+    rng = np.random.default_rng(seed)
+
+    exact = KernelHead(support_vectors, alpha, intercept, gamma, **common)
+    if method == "rbf":
+        return exact
+    if method == "nystroem":
+        count = min(components or NYSTROEM_COMPONENTS, len(support_vectors))
+        landmarks = support_vectors[np.sort(rng.choice(len(support_vectors), count, replace=False))]
+        # Least squares on the exact margins at the support vectors, which sit along the decision
+        # boundary; this tracked the SVM more closely than the K_LL^+ K_LS projection
+        targets = exact.decision(support_vectors).astype(np.float64) - intercept
+        k_sl = rbf_kernel(support_vectors.astype(np.float64), landmarks.astype(np.float64), gamma)
+        weights = np.linalg.lstsq(k_sl, targets, rcond=None)[0]
+        return KernelHead(landmarks, weights, intercept, gamma, kind="nystroem", **common)
+    if method == "rff":
+        count = components or RFF_COMPONENTS
+        projection = rng.normal(0.0, np.sqrt(2 * gamma), (support_vectors.shape[1], count)).astype(np.float32)
+        phase = rng.uniform(0, 2 * np.pi, count).astype(np.float32)
+        head = RandomFeatureHead(projection, phase, np.zeros(count, dtype=np.float32), intercept, **common)
+        head.weights = (head.transform(support_vectors).astype(np.float64).T @ alpha).astype(np.float32)
+        return head
+    raise ValueError(f"Unknown export method '{method}'")
+
+
+def fit_calibration(head, features, labels):
+    """Fits Platt scaling on labelled features (label 1 = anomaly) and stores it on the head"""
+    from sklearn.linear_model import LogisticRegression
+
+    margins = head.decision(features).reshape(-1, 1)
+    platt = LogisticRegression(C=1e6).fit(margins, np.asarray(labels) == ANOMALY_LABEL)
+    head.slope, head.offset = float(platt.coef_[0, 0]), float(platt.intercept_[0])
+    return head
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="joblib pickle of the fitted model")
+    parser.add_argument("--method", choices=["auto", "linear", "rbf", "nystroem", "rff"], default="auto")
+    parser.add_argument("--components", type=int, help="Landmarks (nystroem) or random features (rff)")
+    parser.add_argument("--calibration", help=".npz with 'features' and 'labels' to fit Platt scaling on")
+    parser.add_argument("--anomaly-sign", type=int, choices=[1, -1],
+                        help="1 if the model's positive margin means anomalous, -1 if normal; "
+                             "required for models without classes_ (e.g. OneClassSVM)")
+    parser.add_argument("--output", default="./weights/scoring_head.npz")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    head = export_head(model, args.method, args.components, anomaly_sign=args.anomaly_sign)
+    if args.calibration:
+        data = np.load(args.calibration)
+        fit_calibration(head, data["features"], data["labels"])
+    head.save(args.output)
+    print(f"✅ Exported {head.kind} head (slope {head.slope:.4g}, offset {head.offset:.4g}) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
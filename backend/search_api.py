@@ -1,20 +1,49 @@
 # backend/search_api.py
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 import faiss
 import json
 import os
+import threading
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
 import cv2
 import tempfile
 import ffmpeg
+from feature_store import FEATURE_STORE_DIR, FeatureIndex
+from index_shards import PREVIEW_DIR, SHARD_DIR, camera_name_for, clip_cache_path, read_manifest, shard_files, video_key
+from metrics import add_metrics_route, stage_timer
+from query_embedder import load_embedder
+from tracing import add_trace_routes, new_trace_id, span
 
 # Config
+# Single-file library, served until indexing.py has migrated it into SHARD_DIR
 FAISS_INDEX_PATH = "video_library.faiss"
 METADATA_PATH = "video_library_metadata.json"
+GENERATION_PATH = "video_library_generation.json"
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
+TOP_K = 10
+EMBED_SECONDS = stage_timer("embed")
+SEARCH_SECONDS = stage_timer("faiss_search")
+CLIP_SECONDS = stage_timer("clip_extraction")
+INDEX_POLL_SECONDS = float(os.getenv("SEARCH_INDEX_POLL_SECONDS", "5"))
+# Shards searched concurrently per query; FAISS releases the GIL while it scans
+SEARCH_FANOUT_WORKERS = int(os.getenv("SEARCH_FANOUT_WORKERS", str(min(8, os.cpu_count() or 1))))
+# mmap keeps flat indexes out of the heap; off by default on Windows, where a mapped file can't be deleted by indexing.py
+INDEX_MMAP = os.getenv("SEARCH_INDEX_MMAP", "1" if os.name != "nt" else "0") == "1"
+# Thumbnails and sprite sheets under PREVIEW_DIR are written by indexing.py; a segment's files don't change once written
+PREVIEW_CACHE_SECONDS = int(os.getenv("PREVIEW_CACHE_SECONDS", str(7 * 24 * 3600)))
+CLIP_CACHE_SECONDS = 3600
+# Visual search over the ResNet features the live pipeline stores (see feature_store.py)
+VISUAL_TOP_K = 20
+VISUAL_SEARCH_SECONDS = stage_timer("visual_search")
 
 # Init FastAPI
 app = FastAPI()
@@ -28,22 +57,235 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with a Cache-Control header; ETag/Last-Modified revalidation comes with StaticFiles"""
+    def __init__(self, *args, max_age, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}"
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
+
+
 # Mount system temp directory to serve clips
 app.mount("/temp", StaticFiles(directory=tempfile.gettempdir()), name="temp")
+os.makedirs(PREVIEW_DIR, exist_ok=True)
+app.mount("/previews", CachedStaticFiles(directory=PREVIEW_DIR, max_age=PREVIEW_CACHE_SECONDS), name="previews")
+add_metrics_route(app)
+add_trace_routes(app)
+
+# Load models (EMBEDDER_BACKEND=onnx skips PyTorch entirely, see query_embedder.py)
+embedder = load_embedder(EMBEDDING_MODEL_NAME)
+
+
+def parse_datetime(value):
+    """Parses 'YYYY-MM-DD HH:MM:SS' (or any ISO 8601 string) into epoch seconds"""
+    return datetime.fromisoformat(value).timestamp()
+
+
+def build_filter_index(metadata_store):
+    """
+    Precomputes the sorted time index and per-video/per-camera id lists used to
+    turn /search predicates into a FAISS id selector without touching the vectors,
+    and the per-video-key id lists /clip looks segments up in.
+    """
+    starts = np.array([parse_datetime(m["absolute_start_time"]) for m in metadata_store], dtype=np.float64)
+    ends = np.array([parse_datetime(m["absolute_end_time"]) for m in metadata_store], dtype=np.float64)
+    order = np.argsort(starts, kind="stable").astype(np.int64)
+
+    by_video = defaultdict(list)
+    by_camera = defaultdict(list)
+    by_key = defaultdict(list)
+    for i, m in enumerate(metadata_store):
+        by_video[os.path.basename(m["video_path"])].append(i)
+        by_camera[camera_name_for(m)].append(i)
+        by_key[video_key(m["video_path"])].append(i)
+
+    return {
+        "order": order,
+        "sorted_starts": starts[order],
+        "ends": ends,
+        # Longest segment, so a range lookup on start times can't miss a segment that began earlier
+        "max_duration": float((ends - starts).max()) if len(starts) else 0.0,
+        "by_video": {k: np.array(v, dtype=np.int64) for k, v in by_video.items()},
+        "by_camera": {k: np.array(v, dtype=np.int64) for k, v in by_camera.items()},
+        "by_key": {k: np.array(v, dtype=np.int64) for k, v in by_key.items()},
+    }
+
+
+def select_ids(filter_index, start=None, end=None, video=None, camera=None):
+    """
+    Resolves the search predicates to the matching metadata ids.
+
+    Returns:
+        None if no predicate was given, otherwise a sorted int64 array of ids
+        whose segment overlaps [start, end] and belongs to the video/camera.
+    """
+    if start is None and end is None and video is None and camera is None:
+        return None
+
+    ids = None
+    if start is not None or end is not None:
+        start_ts = parse_datetime(start) if start is not None else -np.inf
+        end_ts = parse_datetime(end) if end is not None else np.inf
+        sorted_starts = filter_index["sorted_starts"]
+        lo = np.searchsorted(sorted_starts, start_ts - filter_index["max_duration"], side="left")
+        hi = np.searchsorted(sorted_starts, end_ts, side="right")
+        candidates = filter_index["order"][lo:hi]
+        ids = np.sort(candidates[filter_index["ends"][candidates] >= start_ts])
+
+    for key, value in (("by_video", video), ("by_camera", camera)):
+        if value is None:
+            continue
+        matched = filter_index[key].get(value, np.empty(0, dtype=np.int64))
+        ids = matched if ids is None else np.intersect1d(ids, matched, assume_unique=True)
+
+    return ids
+
+
+# --- INDEX GENERATIONS ---
+class Shard:
+    """One shard's index and metadata; reused by later generations while its version is unchanged"""
+    def __init__(self, shard_id, info, index, metadata_store):
+        self.shard_id = shard_id
+        self.version = info.get("version")
+        self.camera = info.get("camera")  # None for the legacy single-file library, which mixes cameras
+        self.min_start = parse_datetime(info["min_start"]) if "min_start" in info else -np.inf
+        self.max_end = parse_datetime(info["max_end"]) if "max_end" in info else np.inf
+        self.index = index
+        self.metadata_store = metadata_store
+        self.filter_index = build_filter_index(metadata_store)
+
+    def may_match(self, start_ts, end_ts, camera):
+        """False when the time or camera filter rules out every segment in the shard"""
+        if camera is not None and self.camera is not None and camera != self.camera:
+            return False
+        return self.max_end >= start_ts and self.min_start <= end_ts
+
+
+class LibraryGeneration:
+    """The shards of one published manifest; never mutated once published"""
+    def __init__(self, generation, shards):
+        self.generation = generation
+        self.shards = shards
+        self.entries = sum(shard.index.ntotal for shard in shards.values())
+        self.loaded_at = datetime.now()
+
+
+def read_generation_marker():
+    """
+    Identifies the library generation on disk: the shard manifest's generation, or for a
+    library indexing.py hasn't sharded yet, the legacy marker (or file mtimes before that).
+    """
+    manifest = read_manifest(SHARD_DIR)
+    if manifest is not None:
+        return {"generation": f"shards-{manifest['generation']}", "state": "ready", "manifest": manifest}
+    if os.path.exists(GENERATION_PATH):
+        try:
+            with open(GENERATION_PATH, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"state": "writing"}  # Caught mid-replace, try again next poll
+    try:
+        return {
+            "generation": f"{os.stat(FAISS_INDEX_PATH).st_mtime_ns}-{os.stat(METADATA_PATH).st_mtime_ns}",
+            "state": "ready",
+        }
+    except OSError:
+        return {"state": "missing"}
+
+
+def read_faiss_index(path):
+    if INDEX_MMAP:
+        try:
+            flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+            return faiss.read_index(path, flags)
+        except Exception:
+            pass  # Index type can't be mapped, read it into memory instead
+    return faiss.read_index(path)
+
+
+def load_shard(shard_id, info, index_path, metadata_path):
+    index = read_faiss_index(index_path)
+    with open(metadata_path, "r") as f:
+        metadata_store = json.load(f)
+    if index.ntotal != len(metadata_store):
+        raise ValueError(f"Shard {shard_id}: {index.ntotal} vectors but {len(metadata_store)} metadata entries")
+    return Shard(shard_id, info, index, metadata_store)
+
+
+def load_generation(previous=None):
+    """
+    Loads the library described by the current marker. Shard files are immutable, so only
+    shards whose version differs from the previous generation are read. The legacy pair
+    is checked against its marker before and after reading; if indexing.py started
+    writing in between, None is returned so the caller retries on the next poll.
+    """
+    marker = read_generation_marker()
+    if marker.get("state") != "ready":
+        return None
 
-# Load models/index
-embedder = SentenceTransformer(EMBEDDING_MODEL_NAME)
-index = faiss.read_index(FAISS_INDEX_PATH)
-with open(METADATA_PATH, "r") as f:
-    metadata_store = json.load(f)
+    if "manifest" in marker:
+        loaded = previous.shards if previous is not None else {}
+        shards = {}
+        for shard_id, info in marker["manifest"]["shards"].items():
+            shard = loaded.get(shard_id)
+            if shard is None or shard.version != info["version"]:
+                shard = load_shard(shard_id, info, *shard_files(SHARD_DIR, shard_id, info["version"]))
+            shards[shard_id] = shard
+        return LibraryGeneration(marker["generation"], shards)
 
+    try:
+        shard = load_shard("legacy", {}, FAISS_INDEX_PATH, METADATA_PATH)
+    except ValueError:
+        return None
+    if read_generation_marker() != marker:
+        return None
+    return LibraryGeneration(marker["generation"], {"legacy": shard})
 
-def extract_clip(video_path, start_frame, fps, duration_sec=20):
+
+def watch_index_generation():
+    """Background reload: requests keep using the generation they started with"""
+    global current_generation
+    while True:
+        time.sleep(INDEX_POLL_SECONDS)
+        try:
+            marker = read_generation_marker()
+            if marker.get("state") != "ready" or marker.get("generation") == current_generation.generation:
+                continue
+            new_generation = load_generation(current_generation)
+            if new_generation is None:
+                continue
+            current_generation = new_generation  # Single reference swap, all shards move together
+            print(f"Loaded index generation {new_generation.generation} "
+                  f"({len(new_generation.shards)} shards, {new_generation.entries} entries)")
+        except Exception as e:
+            print(f"Index reload failed, still serving generation {current_generation.generation}: {e}")
+
+
+current_generation = None
+while current_generation is None:
+    if read_generation_marker().get("state") == "missing":
+        raise FileNotFoundError(f"No shard manifest in '{SHARD_DIR}' and no '{FAISS_INDEX_PATH}'. Run indexing.py first.")
+    current_generation = load_generation()
+    if current_generation is None:
+        print("Index is being written, waiting for a complete generation...")
+        time.sleep(1)
+
+threading.Thread(target=watch_index_generation, daemon=True, name="IndexReloader").start()
+search_pool = ThreadPoolExecutor(max_workers=SEARCH_FANOUT_WORKERS, thread_name_prefix="ShardSearch")
+feature_index = FeatureIndex(FEATURE_STORE_DIR)
+extract_features = None  # Sih_ResNet_Anomaly.extract_features, loaded by the first image query
+extractor_lock = threading.Lock()
+
+def extract_clip(video_path, start_frame, fps, duration_sec=20, output_path=None):
     """
     Extracts a ~20 second clip starting from start_frame
     """
     start_time_sec = start_frame / fps
-    temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False)
+    temp_file = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False, dir=os.path.dirname(output_path or "") or None)
     temp_filename = temp_file.name
     temp_file.close()
 
@@ -54,37 +296,225 @@ def extract_clip(video_path, start_frame, fps, duration_sec=20):
         .overwrite_output()
         .run(quiet=True)
     )
-    return temp_filename
+    if output_path is None:
+        return temp_filename
+    os.replace(temp_filename, output_path)  # Concurrent requests for the same clip each write their own file
+    return output_path
+
+
+def clip_url(metadata):
+    # Keyed by path hash: videos with the same file name in different folders are different clips
+    return f"/clip?video={quote(video_key(metadata['video_path']))}&start_frame={metadata['start_frame']}"
+
+
+def preview_fields(metadata):
+    """Result fields pointing at the segment's thumbnail and sprite sheet; None for segments indexed without them"""
+    sprite = metadata.get("sprite")
+    return {
+        "thumbnail_url": f"/previews/{metadata['thumbnail']}" if metadata.get("thumbnail") else None,
+        "sprite": {**{key: value for key, value in sprite.items() if key != "path"},
+                   "url": f"/previews/{sprite['path']}"} if sprite else None,
+    }
 
 
 @app.get("/search")
-def search(query: str = Query(..., description="Search query text")):
-    query_embedding = embedder.encode([query])
-    distances, indices = index.search(query_embedding, 10)  # top 10 candidates
+def search(
+    query: str = Query(..., description="Search query text"),
+    start: str | None = Query(None, description="Only segments ending at or after this time (ISO 8601)"),
+    end: str | None = Query(None, description="Only segments starting at or before this time (ISO 8601)"),
+    video: str | None = Query(None, description="Only segments from this video file name"),
+    camera: str | None = Query(None, description="Only segments from this camera"),
+):
+    trace_id = new_trace_id()
+    with span("search", trace_id, query=query):
+        return run_search(generation=current_generation, trace_id=trace_id, query=query,
+                          start=start, end=end, video=video, camera=camera)
 
-    results = []
-    for idx in indices[0]:
-        if idx == -1:
-            continue
-        metadata = metadata_store[idx]
-        video_path = metadata["video_path"]
 
-        # Get fps of video
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS)
-        cap.release()
+def search_shard(shard, ids, query_embedding):
+    """Top-k of one shard as (distances, indices)"""
+    if ids is None:
+        return shard.index.search(query_embedding, TOP_K)
+    # Filter inside FAISS so the top-k is taken over matching segments only
+    selector = faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+    params = faiss.SearchParameters(sel=selector)
+    return shard.index.search(query_embedding, min(TOP_K, len(ids)), params=params)
+
+
+def run_search(generation, trace_id, query, start, end, video, camera):
+    """The body of /search: the query runs on every shard the filters leave, then the top-k are merged"""
+    try:
+        start_ts = parse_datetime(start) if start is not None else -np.inf
+        end_ts = parse_datetime(end) if end is not None else np.inf
+        targets = []
+        for shard in generation.shards.values():
+            if not shard.may_match(start_ts, end_ts, camera):
+                continue
+            ids = select_ids(shard.filter_index, start, end, video, camera)
+            if ids is None or len(ids):
+                targets.append((shard, ids))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time filter: {e}")
+
+    if not targets:
+        return {"results": []}
+
+    with EMBED_SECONDS.time(), span("embed", trace_id):
+        query_embedding = embedder.encode([query])
+    with SEARCH_SECONDS.time(), span("faiss_search", trace_id, shards=len(targets)):
+        if len(targets) == 1:
+            shard_results = [search_shard(*targets[0], query_embedding)]
+        else:
+            shard_results = list(search_pool.map(lambda target: search_shard(*target, query_embedding), targets))
 
-        # Generate temporary clip
-        clip_path = extract_clip(video_path, metadata["start_frame"], fps)
-        clip_name = os.path.basename(clip_path)
-        clip_url = f"/temp/{clip_name}"  # URL served by FastAPI
+    # L2 distances are comparable across shards: the global top-k is the k nearest of the shard top-ks
+    candidates = [(distance, shard, idx)
+                  for (shard, _), (distances, indices) in zip(targets, shard_results)
+                  for distance, idx in zip(distances[0], indices[0]) if idx != -1]
+    candidates.sort(key=lambda candidate: candidate[0])
 
+    # Clips are cut when a player asks for one (/clip), so results come back right after the lookup
+    results = []
+    for _, shard, idx in candidates[:TOP_K]:
+        metadata = shard.metadata_store[idx]
         results.append({
-            "video": os.path.basename(video_path),
+            "video": os.path.basename(metadata["video_path"]),
             "absolute_start_time": metadata["absolute_start_time"],
             "absolute_end_time": metadata["absolute_end_time"],
             "document": metadata["document"],
-            "clip_path": clip_url  # return URL instead of absolute path
+            "clip_path": clip_url(metadata),
+            **preview_fields(metadata),
         })
 
     return {"results": results}
+
+
+@app.get("/clip")
+def clip(
+    video: str = Query(..., description="Key of an indexed video, as in a result's clip_path"),
+    start_frame: int = Query(..., description="Start frame of the segment"),
+):
+    """Cuts (once) and serves the clip of an indexed segment"""
+    generation = current_generation
+    metadata = next((shard.metadata_store[i] for shard in generation.shards.values()
+                     for i in shard.filter_index["by_key"].get(video, [])
+                     if shard.metadata_store[i]["start_frame"] == start_frame), None)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="No indexed segment starts at that frame of that video")
+
+    video_path = metadata["video_path"]
+    clip_path = clip_cache_path(video_path, start_frame)  # Deleted by shard retention along with the segment
+    if not os.path.exists(clip_path):
+        trace_id = new_trace_id()
+        with CLIP_SECONDS.time(), span("clip_extraction", trace_id, video=video):
+            cap = cv2.VideoCapture(video_path)
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            cap.release()
+            extract_clip(video_path, start_frame, fps, output_path=clip_path)
+    return FileResponse(clip_path, media_type="video/mp4",
+                        headers={"Cache-Control": f"public, max-age={CLIP_CACHE_SECONDS}"})
+
+
+# --- VISUAL SEARCH ---
+def image_features(image_bytes):
+    """ResNet50 features of an uploaded image, preprocessed like a pipeline frame"""
+    global extract_features
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise HTTPException(status_code=400, detail="Body is not a decodable image")
+    with extractor_lock:
+        if extract_features is None:
+            try:
+                # TensorFlow is only loaded once someone searches by image
+                from Sih_ResNet_Anomaly import extract_features
+            except (ImportError, RuntimeError) as e:
+                raise HTTPException(status_code=503, detail=f"ResNet50 feature extractor unavailable: {e}")
+    return extract_features(cv2.resize(image, (224, 224))[None])
+
+
+def run_visual_search(trace_id, camera, start, end, top_k, features=None, stored=None):
+    """
+    Nearest stored frames to raw ResNet features (projected per partition) or to a stored
+    (projection id, vector), which only matches partitions in the same projection.
+    """
+    try:
+        start_ts = parse_datetime(start) if start is not None else -np.inf
+        end_ts = parse_datetime(end) if end is not None else np.inf
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time filter: {e}")
+
+    targets = []
+    for partition in feature_index.select(camera, start_ts, end_ts):
+        if stored is not None:
+            if partition.projection == stored[0]:
+                targets.append((partition, stored[1]))
+        else:
+            targets.append((partition, feature_index.projection(partition.projection).apply(features)[0]))
+
+    with VISUAL_SEARCH_SECONDS.time(), span("visual_search", trace_id, partitions=len(targets)):
+        matches = list(search_pool.map(lambda target: target[0].search(target[1], top_k, start_ts, end_ts), targets))
+
+    candidates = [(float(similarity), partition, int(row))
+                  for (partition, _), (similarities, rows) in zip(targets, matches)
+                  for similarity, row in zip(similarities, rows)]
+    candidates.sort(key=lambda candidate: -candidate[0])
+    results = []
+    for similarity, partition, row in candidates[:top_k]:
+        record = partition.rows[row]
+        captured = datetime.fromtimestamp(float(record["timestamp"])).strftime('%Y-%m-%d %H:%M:%S')
+        results.append({
+            "camera": partition.camera,
+            "time": captured,
+            "similarity": round(similarity, 4),
+            "anomaly_score": round(float(record["score"]), 4),
+            "similar_url": f"/search/similar?camera={quote(partition.camera)}&time={quote(captured)}",
+        })
+    return {"results": results}
+
+
+@app.post("/search/image")
+async def search_image(
+    request: Request,
+    camera: str | None = Query(None, description="Only frames from this camera"),
+    start: str | None = Query(None, description="Only frames captured at or after this time (ISO 8601)"),
+    end: str | None = Query(None, description="Only frames captured at or before this time (ISO 8601)"),
+    top_k: int = Query(VISUAL_TOP_K, ge=1, le=200),
+):
+    """Frames from the live cameras that look like the image sent as the request body (JPEG/PNG)"""
+    image_bytes = await request.body()
+    trace_id = new_trace_id()
+    with span("search_image", trace_id):
+        features = await run_in_threadpool(image_features, image_bytes)
+        return await run_in_threadpool(run_visual_search, trace_id, camera, start, end, top_k, features=features)
+
+
+@app.get("/search/similar")
+def search_similar(
+    camera: str = Query(..., description="Camera of the reference frame"),
+    time: str = Query(..., description="Capture time of the reference frame (ISO 8601), e.g. an alert's time"),
+    start: str | None = Query(None, description="Only frames captured at or after this time (ISO 8601)"),
+    end: str | None = Query(None, description="Only frames captured at or before this time (ISO 8601)"),
+    other_cameras: bool = Query(True, description="Also search the other cameras"),
+    top_k: int = Query(VISUAL_TOP_K, ge=1, le=200),
+):
+    """Frames that look like the stored frame of a camera closest to a time; no model is loaded"""
+    try:
+        stored = feature_index.frame_vector(camera, parse_datetime(time))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {e}")
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"No stored frames for camera '{camera}' around {time}")
+    trace_id = new_trace_id()
+    with span("search_similar", trace_id):
+        return run_visual_search(trace_id, None if other_cameras else camera, start, end, top_k, stored=stored)
+
+
+@app.get("/status")
+def status():
+    generation = current_generation
+    return {
+        "generation": generation.generation,
+        "entries": generation.entries,
+        "shards": len(generation.shards),
+        "loaded_at": generation.loaded_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
@@ -0,0 +1,125 @@
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# --- TRACING CONFIGURATION ---
+# Off unless PIPELINE_TRACE=1 or enabled through the /trace endpoints
+TRACE_ENABLED = os.getenv("PIPELINE_TRACE", "0") == "1"
+TRACE_SAMPLE_RATE = float(os.getenv("PIPELINE_TRACE_SAMPLE", "1.0"))  # Fraction of batches/requests traced
+TRACE_MAX_EVENTS = int(os.getenv("PIPELINE_TRACE_MAX_EVENTS", "100000"))  # Oldest events are dropped first
+
+_state = {"enabled": TRACE_ENABLED, "sample_rate": TRACE_SAMPLE_RATE}
+_events = deque(maxlen=TRACE_MAX_EVENTS)
+_thread_names = {}
+_trace_ids = itertools.count(1)
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    def __init__(self, name, trace_id, args):
+        self.name = name
+        self.trace_id = trace_id
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.trace_id, self.start, time.time(), **self.args)
+
+
+def enable(sample_rate=None):
+    if sample_rate is not None:
+        _state["sample_rate"] = max(0.0, min(1.0, sample_rate))
+    _state["enabled"] = True
+
+
+def disable():
+    _state["enabled"] = False
+
+
+def is_enabled():
+    return _state["enabled"]
+
+
+def new_trace_id():
+    """
+    Starts a trace for one batch or request. Returns None when tracing is off or the
+    trace isn't sampled; spans given a None trace id record nothing.
+    """
+    if not _state["enabled"] or random.random() >= _state["sample_rate"]:
+        return None
+    return next(_trace_ids)
+
+
+def span(name, trace_id, **args):
+    """Context manager timing its block as a span of the given trace"""
+    if trace_id is None:
+        return _NOOP_SPAN
+    return _Span(name, trace_id, args)
+
+
+def record(name, trace_id, start, end, **args):
+    """Records a span from epoch-second timestamps, e.g. a wait that began in another thread"""
+    if trace_id is None:
+        return
+    thread = threading.current_thread()
+    _thread_names.setdefault(thread.ident, thread.name)
+    _events.append({
+        "name": name,
+        "ph": "X",
+        "ts": start * 1e6,
+        "dur": max(0.0, end - start) * 1e6,
+        "pid": os.getpid(),
+        "tid": thread.ident,
+        "args": {"batch_id": trace_id, **args},
+    })
+
+
+def export_chrome_trace(path=None, clear=False):
+    """Recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto); optionally written to path"""
+    events = list(_events)
+    if clear:
+        _events.clear()
+    pid = os.getpid()
+    metadata = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in list(_thread_names.items())
+    ]
+    trace = {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+    if path:
+        with open(path, "w") as f:
+            json.dump(trace, f)
+    return trace
+
+
+def add_trace_routes(app):
+    """Exposes runtime toggles and the Chrome trace export on a FastAPI app"""
+    @app.post("/trace/enable")
+    def trace_enable(sample_rate: float | None = None):
+        enable(sample_rate)
+        return {"enabled": True, "sample_rate": _state["sample_rate"]}
+
+    @app.post("/trace/disable")
+    def trace_disable():
+        disable()
+        return {"enabled": False, "events": len(_events)}
+
+    @app.get("/trace")
+    def trace_export(clear: bool = False):
+        return export_chrome_trace(clear=clear)